@@ -0,0 +1,61 @@
+import logging
+import path
+import sys
+import traceback
+
+# directory reach
+directory = path.Path(__file__).abspath()
+# setting path
+sys.path.append(directory.parent.parent)
+
+from bot.utils.db_utils import DBUtil
+from bot.utils.analytics_utils import rebuild_user_stats, verify_user_stats
+from bot.config.logging_config import log_handler, console_handler, DEFAULT_LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(DEFAULT_LOG_LEVEL)
+logger.addHandler(log_handler)
+logger.addHandler(console_handler)
+
+
+def rebuild_analytics():
+    """
+    Verifies the analytics of users (which are updated incrementally when history is saved) against
+    the ones recomputed from the whole history, and rebuilds them if they differ.
+    """
+    db = DBUtil()
+    db.connect_db()
+    session = db.session_history
+
+    mismatches = verify_user_stats(session)
+    if not mismatches:
+        logger.info("The analytics are consistent with history.")
+        return
+    for user_id, stored, expected in mismatches:
+        logger.warning("Analytics mismatch: user_id=%s, stored=%s, expected=%s", user_id, stored, expected)
+
+    answer = input(
+        f"""
+The analytics of {len(mismatches)} users differ from history. Do you want to rebuild them?
+
+- Make sure the bot is shutdown to avoid concurrency errors.
+
+Type 'REBUILD' to proceed.
+        """
+    )
+
+    if answer == "REBUILD":
+        rebuild_user_stats(session)
+        session.commit()
+        logger.info("Successfully rebuilt the analytics, mismatches left: %d.", len(verify_user_stats(session)))
+    else:
+        logger.info("Rebuilding was cancelled.")
+
+
+if __name__ == "__main__":
+    try:
+        rebuild_analytics()
+    except Exception as e:
+        logger.error("Script crashed: %s", e, exc_info=True)
+        traceback.print_exc()
+        sys.exit(1)
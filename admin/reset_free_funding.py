@@ -1,6 +1,8 @@
 import logging
 import path
 import sys
+import traceback
+from datetime import datetime
 
 # directory reach
 directory = path.Path(__file__).abspath()
@@ -10,7 +12,7 @@ sys.path.append(directory.parent.parent)
 from bot.utils.db_utils import DBUtil
 from bot.config.const import FREE_FUNDING_LIMIT_PERSON_PER_SEASON
 from bot.config.logging_config import log_handler, console_handler, DEFAULT_LOG_LEVEL
-from bot.config.schemas import FreeFundingBalance
+from bot.config.schemas import FreeFundingBalance, Seasons
 
 logger = logging.getLogger(__name__)
 logger.setLevel(DEFAULT_LOG_LEVEL)
@@ -40,6 +42,10 @@ Type 'RESET' to proceed.
             balance.balance = FREE_FUNDING_LIMIT_PERSON_PER_SEASON
         db.session.commit()
 
+        # Start a new season, so that its analytics can be exported (see !export season)
+        db.session_history.add(Seasons(started_at=datetime.utcnow()))
+        db.session_history.commit()
+
         logger.info(
             "Successfully reset balances of %d users to %d.",
             balances.count(),
@@ -19,6 +19,15 @@ if [ "$CONSENSUS_BACKUP_ENABLED" -eq 0 ]; then
 fi
 
 echo "$CURRENT_DATETIME Copying runtime DB..." | tee -a "$LOG_BACKUP_RUNTIME_FILE_PATH"
+# The database uses WAL journal mode, so the .db file alone may miss the latest commits (they're
+# kept in the -wal file while the bot is running). A consistent snapshot is made with the online
+# backup API of SQLite instead, without stopping the bot.
+BACKUP_FILE="$(mktemp --suffix=.db)"
+trap 'rm -f "$BACKUP_FILE"' EXIT
+if ! sqlite3 $CONSENSUS_PROJECT_ROOT/$RUNTIME_DB ".backup '$BACKUP_FILE'" >> "$LOG_BACKUP_RUNTIME_FILE_PATH" 2>&1; then
+  echo "$CURRENT_DATETIME Unable to make a snapshot of runtime DB, exiting." | tee -a "$LOG_BACKUP_RUNTIME_FILE_PATH"
+  exit 1
+fi
 # Backup the runtime database to Google Cloud Storage
-gsutil cp $CONSENSUS_PROJECT_ROOT/$RUNTIME_DB gs://$BUCKET/$RUNTIME_DB 2>&1 | tee -a "$LOG_BACKUP_RUNTIME_FILE_PATH"
+gsutil cp "$BACKUP_FILE" gs://$BUCKET/$RUNTIME_DB 2>&1 | tee -a "$LOG_BACKUP_RUNTIME_FILE_PATH"
 
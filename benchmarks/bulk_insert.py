@@ -0,0 +1,70 @@
+"""
+Compares inserting many voters (e.g. copies of voters archived to history) with DBUtil.add_all, which
+goes through the ORM unit of work, and with DBUtil.bulk_insert, which uses Core executemany.
+
+Usage: python benchmarks/bulk_insert.py [rows] [repeats]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from bot.config.const import Vote
+from bot.config.schemas import Base, Voters
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
+from bot.utils.dev_utils import TimingStats
+
+
+def create_rows(count):
+    return [
+        {"user_id": user_id, "voting_message_id": 1, "value": Vote.NO.value, "proposal_id": 1}
+        for user_id in range(count)
+    ]
+
+
+async def insert_with_add_all(db, rows):
+    await db.add_all([Voters(**row) for row in rows])
+
+
+async def insert_with_bulk_insert(db, rows):
+    await db.bulk_insert(Voters, rows)
+
+
+async def insert_with_bulk_insert_returning_ids(db, rows):
+    await db.bulk_insert(Voters, rows, return_ids=True)
+
+
+async def main(count, repeats):
+    print(f"Inserting {count} voters, {repeats} times")
+    db = DBUtil()
+    for name, insert in (
+        ("add_all", insert_with_add_all),
+        ("bulk_insert", insert_with_bulk_insert),
+        ("bulk_insert(return_ids=True)", insert_with_bulk_insert_returning_ids),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            DBUtil.engine = create_sqlite_engine(f"{directory}/bench.db")
+            Base.metadata.create_all(DBUtil.engine)
+            DBUtil.session = sessionmaker(bind=DBUtil.engine, expire_on_commit=False)()
+            stats = TimingStats(name)
+            for _ in range(repeats):
+                rows = create_rows(count)
+                started_at = time.perf_counter()
+                await insert(db, rows)
+                stats.add(time.perf_counter() - started_at)
+            DBUtil.session.close()
+            DBUtil.engine.dispose()
+        print(f"  {stats}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count = args[0] if len(args) > 0 else 1000
+    repeats = args[1] if len(args) > 1 else 10
+    asyncio.run(main(count, repeats))
@@ -0,0 +1,84 @@
+"""
+Measures the lag of the event loop during a burst of votes saved to a SQLite file, when commits run
+on the event loop and when they run in the DB thread (DBUtil). The lag is the delay of a ticker
+coroutine that sleeps for 1 ms in a loop; while a commit blocks the event loop, the ticker (as well as
+Discord heartbeats and other handlers) can't run.
+
+Usage: python benchmarks/db_event_loop_lag.py [votes]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bot.config.const import Vote
+from bot.config.schemas import Base, Voters
+from bot.utils.db_utils import DBUtil
+from bot.utils.dev_utils import TimingStats
+
+TICK_SECONDS = 0.001
+
+
+async def measure_lag(stats, stop):
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        stats.add(time.perf_counter() - started_at - TICK_SECONDS)
+
+
+async def add_on_event_loop(db, voter):
+    async with DBUtil.session_lock:
+        DBUtil.session.add(voter)
+        DBUtil.session.commit()
+
+
+async def add_in_db_thread(db, voter):
+    await db.add(voter)
+
+
+async def run(add, votes):
+    db = DBUtil()
+    lag_stats = TimingStats("Event loop lag")
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(lag_stats, stop))
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *[
+            add(db, Voters(user_id=user_id, voting_message_id=1, value=Vote.NO.value))
+            for user_id in range(votes)
+        ]
+    )
+    duration = time.perf_counter() - started_at
+    stop.set()
+    await ticker
+    return duration, lag_stats
+
+
+async def main(votes):
+    print(f"Burst of {votes} votes, each committed separately")
+    for name, add in (
+        ("Commits on the event loop", add_on_event_loop),
+        ("Commits in the DB thread", add_in_db_thread),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            DBUtil.engine = create_engine(
+                f"sqlite:///{directory}/bench.db", connect_args={"check_same_thread": False}
+            )
+            Base.metadata.create_all(DBUtil.engine)
+            DBUtil.session = sessionmaker(bind=DBUtil.engine, expire_on_commit=False)()
+            duration, lag_stats = await run(add, votes)
+            DBUtil.session.close()
+            DBUtil.engine.dispose()
+        print(f"{name}: {duration:.3f}s total\n  {lag_stats}")
+
+
+if __name__ == "__main__":
+    votes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    asyncio.run(main(votes))
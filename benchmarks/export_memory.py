@@ -0,0 +1,141 @@
+"""
+Measures the time and the peak memory (traced Python allocations) of building the whole export
+document (export_xlsx) on synthetic history DBs of growing sizes.
+
+Usage: python benchmarks/export_memory.py [records] [users]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from bot.config.const import ProposalResult
+from bot.config.schemas import (
+    Base,
+    Proposals,
+    ProposalHistory,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    FreeFundingTransaction,
+    FreeFundingRecipients,
+)
+from bot.export import export_xlsx
+from bot.utils.analytics_utils import rebuild_user_stats
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
+
+
+def create_history(engine, records, users):
+    """
+    Fills the DB with the given number of accepted financial proposals, each granting to two groups
+    of recipients, and the same number of free funding transactions to two recipients.
+    """
+    random.seed(0)
+    started_at = datetime(2023, 1, 1)
+    ids = range(1, records + 1)
+    with engine.begin() as connection:
+        connection.execute(
+            Proposals.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "author_id": random.randrange(users),
+                    "voting_message_id": id,
+                    "description": "Synthetic proposal " * 5,
+                    "submitted_at": started_at + timedelta(hours=id),
+                    "closed_at": started_at + timedelta(hours=id + 72),
+                    "not_financial": False,
+                    "total_amount": 30,
+                }
+                for id in ids
+            ],
+        )
+        connection.execute(
+            ProposalHistory.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "result": ProposalResult.ACCEPTED.value,
+                    "voting_message_url": f"https://discord.com/channels/1/2/{id}",
+                    "author_nickname": "author",
+                }
+                for id in ids
+            ],
+        )
+        connection.execute(
+            FinanceRecipients.__table__.insert(),
+            [{"id": id, "proposal_id": (id + 1) // 2, "amount": 10} for id in range(1, 2 * records + 1)],
+        )
+        connection.execute(
+            FinanceRecipientUsers.__table__.insert(),
+            [
+                {"finance_recipient_id": id, "user_id": user_id, "user_nickname": f"user{user_id}"}
+                for id in range(1, 2 * records + 1)
+                for user_id in random.sample(range(users), 2)
+            ],
+        )
+        connection.execute(
+            FreeFundingTransaction.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "author_id": random.randrange(users),
+                    "author_nickname": "author",
+                    "total_amount": 2,
+                    "description": "Synthetic transaction " * 5,
+                    "submitted_at": started_at + timedelta(hours=id),
+                    "message_url": f"https://discord.com/channels/1/3/{id}",
+                }
+                for id in ids
+            ],
+        )
+        connection.execute(
+            FreeFundingRecipients.__table__.insert(),
+            [
+                {"transaction_id": id, "user_id": user_id, "user_nickname": f"user{user_id}", "amount": 1}
+                for id in ids
+                for user_id in random.sample(range(users), 2)
+            ],
+        )
+
+
+async def measure(records, users):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_sqlite_engine(f"{directory}/bench.db")
+        Base.metadata.create_all(engine)
+        create_history(engine, records, users)
+        # The history is inserted directly, so the analytics are computed from it
+        with engine.begin() as connection:
+            rebuild_user_stats(connection)
+        # Both DBs are the same file, as the balances are stored in the main DB
+        DBUtil.engine = DBUtil.engine_history = engine
+        DBUtil.session = DBUtil.session_history = sessionmaker(bind=engine)()
+
+        tracemalloc.start()
+        started_at = time.perf_counter()
+        document, _ = await export_xlsx()
+        duration = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        DBUtil.session.close()
+        engine.dispose()
+    print(
+        f"{records} proposals and transactions, {users} users: export_xlsx took {duration:.3f}s, "
+        f"peak memory {peak / 2**20:.1f} MiB, document {len(document.getvalue()) / 2**20:.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    for multiplier in (1, 4):
+        asyncio.run(measure(records * multiplier, users))
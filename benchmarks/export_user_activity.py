@@ -0,0 +1,118 @@
+"""
+Measures the time and the number of DB queries of building the "L3 Activity" page of the export
+(write_user_activity) on a synthetic history DB.
+
+Usage: python benchmarks/export_user_activity.py [proposals] [votes] [users]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openpyxl
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from bot.config.const import ProposalResult, Vote
+from bot.config.schemas import Base, Proposals, ProposalHistory, Voters, FreeFundingBalance
+from bot.export import write_user_activity
+from bot.utils.analytics_utils import rebuild_user_stats
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
+
+
+def create_history(engine, proposals, votes, users):
+    """
+    Fills the DB with the given number of proposals in history, votes and users (everyone has a
+    balance, and authors and voters are picked at random).
+    """
+    random.seed(0)
+    started_at = datetime(2023, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(
+            Proposals.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "author_id": random.randrange(users),
+                    "voting_message_id": id,
+                    "description": "Synthetic proposal",
+                    "submitted_at": started_at + timedelta(hours=id),
+                    "closed_at": started_at + timedelta(hours=id + 72),
+                    "not_financial": True,
+                }
+                for id in range(1, proposals + 1)
+            ],
+        )
+        connection.execute(
+            ProposalHistory.__table__.insert(),
+            [
+                {
+                    "id": id,
+                    "result": random.choice(list(ProposalResult)).value,
+                    "voting_message_url": "url",
+                    "author_nickname": "author",
+                }
+                for id in range(1, proposals + 1)
+            ],
+        )
+        connection.execute(
+            Voters.__table__.insert(),
+            [
+                {
+                    "proposal_id": random.randrange(1, proposals + 1),
+                    "user_id": random.randrange(users),
+                    "user_nickname": "voter",
+                    "value": Vote.NO.value,
+                }
+                for _ in range(votes)
+            ],
+        )
+        connection.execute(
+            FreeFundingBalance.__table__.insert(),
+            [
+                {"author_id": user_id, "author_nickname": f"user{user_id}", "balance": 100}
+                for user_id in range(users)
+            ],
+        )
+
+
+async def main(proposals, votes, users):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_sqlite_engine(f"{directory}/bench.db")
+        Base.metadata.create_all(engine)
+        create_history(engine, proposals, votes, users)
+        # The history is inserted directly, so the analytics are computed from it
+        with engine.begin() as connection:
+            rebuild_user_stats(connection)
+        # Both DBs are the same file, as the balances are stored in the main DB
+        DBUtil.engine = DBUtil.engine_history = engine
+        DBUtil.session = DBUtil.session_history = sessionmaker(bind=engine)()
+        queries = 0
+
+        def count_query(*args):
+            nonlocal queries
+            queries += 1
+
+        event.listen(engine, "before_cursor_execute", count_query)
+        started_at = time.perf_counter()
+        await write_user_activity(openpyxl.Workbook().active)
+        duration = time.perf_counter() - started_at
+        DBUtil.session.close()
+        engine.dispose()
+    print(
+        f"{proposals} proposals, {votes} votes, {users} users: "
+        f"write_user_activity took {duration:.3f}s, {queries} queries"
+    )
+
+
+if __name__ == "__main__":
+    proposals = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    votes = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    users = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    asyncio.run(main(proposals, votes, users))
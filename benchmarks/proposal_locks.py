@@ -0,0 +1,75 @@
+"""
+Compares lock contention of voting under a synthetic load, when all votes share a single global lock
+(the way proposals were locked before) and when each proposal has its own lock (lock_proposal). Each vote holds the lock while
+waiting for a simulated Discord HTTP call.
+
+Usage: python benchmarks/proposal_locks.py [proposals] [voters_per_proposal] [latency_ms]
+"""
+import asyncio
+import os
+import sys
+import time
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.utils.proposal_utils import (
+    lock_proposal,
+    lock_wait_stats,
+    lock_hold_stats,
+)
+from bot.utils.dev_utils import TimingStats
+
+
+# The single lock shared by all votes
+global_lock = asyncio.Lock()
+
+
+async def vote_with_global_lock(voting_message_id, latency, wait_stats):
+    started_at = time.perf_counter()
+    async with global_lock:
+        wait_stats.add(time.perf_counter() - started_at)
+        await asyncio.sleep(latency)
+
+
+async def vote_with_proposal_lock(voting_message_id, latency, wait_stats):
+    async with lock_proposal(voting_message_id):
+        await asyncio.sleep(latency)
+
+
+async def run(vote, proposals, voters_per_proposal, latency, wait_stats):
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *[
+            vote(voting_message_id, latency, wait_stats)
+            for voting_message_id in range(proposals)
+            for _ in range(voters_per_proposal)
+        ]
+    )
+    return time.perf_counter() - started_at
+
+
+async def main(proposals, voters_per_proposal, latency):
+    print(
+        f"{proposals} proposals, {voters_per_proposal} concurrent voters each, "
+        f"{latency * 1000:.0f} ms per Discord call under the lock"
+    )
+
+    global_wait_stats = TimingStats("Global lock wait")
+    duration = await run(
+        vote_with_global_lock, proposals, voters_per_proposal, latency, global_wait_stats
+    )
+    print(f"Global lock: {duration:.3f}s total\n  {global_wait_stats}")
+
+    lock_wait_stats.reset()
+    lock_hold_stats.reset()
+    duration = await run(vote_with_proposal_lock, proposals, voters_per_proposal, latency, None)
+    print(f"Per-proposal locks: {duration:.3f}s total\n  {lock_wait_stats}\n  {lock_hold_stats}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    proposals = args[0] if len(args) > 0 else 20
+    voters_per_proposal = args[1] if len(args) > 1 else 10
+    latency = (args[2] if len(args) > 2 else 50) / 1000
+    asyncio.run(main(proposals, voters_per_proposal, latency))
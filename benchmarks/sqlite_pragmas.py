@@ -0,0 +1,78 @@
+"""
+Compares the commit latency of a vote (adding a voter to a proposal) with SQLite defaults (rollback
+journal, synchronous=FULL) and with SQLITE_PRAGMAS applied. Besides the whole transaction (which
+includes the hop to the DB thread and the ORM flush), the time of the COMMIT statement itself is
+measured, since that's what the pragmas affect.
+
+Usage: python benchmarks/sqlite_pragmas.py [votes]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# setting path to the project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+from bot.config.const import Vote, SQLITE_PRAGMAS
+from bot.config.schemas import Base, Proposals, Voters
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
+from bot.utils.dev_utils import TimingStats
+
+
+async def run(votes, pragmas):
+    db = DBUtil()
+    with tempfile.TemporaryDirectory() as directory:
+        DBUtil.engine = create_sqlite_engine(f"{directory}/bench.db", pragmas)
+        Base.metadata.create_all(DBUtil.engine)
+        DBUtil.session = sessionmaker(bind=DBUtil.engine, expire_on_commit=False)()
+
+        proposal = Proposals(
+            message_id=1,
+            channel_id=1,
+            author_id=1,
+            voting_message_id=1,
+            description="Benchmark",
+            submitted_at=datetime.utcnow(),
+            closed_at=datetime.utcnow() + timedelta(days=1),
+            not_financial=True,
+        )
+        await db.add(proposal)
+
+        transaction_stats = TimingStats("Transaction of a vote")
+        commit_stats = TimingStats("COMMIT statement")
+
+        def save_vote(voter):
+            proposal.voters.append(voter)
+            DBUtil.session.flush()
+            # Only the COMMIT statement is left, since the changes are flushed
+            started_at = time.perf_counter()
+            DBUtil.session.commit()
+            commit_stats.add(time.perf_counter() - started_at)
+
+        for user_id in range(votes):
+            voter = Voters(user_id=user_id, voting_message_id=1, value=Vote.NO.value)
+            started_at = time.perf_counter()
+            async with DBUtil.session_lock:
+                await db.run_in_db_thread(save_vote, voter)
+            transaction_stats.add(time.perf_counter() - started_at)
+
+        DBUtil.session.close()
+        DBUtil.engine.dispose()
+    return transaction_stats, commit_stats
+
+
+async def main(votes):
+    print(f"{votes} votes, each committed separately")
+    for name, pragmas in (("SQLite defaults", {}), (f"SQLITE_PRAGMAS {SQLITE_PRAGMAS}", SQLITE_PRAGMAS)):
+        transaction_stats, commit_stats = await run(votes, pragmas)
+        print(f"{name}:\n  {transaction_stats}\n  {commit_stats}")
+
+
+if __name__ == "__main__":
+    votes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    asyncio.run(main(votes))
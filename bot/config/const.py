@@ -28,8 +28,38 @@ VOTERS_TABLE_NAME = "voters"
 PROPOSAL_HISTORY_TABLE_NAME = "proposal_history"
 FREE_FUNDING_BALANCES_TABLE_NAME = "free_funding_balance"
 FREE_FUNDING_TRANSACTIONS_TABLE_NAME = "free_funding_transaction_history"
+FINANCE_RECIPIENT_USERS_TABLE_NAME = "finance_recipient_users"
+FREE_FUNDING_RECIPIENTS_TABLE_NAME = "free_funding_transaction_recipients"
+ANALYTICS_USER_STATS_TABLE_NAME = "analytics_user_stats"
+SEASONS_TABLE_NAME = "seasons"
 # In SQLite, there are no array columns, thus arrays are stored as a string separated by this variable
 DB_ARRAY_COLUMN_SEPARATOR = ";;"
+# Pragmas applied to every connection of both databases. WAL journal with synchronous=NORMAL only
+# syncs the disk on checkpoints, which makes commits much faster; a commit may be lost on power loss
+# (but not on a crash of the bot), and the database is never corrupted. Set to {} to use SQLite
+# defaults.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Size of the memory-mapped I/O in bytes
+    "mmap_size": 64 * 1024 * 1024,
+    # Negative value is the size of the page cache in KiB
+    "cache_size": -16 * 1024,
+    # Milliseconds to wait for a lock held by another connection (e.g. the analytics tools)
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+# Keep DB connections open between transactions (by default SQLAlchemy opens a new SQLite connection
+# for every transaction, which repeats the pragmas, and checkpoints the WAL when the last one closes)
+SQLITE_KEEP_CONNECTIONS_OPEN = True
+# Write-behind mode for votes: instead of committing every vote, the changes are kept in the session
+# (the in-memory state of proposals is authoritative) and committed in groups, every
+# DB_GROUP_COMMIT_INTERVAL_MS or once DB_GROUP_COMMIT_MAX_OPERATIONS votes are pending. Pending votes
+# are committed before a proposal is accepted or cancelled, and on shutdown; they may be lost if the
+# bot crashes (recovery will then restore them from the voting reactions).
+DB_WRITE_BEHIND_ENABLED = False
+DB_GROUP_COMMIT_INTERVAL_MS = 200
+DB_GROUP_COMMIT_MAX_OPERATIONS = 50
 
 # nltk datasets to download
 NLTK_DATASETS_DIR = f"{PROJECT_ROOT}/nltk"
@@ -88,14 +118,42 @@ ECO_GUILD_ID = 768556386404794448
 # Invite link with required permissions
 # https://discord.com/api/oauth2/authorize?client_id=1061680925425012756&permissions=277025467456&scope=bot
 
-# Time interval (sec) between checking if the proposal has come to a close; recommended to keep under 10
-# seconds so not to create delays for end users, but over 5 seconds so not to create a high CPU load
-APPROVAL_SLEEP_SECONDS = 5
 # Time interval between starting the bot and running the recovery; it's needed in order to make sure
 #  the client methods will become available (otherwise methods such as client.get_channel may fail).
 #  Recommended value based on observations - 5-10 sec. During this time (as well as while recovery runs),
 #  the bot will reject all proposals and votes for the sake of data integrity.
 SLEEP_BEFORE_RECOVERY_SECONDS = 7
+# Maximal number of proposals that are recovered concurrently (each one requires several requests to
+# Discord API, which is rate limited)
+RECOVERY_CONCURRENCY = 5
+# How often (in number of reactions) to log the statistics of reactions filtered out when voting
+REACTION_FILTER_STATS_LOG_INTERVAL = 1000
+# How often (in number of acquisitions) to log the time spent waiting for and holding proposal locks
+PROPOSAL_LOCK_STATS_LOG_INTERVAL = 1000
+# Discord side effects of voting (DMs, reaction removal, message edits) are sent by pools of background
+# workers, so that they're not awaited while a proposal is locked. The queue of each kind of action is
+# bounded; when it's full, new actions are logged and dropped (so that a proposal lock is never held
+# waiting for a free slot).
+OUTBOUND_QUEUE_MAX_SIZE = 1000
+# How long to wait for the queued actions to be sent when the bot shuts down
+OUTBOUND_QUEUE_DRAIN_TIMEOUT_SECONDS = 30
+# Number of workers (i.e. actions sent concurrently) of each kind of action (route). Every route has its
+# own queue, so that e.g. a burst of DMs doesn't delay the removal of reactions
+OUTBOUND_ROUTE_CONCURRENCY = {"dm": 2, "reaction": 2, "message": 2}
+# Failed actions are retried after OUTBOUND_RETRY_BACKOFF_SECONDS, doubling the delay for every attempt
+OUTBOUND_MAX_RETRIES = 3
+OUTBOUND_RETRY_BACKOFF_SECONDS = 1
+# Users that aren't found in the member cache of the server are fetched from Discord and kept in an LRU
+# cache for USER_CACHE_TTL_SECONDS (so that changed nicknames are eventually updated)
+USER_CACHE_MAX_SIZE = 1000
+USER_CACHE_TTL_SECONDS = 60 * 60
+# How often (in number of lookups) to log the hit/miss statistics of the user cache
+USER_CACHE_STATS_LOG_INTERVAL = 1000
+# Messages of active proposals (voting, original and bot response messages) are kept in an LRU cache
+# after they're fetched, and invalidated when they're edited or deleted. Set MESSAGE_CACHE_ENABLED to
+# False to always fetch messages from Discord (e.g. to audit the correctness of the cache).
+MESSAGE_CACHE_ENABLED = True
+MESSAGE_CACHE_MAX_SIZE = 500
 
 # The bot is using the prefix command syntax instead of interactions, for the reasons of compatibility with existing Eco Discord Accountant bot that has used the prefix "!" for all commands since 2 years. Unfortunately, the interactions module which is mainstreamed by Discord doesn't support the custom prefix for commands, thereby we stick to old good discord.ext.commands (which unfortunately doesn't have tooltips support).
 DISCORD_COMMAND_PREFIX = "!"
@@ -155,6 +213,14 @@ EMPTY_ANALYTICS_VALUE = "n/a"
 THRESHOLD_DISABLED_DB_VALUE = -1
 # The name of the file sent to user with !export command
 EXPORT_DATA_FILENAME = "analytics.xlsx"
+# The name of the file when a period is exported (e.g. "!export season" or "!export 2023-01-01")
+EXPORT_PERIOD_DATA_FILENAME = "analytics_{since}_{until}.xlsx"
+# The format of the dates given to !export
+EXPORT_DATE_FORMAT = "%Y-%m-%d"
+# How often each user can run !export (the document is built in a separate process, see export.py)
+EXPORT_COOLDOWN_SECONDS = 60
+# The number of rows loaded from DB at once when exporting data
+EXPORT_QUERY_BATCH_SIZE = 1000
 
 
 # =============
@@ -362,7 +428,7 @@ So, don't be shy and get those creative juices flowing! Let's make Eco the best
 
 For power users:
 - Some shortcuts of `!propose` are: {", ".join(PROPOSAL_COMMAND_ALIASES)}.
-- Run `!export` to receive analytics.
+- Run `!export` to receive analytics (or `!export season`, `!export 2023-01-01 2023-03-31` for a period).
 
 For questions, ideas or partnership, reach out to {RESPONSIBLE_MENTION}. The project is looking for contributors and teammates: {GITHUB_PROJECT_URL}
 """
@@ -376,6 +442,9 @@ If you change your mind after talking to the author, remember to remove {cancel_
 """
 HELP_MESSAGE_REMOVED_FROM_VOTING_CHANNEL = "Hi there! Your message was removed from `#l3-voting`, because it was decided to leave the channel opened only for messages by bots (for example, EasyPoll can write there too, but not humans). This is to maintain the channel cleaner, so others can simply see all active votings. Please use `#l3-general` or other channels to post your message. The decision was made here: https://discord.com/channels/768556386404794448/1060864279303172136/1077580065648427060"
 EXPORT_CHANNEL_REPLY = "Here you go! You'll find five tabs in the document - Summary, L3 Activity, Grant Receivers, Proposals and Tips Transactions."
+EXPORT_COOLDOWN_REPLY = "The data was exported recently, please try again in {seconds} seconds."
+EXPORT_INVALID_PERIOD_REPLY = "To export a period, use `!export season`, `!export season 2` (the number of a season), `!export 2023-01-01` (since the date) or `!export 2023-01-01 2023-03-31` (both dates are included)."
+EXPORT_SEASON_NOT_FOUND_REPLY = "The season was not found. A new season starts when the tips of all users are reset."
 
 # Free funding messages
 FREE_FUNDING_BALANCE_MESSAGE = "You have {balance} 'tips' remaining this season. Use the '!tips' command just like you would use '!send'."
@@ -21,6 +21,10 @@ from bot.config.const import (
     FREE_FUNDING_BALANCES_TABLE_NAME,
     Vote,
     FINANCE_RECIPIENTS_TABLE_NAME,
+    FINANCE_RECIPIENT_USERS_TABLE_NAME,
+    FREE_FUNDING_RECIPIENTS_TABLE_NAME,
+    ANALYTICS_USER_STATS_TABLE_NAME,
+    SEASONS_TABLE_NAME,
 )
 
 Base = declarative_base()
@@ -39,16 +43,16 @@ class Proposals(Base):
     message_id = Column(Integer)
     # The id of the initial channel where the proposal was submitted
     channel_id = Column(Integer)
-    # The id of the author of the proposal
-    author_id = Column(Integer)
+    # The id of the author of the proposal (indexed for export and analytics queries)
+    author_id = Column(Integer, index=True)
     # The id of the voting message in the channel VOTING_CHANNEL_ID
     voting_message_id = Column(Integer)
     # The text description of the proposal (validated to fit between MIN_DESCRIPTION_LENGTH and MAX_DESCRIPTION_LENGTH)
     description = Column(String)
     # Date and time when the proposal was submitted
     submitted_at = Column(DateTime)
-    # Date and time when the proposal should be closed
-    closed_at = Column(DateTime)
+    # Date and time when the proposal should be closed (indexed to export the history of a period)
+    closed_at = Column(DateTime, index=True)
     # This is only needed for some error handling, though very helpful for onboarding new users
     bot_response_message_id = Column(Integer)
 
@@ -124,30 +128,65 @@ class ProposalHistory(Proposals):
 class FinanceRecipients(Base):
     """
     This class represents the finance recipients associated with a proposal. Each instance
-    stores the recipient IDs and the corresponding amount they are to receive.
+    stores a group of recipients (see FinanceRecipientUsers) and the amount each of them is to
+    receive.
     """
 
     __tablename__ = FINANCE_RECIPIENTS_TABLE_NAME
 
     # Primary key
     id = Column(Integer, primary_key=True)
-    # Foreign key - the proposal ID associated with the grant recipients
-    proposal_id = Column(Integer, ForeignKey('proposals.id'))
-    # The ids of the recipients
-    recipient_ids = Column(String, nullable=False)
-    # Comma-separated list of user nicknames to whom funds were sent
-    recipient_nicknames = Column(String)
+    # Foreign key - the proposal ID associated with the grant recipients (indexed to load the recipients of a proposal)
+    proposal_id = Column(Integer, ForeignKey('proposals.id'), index=True)
     # The amount to receive
     amount = Column(
         Float, CheckConstraint('amount > -1000000000 AND amount < 1000000000'), nullable=False
     )
 
     proposal = relationship("Proposals", back_populates="finance_recipients")
+    # The recipients are always needed along with the group, so they're loaded at once
+    recipients = relationship(
+        "FinanceRecipientUsers",
+        back_populates="finance_recipient",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+
+    @property
+    def recipient_ids(self):
+        return [recipient.user_id for recipient in self.recipients]
+
+    @property
+    def recipient_nicknames(self):
+        return [recipient.user_nickname for recipient in self.recipients]
 
     def __repr__(self):
         return f"FinanceRecipients(id={self.id}, proposal_id={self.proposal_id},  recipient_ids={self.recipient_ids}, recipient_nicknames={self.recipient_nicknames}, amount={self.amount})"
 
 
+class FinanceRecipientUsers(Base):
+    """
+    A recipient of a grant: a user from a group of finance recipients, who receives the amount of
+    the group.
+    """
+
+    __tablename__ = FINANCE_RECIPIENT_USERS_TABLE_NAME
+
+    # Primary key
+    id = Column(Integer, primary_key=True)
+    # Foreign key - the group of recipients
+    finance_recipient_id = Column(Integer, ForeignKey('finance_recipients.id'), index=True)
+    # The id of the recipient (indexed to aggregate grants by user)
+    user_id = Column(Integer, nullable=False, index=True)
+    # The nickname of the recipient (used for analytics)
+    user_nickname = Column(String)
+
+    finance_recipient = relationship("FinanceRecipients", back_populates="recipients")
+
+    def __repr__(self):
+        return f"<FinanceRecipientUsers(id={self.id}, finance_recipient_id={self.finance_recipient_id}, user_id={self.user_id}, user_nickname={self.user_nickname})>"
+
+
 class Voters(Base):
     """
     The Voters class represents a voter in a grant proposal. It is used to store user_id and proposal_id in the 'voters' table in the database. The proposal_id is a foreign key referencing the 'proposals' table, and is used to establish a relationship between a voter and the grant proposal they voted against. This relationship is defined using SQLAlchemy's relationship feature, and allows for easy retrieval of all voters for a specific grant proposal.
@@ -156,10 +195,10 @@ class Voters(Base):
     __tablename__ = VOTERS_TABLE_NAME
     # Primary key
     id = Column(Integer, primary_key=True)
-    # Foreign key - the proposal ID associated with the voters
-    proposal_id = Column(Integer, ForeignKey("proposals.id"))
-    # User ID of the voter
-    user_id = Column(Integer)
+    # Foreign key - the proposal ID associated with the voters (indexed to count the votes of a period)
+    proposal_id = Column(Integer, ForeignKey("proposals.id"), index=True)
+    # User ID of the voter (indexed for export and analytics queries)
+    user_id = Column(Integer, index=True)
     # The nickname of the voter (used for analytics)
     user_nickname = Column(String)
     # ID of the voting message
@@ -184,8 +223,8 @@ class FreeFundingBalance(Base):
     __tablename__ = FREE_FUNDING_BALANCES_TABLE_NAME
 
     id = Column(Integer, primary_key=True)
-    # The mention of the user who sends transactions
-    author_id = Column(Integer)
+    # The mention of the user who sends transactions (each user has a single balance)
+    author_id = Column(Integer, index=True, unique=True)
     # The nickname of the user who sends transactions (so that analytics will be retrieved quickly, without the need to query Discord for nicknames)
     author_nickname = Column(String)
     # The remaining balance of the user
@@ -209,20 +248,107 @@ class FreeFundingTransaction(Base):
     author_id = Column(Integer)
     # The nickname of the user who sends transactions (used for analytics)
     author_nickname = Column(String)
-    # List of comma-separated user ids to whom the funds were sent (the separator is defined in FREE_FUNDING_MENTIONS_COLUMN_SEPARATOR)
-    recipient_ids = Column(String)
-    # Comma-separated list of user nicknames to whom funds were sent (used for analytics)
-    recipient_nicknames = Column(String)
     # Total amount of funds - a sum of the amounts sent to each mentioned user (defining some constraints to avoid overflow)
     total_amount = Column(
         Float, CheckConstraint('total_amount > -1000000000 AND total_amount < 1000000000')
     )
     # The text description of the transaction (validated to fit between MIN_DESCRIPTION_LENGTH and MAX_DESCRIPTION_LENGTH)
     description = Column(String)
-    # Date and time when the transaction was performed
-    submitted_at = Column(DateTime)
+    # Date and time when the transaction was performed (indexed for queries by time range)
+    submitted_at = Column(DateTime, index=True)
     # URL of the message where transaction was send
     message_url = Column(String)
 
+    # The users to whom the funds were sent
+    recipients = relationship(
+        "FreeFundingRecipients",
+        back_populates="transaction",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+
+    @property
+    def recipient_ids(self):
+        return [recipient.user_id for recipient in self.recipients]
+
+    @property
+    def recipient_nicknames(self):
+        return [recipient.user_nickname for recipient in self.recipients]
+
     def __repr__(self):
         return f"<FreeFundingTransaction(id={self.id}, author_id={self.author_id}, author_nickname={self.author_nickname}, recipient_ids={self.recipient_ids}, recipient_nicknames={self.recipient_nicknames}, total_amount={self.total_amount}, description={self.description}, submitted_at={self.submitted_at}, message_url={self.message_url})>"
+
+
+class FreeFundingRecipients(Base):
+    """
+    A recipient of a free funding transaction, with the amount the user has received.
+    """
+
+    __tablename__ = FREE_FUNDING_RECIPIENTS_TABLE_NAME
+
+    # Primary key
+    id = Column(Integer, primary_key=True)
+    # Foreign key - the transaction
+    transaction_id = Column(Integer, ForeignKey('free_funding_transaction_history.id'), index=True)
+    # The id of the recipient (indexed to aggregate transactions by user)
+    user_id = Column(Integer, nullable=False, index=True)
+    # The nickname of the recipient (used for analytics)
+    user_nickname = Column(String)
+    # The amount received by the user
+    amount = Column(Float, CheckConstraint('amount > -1000000000 AND amount < 1000000000'))
+
+    transaction = relationship("FreeFundingTransaction", back_populates="recipients")
+
+    def __repr__(self):
+        return f"<FreeFundingRecipients(id={self.id}, transaction_id={self.transaction_id}, user_id={self.user_id}, user_nickname={self.user_nickname}, amount={self.amount})>"
+
+
+class AnalyticsUserStats(Base):
+    """
+    The activity of a user, precomputed for analytics from the history DB. History is append-only,
+    so the counters are updated along with the history rows (see bot/utils/analytics_utils.py), and
+    the export doesn't need to aggregate the whole history. Can be verified and rebuilt with
+    admin/rebuild_analytics.py.
+    """
+
+    __tablename__ = ANALYTICS_USER_STATS_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    # The id of the user (each user has a single row)
+    user_id = Column(Integer, index=True, unique=True, nullable=False)
+    # The nickname of the user (the greatest of the ones saved in history, as in the export)
+    user_nickname = Column(String)
+    # The number of free funding transactions sent by the user
+    tips_sent = Column(Integer, nullable=False, default=0)
+    # The number of proposals submitted by the user (that are in history)
+    submitted_proposals = Column(Integer, nullable=False, default=0)
+    # The number of accepted proposals of the user
+    accepted_proposals = Column(Integer, nullable=False, default=0)
+    # The total amount of accepted financial proposals of the user
+    accepted_amount = Column(Float, nullable=False, default=0)
+    # The number of votes of the user in the proposals that are in history
+    votes = Column(Integer, nullable=False, default=0)
+    # The amount of free funding received by the user
+    tips_received = Column(Float, nullable=False, default=0)
+    # The amount of grants received by the user in accepted proposals
+    grants_received = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<AnalyticsUserStats(id={self.id}, user_id={self.user_id}, user_nickname={self.user_nickname}, tips_sent={self.tips_sent}, submitted_proposals={self.submitted_proposals}, accepted_proposals={self.accepted_proposals}, accepted_amount={self.accepted_amount}, votes={self.votes}, tips_received={self.tips_received}, grants_received={self.grants_received})>"
+
+
+class Seasons(Base):
+    """
+    A season of free funding, which starts when the balances of all users are reset (see
+    admin/reset_free_funding.py); the first one starts with the history (see
+    DBUtil.start_first_season). Used to export the analytics of a season.
+    """
+
+    __tablename__ = SEASONS_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+    # Date and time when the season has started
+    started_at = Column(DateTime, index=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Seasons(id={self.id}, started_at={self.started_at})>"
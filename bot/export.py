@@ -1,17 +1,26 @@
+import asyncio
 import logging
 import io
+import math
+import multiprocessing
+import time
 import discord
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.datetime import to_excel
+from openpyxl.worksheet.cell_range import CellRange
 from openpyxl.worksheet.table import Table, TableStyleInfo
 from openpyxl.worksheet.dimensions import ColumnDimension
 from openpyxl.styles import Font, Border, Side, PatternFill, Color
 from openpyxl.styles.alignment import Alignment
 from openpyxl.chart import LineChart, Reference, Series
 
-from sqlalchemy import and_
-from datetime import datetime
+from sqlalchemy import func, or_
+from sqlalchemy.orm import sessionmaker, selectinload
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
 
 from bot.config.const import *
 from bot.config.logging_config import log_handler, console_handler
@@ -22,16 +31,21 @@ from bot.utils.discord_utils import (
     send_dm,
 )
 from bot.utils.validation import validate_roles
-from bot.utils.db_utils import DBUtil
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
 from bot.utils.formatting_utils import get_amount_to_print, get_nickname_by_id_or_mention
 from bot.config.schemas import (
     Proposals,
     ProposalHistory,
     FreeFundingTransaction,
     FreeFundingBalance,
+    FreeFundingRecipients,
     FinanceRecipients,
+    FinanceRecipientUsers,
     Voters,
+    AnalyticsUserStats,
+    Seasons,
 )
+from bot.utils.analytics_utils import get_period_conditions, select_user_stats
 from bot.config.const import ProposalResult, VOTING_CHANNEL_ID
 
 logger = logging.getLogger(__name__)
@@ -42,6 +56,14 @@ logger.addHandler(console_handler)
 db = DBUtil()
 client = get_discord_client()
 
+# The process pool where documents are built, the builds in progress by the exported period (since,
+# until), and the time (monotonic) of the last export by each user
+export_executor = None
+export_tasks = {}
+export_cooldowns = {}
+# The event loop of the export process (see init_export_process)
+export_loop = None
+
 # Create alignments to format cells
 alignment_center = Alignment(horizontal='center', vertical='center')
 alignment_wrap = Alignment(wrap_text=True)
@@ -50,6 +72,7 @@ alignment_left_center = Alignment(horizontal='left', vertical='center')
 # Create borders
 bottom_border = Border(bottom=Side(style='thin'))
 dotted_right_border = Border(right=Side(style='dotted'))
+dotted_bottom_right_border = Border(bottom=Side(style='thin'), right=Side(style='dotted'))
 # Create colors
 header_fill = PatternFill(start_color=Color('b6d7a8'), end_color=Color('b6d7a8'), fill_type='solid')
 header_font = Font(bold=True)
@@ -57,130 +80,132 @@ header_font = Font(bold=True)
 
 def define_columns(page, columns):
     """
-    Columns are defined the same way for each page, with bold headers.
+    Columns are defined the same way for each page, with bold headers. Should be called before any
+    rows are appended (in write-only mode, the column widths are written first).
     """
-    # Write the column names to the worksheet and set column widths
+    # Set column widths and write the column names to the worksheet, drawing the border after them
+    header = []
     for col_num, column in enumerate(columns, 1):
-        column_letter = get_column_letter(col_num)
-        column_header = column["header"]
-        column_width = column["width"]
-        page.column_dimensions[column_letter].width = column_width
-        page.cell(row=1, column=col_num, value=column_header).font = header_font
-
-    # Draw the border after the header
-    for column in range(1, 1 + len(columns)):
-        cell = page.cell(row=1, column=column)
+        page.column_dimensions[get_column_letter(col_num)].width = column["width"]
+        cell = WriteOnlyCell(page, value=column["header"])
+        cell.font = header_font
         cell.border = bottom_border
         cell.fill = header_fill
+        header.append(cell)
+    page.append(header)
 
     # Freeze the header to show it when scrolling the sheet (it freezes all rows above the given cell)
     page.freeze_panes = 'A2'
 
 
-def postprocess(page):
+def append_row(page, values, bottom=False, alignments=None, hyperlinks=None):
     """
-    Format page after it has been filled with the data.
+    Appends a row of data to the page. Cells are styled as they're written (the page is written in
+    write-only mode, so it can't be formatted afterwards): each has a dotted right border, and if
+    bottom is True - a bottom border (e.g. for the last row of a record).
+    alignments and hyperlinks are dicts of values by column number (starting from 1).
     """
-    row_num = 0
-    # Apply a dotted right border style to all cells in the specified worksheet, while preserving any existing bottom borders.
-    for row in page.iter_rows():
-        row_num += 1
-        # Skip the first row, as it's the header
-        if row_num == 1:
-            continue
-        for cell in row:
-            if cell.border.bottom and cell.border.bottom.style:
-                cell.border = Border(bottom=cell.border.bottom, right=dotted_right_border.right)
-            else:
-                cell.border = dotted_right_border
-
-
-def set_bottom_border(page, columns):
+    alignments = alignments or {}
+    hyperlinks = hyperlinks or {}
+    row = []
+    for col_num, value in enumerate(values, 1):
+        cell = WriteOnlyCell(page, value=value)
+        cell.border = dotted_bottom_right_border if bottom else dotted_right_border
+        if col_num in alignments:
+            cell.alignment = alignments[col_num]
+        if col_num in hyperlinks:
+            cell.hyperlink = hyperlinks[col_num]
+        row.append(cell)
+    page.append(row)
+
+
+def get_user_stats(since=None, until=None):
     """
-    Applies a bottom border to all cells in the last row of the specified worksheet for each column in the specified columns list.
+    Returns the table of the statistics of users: the precomputed one for the whole history, or the
+    one computed for the period if since or until is given (see select_user_stats).
     """
-    # Loop over the columns and apply the border to each cell
-    for column in range(1, 1 + (columns if isinstance(columns, int) else len(columns))):
-        cell = page.cell(row=page.max_row, column=column)
-        cell.border = bottom_border
+    if since is None and until is None:
+        return AnalyticsUserStats.__table__
+    return select_user_stats(since, until).subquery()
 
 
-async def get_unique_active_users():
+def get_period_labels(since=None, until=None):
     """
-    Returns a list of unique users who have used free funding, submitted proposals or voted.
+    Returns the labels of the start and the end of the exported period (until is exclusive, so the
+    end is the date of the last moment within the period).
     """
-    users_with_tips = {
-        (balance.author_id, balance.author_nickname)
-        for balance in await db.filter(FreeFundingBalance, is_history=False)
-    }
-    users_with_proposals = {
-        (proposal.author_id, proposal.author_nickname)
-        for proposal in await db.filter(ProposalHistory)
-    }
-    users_with_votes = {(voter.user_id, voter.user_nickname) for voter in await db.filter(Voters)}
-    return users_with_tips.union(users_with_proposals).union(users_with_votes)
-
-
-async def write_summary(page):
-    # Number of rows with data in summary page
-    number_of_summary_rows = 4
+    since_label = since.strftime(EXPORT_DATE_FORMAT) if since is not None else "start"
+    until_label = (
+        (until - timedelta(microseconds=1)).strftime(EXPORT_DATE_FORMAT)
+        if until is not None
+        else "now"
+    )
+    return since_label, until_label
+
+
+async def write_summary(page, since=None, until=None):
     # Width of first column (fields desciptions)
     first_col_width = 28
     # Set first row width
     page.column_dimensions[get_column_letter(1)].width = first_col_width
-    # Set first row formatting
-    for row in range(1, number_of_summary_rows + 1):
-        cell = page.cell(row=row, column=1)
-        cell.alignment = alignment_wrap_center
-        cell.font = header_font
-        cell.fill = header_fill
 
-    # Retrieve the necessary data
-    free_funding_balances = await db.filter(FreeFundingBalance, is_history=False)
-    free_funding_spent = sum(
-        [
-            FREE_FUNDING_LIMIT_PERSON_PER_SEASON - balance.balance
-            for balance in free_funding_balances
-        ]
-    )
-    accepted_proposals = await db.filter(
-        ProposalHistory, condition=ProposalHistory.result == ProposalResult.ACCEPTED.value
+    # The totals of history are summed from the statistics of users
+    user_stats = get_user_stats(since, until)
+    totals = await db.query(
+        func.sum(user_stats.c.tips_received),
+        func.sum(user_stats.c.accepted_amount),
+        func.sum(user_stats.c.accepted_proposals),
+        func.sum(user_stats.c.submitted_proposals),
     )
-    total_grants_amount = sum(
-        [proposal.total_amount for proposal in accepted_proposals if not proposal.not_financial]
-    )
-    total_accepted_proposals = accepted_proposals.count()
-
-    submitted_proposals = await db.filter(Proposals)
-    total_submitted_proposals = submitted_proposals.count()
+    (
+        tips_received,
+        total_grants_amount,
+        total_accepted_proposals,
+        total_submitted_proposals,
+    ) = (total or 0 for total in totals[0])
+    summary = []
+    if since is None and until is None:
+        # Tips sent this season
+        free_funding_spent = await db.query(
+            func.sum(FREE_FUNDING_LIMIT_PERSON_PER_SEASON - FreeFundingBalance.balance),
+            is_history=False,
+        )
+        free_funding_spent = free_funding_spent[0][0] or 0
+    else:
+        # Tips sent within the period (all of them were received by someone)
+        free_funding_spent = tips_received
+        summary.append(("Period:", " - ".join(get_period_labels(since, until))))
+    summary += [
+        ("Total tips sent:", free_funding_spent),
+        ("Total points given with full consensus:", total_grants_amount),
+        ("Total number of accepted proposals:", total_accepted_proposals),
+        ("Total number of submitted proposals:", total_submitted_proposals),
+    ]
 
     # Write the data to the page
-    page.cell(row=1, column=1, value="Total tips sent:")
-    page.cell(row=1, column=2, value=free_funding_spent)
-    set_bottom_border(page, 2)
-
-    page.cell(row=2, column=1, value="Total points given with full consensus:")
-    page.cell(row=2, column=2, value=total_grants_amount)
-    set_bottom_border(page, 2)
-
-    page.cell(row=3, column=1, value="Total number of accepted proposals:")
-    page.cell(row=3, column=2, value=total_accepted_proposals)
-    set_bottom_border(page, 2)
-
-    page.cell(row=4, column=1, value="Total number of submitted proposals:")
-    page.cell(row=4, column=2, value=total_submitted_proposals)
-    set_bottom_border(page, 2)
-
-
-async def write_user_activity(page):
+    for description, value in summary:
+        # The first column is formatted as a header
+        header_cell = WriteOnlyCell(page, value=description)
+        header_cell.alignment = alignment_wrap_center
+        header_cell.font = header_font
+        header_cell.fill = header_fill
+        header_cell.border = bottom_border
+        value_cell = WriteOnlyCell(page, value=value)
+        value_cell.border = bottom_border
+        page.append([header_cell, value_cell])
+
+
+async def write_user_activity(page, since=None, until=None):
     """
     Creates a page with the activity of users who are allowed to send free funding, submit proposals
-    and vote.
+    and vote. The balances are only known as they are now, so the page of a period lists the users
+    active in the period with the number of tips they sent in it instead.
     """
+    is_period = since is not None or until is not None
     # Define column names and widths
     columns = [
         {"header": "User", "width": 15},
-        {"header": "Remaining tips", "width": 18},
+        {"header": "Tips sent" if is_period else "Remaining tips", "width": 18},
         {"header": "Accepted proposals", "width": 20},
         {"header": "Submitted proposals", "width": 20},
         {"header": "Votes", "width": 15},
@@ -188,48 +213,68 @@ async def write_user_activity(page):
     # Enable the columns in the page
     define_columns(page, columns)
 
-    # Retrieve all unique user IDs who used tips, submitted proposals, or voted and their nicknames
-    unique_active_users = await get_unique_active_users()
+    # Retrieve the balances of users (each user who has used tips has one), by user id: [nickname,
+    # balance (or the number of tips sent in a period), accepted proposals, submitted proposals,
+    # votes]
+    users = {}
+    if not is_period:
+        balances = await db.query(
+            FreeFundingBalance.author_id,
+            FreeFundingBalance.author_nickname,
+            FreeFundingBalance.balance,
+            is_history=False,
+        )
+        users = {user_id: [nickname, balance, 0, 0, 0] for user_id, nickname, balance in balances}
+
+    # Add the statistics of users who have sent tips, submitted proposals or voted
+    user_stats = get_user_stats(since, until)
+    active_users = await db.query(
+        user_stats.c.user_id,
+        user_stats.c.user_nickname,
+        user_stats.c.tips_sent,
+        user_stats.c.accepted_proposals,
+        user_stats.c.submitted_proposals,
+        user_stats.c.votes,
+        condition=or_(
+            user_stats.c.tips_sent > 0,
+            user_stats.c.submitted_proposals > 0,
+            user_stats.c.votes > 0,
+        ),
+    )
+    for user_id, user_nickname, tips_sent, accepted, submitted, votes in active_users:
+        # If the user haven't used free funding before, show his balance as default (we could have
+        # added his balance to db here, but it's not the best place to do so in analytics). In a
+        # period, the users are only listed with the number of tips they sent
+        default = tips_sent if is_period else FREE_FUNDING_LIMIT_PERSON_PER_SEASON
+        user = users.setdefault(user_id, [None, default, 0, 0, 0])
+        user[0] = user[0] or user_nickname
+        user[2:] = [accepted, submitted, votes]
 
     # Loop over each user and add a row to the worksheet
-    for row_num, (user_id, user_nickname) in enumerate(
-        sorted(unique_active_users, key=lambda x: x[1]), 2
+    sorted_users = sorted(users.values(), key=lambda user: str(user[0]))
+    for row_num, (user_nickname, balance, accepted, submitted, votes) in enumerate(
+        sorted_users, 1
     ):
-        balances = await db.filter(FreeFundingBalance, is_history=False)
-        # If the user haven't used free funding before, show his balance as default (we could have
-        # added his balance to db here, but it's not the best place to do so in analytics)
-        user_balance = FREE_FUNDING_LIMIT_PERSON_PER_SEASON
-        for balance in balances.all():
-            if balance.author_id == user_id:
-                user_balance = balance.balance
-                break
-
-        # User
-        page.cell(row=row_num, column=1, value=str(user_nickname))
-        # Free funding balance
-        page.cell(row=row_num, column=2, value=str(get_amount_to_print(user_balance)))
-        # Accepted proposals
-        accepted_proposals = await db.filter(
-            ProposalHistory,
-            condition=(ProposalHistory.author_id == user_id)
-            & (ProposalHistory.result == ProposalResult.ACCEPTED.value),
+        append_row(
+            page,
+            [
+                # User
+                str(user_nickname),
+                # Free funding balance (or number of tips sent in the period)
+                balance if is_period else str(get_amount_to_print(balance)),
+                # Accepted proposals
+                accepted,
+                # Submitted proposals
+                submitted,
+                # Votes
+                votes,
+            ],
+            # Draw the bottom border after the last row
+            bottom=row_num == len(sorted_users),
         )
-        page.cell(row=row_num, column=3, value=accepted_proposals.count())
-        # Submitted proposals
-        submitted_proposals = await db.filter(Proposals, condition=Proposals.author_id == user_id)
-        page.cell(row=row_num, column=4, value=submitted_proposals.count())
-        # Votes
-        votes = await db.filter(Voters, condition=Voters.user_id == user_id)
-        page.cell(row=row_num, column=5, value=votes.count())
 
-    # Draw the bottom border
-    set_bottom_border(page, columns)
 
-    # Apply some formatting after the page has been filled
-    postprocess(page)
-
-
-async def write_user_grants_recieved(page):
+async def write_user_grants_recieved(page, since=None, until=None):
     # Define column names and widths
     columns = [
         {"header": "User", "width": 20},
@@ -240,63 +285,32 @@ async def write_user_grants_recieved(page):
     # Enable the columns in the page
     define_columns(page, columns)
 
-    # Retrieve free funding transactions and group by user
-    free_funding_transactions = await db.filter(FreeFundingTransaction)
-    free_funding_by_user = {}
-    for transaction in free_funding_transactions:
-        recipients = transaction.recipient_nicknames.split(DB_ARRAY_COLUMN_SEPARATOR)
-        amounts = [transaction.total_amount / len(recipients)] * len(recipients)
-        for recipient, amount in zip(recipients, amounts):
-            if recipient in free_funding_by_user:
-                free_funding_by_user[recipient] += amount
-            else:
-                free_funding_by_user[recipient] = amount
-
-    # Retrieve accepted proposals from ProposalHistory
-    accepted_proposals = await db.filter(
-        ProposalHistory, condition=ProposalHistory.result == ProposalResult.ACCEPTED.value
-    )
-    # Get the finance recipient IDs of the accepted proposals
-    accepted_proposal_ids = [proposal.id for proposal in accepted_proposals]
-    # Retrieve finance recipients whose proposal_id is in the list of accepted_proposal_ids
-    finance_recipients = await db.filter(
-        FinanceRecipients, condition=FinanceRecipients.proposal_id.in_(accepted_proposal_ids)
+    # Retrieve the amounts received by each user
+    user_stats = get_user_stats(since, until)
+    received_by_user = await db.query(
+        user_stats.c.user_nickname,
+        user_stats.c.tips_received,
+        user_stats.c.grants_received,
+        condition=or_(user_stats.c.tips_received != 0, user_stats.c.grants_received != 0),
     )
-    # Group by user
-    grants_by_user = {}
-    for recipient in finance_recipients:
-        recipients = recipient.recipient_nicknames.split(COMMA_LIST_SEPARATOR)
-        amounts = [recipient.amount] * len(recipients)
-        for recipient, amount in zip(recipients, amounts):
-            if recipient in grants_by_user:
-                grants_by_user[recipient] += amount
-            else:
-                grants_by_user[recipient] = amount
-    sorted_grants_by_user = {
-        k: v for k, v in sorted(grants_by_user.items(), key=lambda item: item[0])
-    }
-
-    # Combine users from both dictionaries
-    all_users = set(free_funding_by_user.keys()).union(sorted_grants_by_user.keys())
 
     # Write user data to the page
-    row = 2
-    for user in sorted(all_users):
-        # Username
-        page.cell(row=row, column=1, value=user)
-        #
-        page.cell(row=row, column=2, value=get_amount_to_print(free_funding_by_user.get(user, 0)))
-        page.cell(row=row, column=3, value=get_amount_to_print(sorted_grants_by_user.get(user, 0)))
-        # Draw the bottom border
-        set_bottom_border(page, columns)
-
-        row += 1
-
-    # Apply some formatting after the page has been filled
-    postprocess(page)
+    for user_nickname, tips_received, grants_received in sorted(
+        received_by_user, key=lambda user: str(user[0])
+    ):
+        append_row(
+            page,
+            [
+                # Username
+                user_nickname,
+                get_amount_to_print(tips_received),
+                get_amount_to_print(grants_received),
+            ],
+            bottom=True,
+        )
 
 
-async def write_lazy_consensus_history(page):
+async def write_lazy_consensus_history(page, since=None, until=None):
     # Define column names and widths
     columns = [
         {"header": "Discord link", "width": 15},
@@ -313,94 +327,106 @@ async def write_lazy_consensus_history(page):
     # Enable the columns in the page
     define_columns(page, columns)
 
-    # Retrieve all accepted proposals
-    accepted_proposals = await db.filter(
-        ProposalHistory,
-        condition=and_(
-            Proposals.id == ProposalHistory.id,
-            ProposalHistory.result == ProposalResult.ACCEPTED.value,
-        ),
-        order_by=ProposalHistory.closed_at.asc(),
-    )
-    # Loop over each accepted proposal and add a row to the worksheet
-    current_row = 2
-    for proposal in accepted_proposals.all():
-        logger.debug(proposal)
-        start_row = end_row = current_row
-        # If the proposal is not financial, fill recievers and amount with empty analytics values
-        if proposal.not_financial:
-            cell = page.cell(row=start_row, column=4, value=EMPTY_ANALYTICS_VALUE)
-            cell.alignment = alignment_center
-            cell = page.cell(row=start_row, column=5, value=EMPTY_ANALYTICS_VALUE)
-            cell.alignment = alignment_center
-        else:
-            # Retrieve recievers
-            finance_recipients = proposal.finance_recipients
-            if not finance_recipients:
-                logger.warning("No finance recipients found in a financial proposal!")
-                continue
-            # Fill each receivers group in a separate row
-            for row_num, recipient in enumerate(finance_recipients, start_row):
-                # Mention
-                cell = page.cell(
-                    row=row_num,
-                    column=4,
-                    value=str(recipient.recipient_nicknames),
-                )
-                cell.alignment = alignment_wrap
-                # Amount
-                cell = page.cell(
-                    row=row_num, column=5, value=str(get_amount_to_print(recipient.amount))
-                )
-                cell.alignment = alignment_center
-            # Set the end row of the current proposal to merge other cells
-            end_row += len(finance_recipients) - 1
-
-        # Discord URL
-        discord_link = proposal.voting_message_url
-        page.merge_cells(start_row=start_row, end_row=end_row, start_column=1, end_column=1)
-        cell = page.cell(row=start_row, column=1, value=discord_link)
-        cell.hyperlink = discord_link
-        cell.alignment = alignment_left_center
-        # Date
-        date_str = proposal.closed_at.strftime("%Y-%m-%d %H:%M:%S")
-        page.merge_cells(start_row=start_row, end_row=end_row, start_column=2, end_column=2)
-        cell = page.cell(row=start_row, column=2, value=date_str)
-        cell.alignment = alignment_center
-        # Author
-        page.merge_cells(start_row=start_row, end_row=end_row, start_column=3, end_column=3)
-        cell = page.cell(
-            row=start_row,
-            column=3,
-            value=str(proposal.author_nickname),
-        )
-        cell.alignment = alignment_wrap_center
-        # Total amount
-        page.merge_cells(start_row=start_row, end_row=end_row, start_column=6, end_column=6)
-        cell = page.cell(
-            row=start_row,
-            column=6,
-            value=EMPTY_ANALYTICS_VALUE
-            if proposal.not_financial
-            else get_amount_to_print(proposal.total_amount),
+    def write_rows(session):
+        # Retrieve all accepted proposals (in batches, along with their recipients)
+        accepted_proposals = (
+            session.query(ProposalHistory)
+            .filter(
+                Proposals.id == ProposalHistory.id,
+                ProposalHistory.result == ProposalResult.ACCEPTED.value,
+                # The proposals closed within the period (a range of the index on closed_at)
+                *get_period_conditions(ProposalHistory.closed_at, since, until),
+            )
+            .order_by(ProposalHistory.closed_at.asc())
+            .options(selectinload(ProposalHistory.finance_recipients))
+            .yield_per(EXPORT_QUERY_BATCH_SIZE)
         )
-        cell.alignment = alignment_center
-        # Description
-        page.merge_cells(start_row=start_row, end_row=end_row, start_column=7, end_column=7)
-        cell = page.cell(row=start_row, column=7, value=str(proposal.description))
-        cell.alignment = alignment_wrap
-
-        # Draw the bottom border
-        set_bottom_border(page, columns)
+        # Loop over each accepted proposal and add its rows to the worksheet
+        current_row = 2
+        for proposal in accepted_proposals:
+            # If the proposal is not financial, fill recievers and amount with empty analytics
+            # values
+            if proposal.not_financial:
+                recipient_rows = [(EMPTY_ANALYTICS_VALUE, EMPTY_ANALYTICS_VALUE)]
+                recipient_alignment = alignment_center
+            else:
+                # Retrieve recievers
+                finance_recipients = proposal.finance_recipients
+                if not finance_recipients:
+                    logger.warning("No finance recipients found in a financial proposal!")
+                    continue
+                # Fill each receivers group in a separate row (mentions and amount)
+                recipient_rows = [
+                    (
+                        COMMA_LIST_SEPARATOR.join(map(str, recipient.recipient_nicknames)),
+                        str(get_amount_to_print(recipient.amount)),
+                    )
+                    for recipient in finance_recipients
+                ]
+                recipient_alignment = alignment_wrap
+            start_row = current_row
+            end_row = start_row + len(recipient_rows) - 1
+
+            # Other columns are written in the first row, and merged over all rows of the proposal
+            discord_link = proposal.voting_message_url
+            first_row = [
+                # Discord URL
+                discord_link,
+                # Date
+                proposal.closed_at.strftime("%Y-%m-%d %H:%M:%S"),
+                # Author
+                str(proposal.author_nickname),
+            ]
+            other_columns = [
+                # Total amount
+                EMPTY_ANALYTICS_VALUE
+                if proposal.not_financial
+                else get_amount_to_print(proposal.total_amount),
+                # Description
+                str(proposal.description),
+            ]
+            for row_num, (mentions, amount) in enumerate(recipient_rows, start_row):
+                if row_num == start_row:
+                    values = first_row + [mentions, amount] + other_columns
+                else:
+                    values = (
+                        [None] * len(first_row) + [mentions, amount] + [None] * len(other_columns)
+                    )
+                append_row(
+                    page,
+                    values,
+                    # Draw the bottom border after the last row of the proposal
+                    bottom=row_num == end_row,
+                    alignments={
+                        1: alignment_left_center,
+                        2: alignment_center,
+                        3: alignment_wrap_center,
+                        4: recipient_alignment,
+                        5: alignment_center,
+                        6: alignment_center,
+                        7: alignment_wrap,
+                    },
+                    hyperlinks={1: discord_link} if row_num == start_row else None,
+                )
+            if end_row > start_row:
+                for column in (1, 2, 3, 6, 7):
+                    # The ranges of different proposals never overlap, so they're added to the set
+                    # directly (merged_cells.add checks each range against all the others)
+                    page.merged_cells.ranges.add(
+                        CellRange(
+                            min_col=column, min_row=start_row, max_col=column, max_row=end_row
+                        )
+                    )
 
-        # Increment the current row
-        current_row = end_row + 1
+            # Increment the current row
+            current_row = end_row + 1
 
-    # Apply some formatting after the page has been filled
-    postprocess(page)
+    # The rows are written in the DB thread while the proposals are read in batches (the session is
+    # only used there, see run_with_session)
+    await db.run_with_session(write_rows)
 
 
-async def write_free_funding_transactions(page):
+async def write_free_funding_transactions(page, since=None, until=None):
     # Define column names and widths
     columns = [
         {"header": "Discord link", "width": 15},
@@ -413,73 +439,227 @@ async def write_free_funding_transactions(page):
     # Enable the columns in the page
     define_columns(page, columns)
 
-    # Retrieve all transactions
-    all_transactions = await db.filter(
-        FreeFundingTransaction,
-        order_by=FreeFundingTransaction.submitted_at.asc(),
-    )
-
-    # Loop over each transaction and add a row to the worksheet
-    for row_num, transaction in enumerate(all_transactions.all(), 2):
-        # Discord URL
-        discord_link = transaction.message_url
-        page.cell(row=row_num, column=1).value = discord_link
-        page.cell(row=row_num, column=1).hyperlink = discord_link
-        # Date
-        page.cell(
-            row=row_num, column=2, value=transaction.submitted_at.strftime("%Y-%m-%d %H:%M:%S")
+    def write_rows(session):
+        # Retrieve all transactions (in batches)
+        all_transactions = (
+            session.query(FreeFundingTransaction)
+            # The transactions sent within the period (a range of the index on submitted_at)
+            .filter(*get_period_conditions(FreeFundingTransaction.submitted_at, since, until))
+            .order_by(FreeFundingTransaction.submitted_at.asc())
+            .yield_per(EXPORT_QUERY_BATCH_SIZE)
         )
-        # Author
-        page.cell(row=row_num, column=3, value=str(transaction.author_nickname))
-        # Mentions
-        page.cell(row=row_num, column=4, value=str(transaction.recipient_nicknames))
-        # Total amount
-        page.cell(row=row_num, column=5, value=str(get_amount_to_print(transaction.total_amount)))
-        # Description
-        page.cell(row=row_num, column=6, value=str(transaction.description))
-
-        # Draw the bottom border
-        set_bottom_border(page, columns)
 
-    # Apply some formatting after the page has been filled
-    postprocess(page)
-
-
-async def export_xlsx():
-    # Create a new Excel workbook and worksheet
-    wb = openpyxl.Workbook()
+        # Loop over each transaction and add a row to the worksheet
+        for transaction in all_transactions:
+            discord_link = transaction.message_url
+            append_row(
+                page,
+                [
+                    # Discord URL
+                    discord_link,
+                    # Date
+                    transaction.submitted_at.strftime("%Y-%m-%d %H:%M:%S"),
+                    # Author
+                    str(transaction.author_nickname),
+                    # Mentions
+                    COMMA_LIST_SEPARATOR.join(map(str, transaction.recipient_nicknames)),
+                    # Total amount
+                    str(get_amount_to_print(transaction.total_amount)),
+                    # Description
+                    str(transaction.description),
+                ],
+                bottom=True,
+                hyperlinks={1: discord_link},
+            )
+
+    # The rows are written in the DB thread while the transactions are read in batches
+    await db.run_with_session(write_rows)
+
+
+async def export_xlsx(since=None, until=None):
+    """
+    Builds the document with the analytics of the whole history, or of the period if since or until
+    is given (since is inclusive, until is exclusive).
+    """
+    # Create a new Excel workbook in write-only mode: rows are written to a temporary file as they're
+    # appended, so the memory used doesn't depend on the size of the history
+    wb = openpyxl.Workbook(write_only=True)
 
     # Create a summary page
-    summary_page = wb.active
-    summary_page.title = "Summary"
-    await write_summary(summary_page)
+    summary_page = wb.create_sheet(title="Summary")
+    await write_summary(summary_page, since, until)
 
     # Create a page with free funding balances of all members
     free_funding_balance_page = wb.create_sheet(title="L3 Activity")
-    await write_user_activity(free_funding_balance_page)
+    await write_user_activity(free_funding_balance_page, since, until)
 
     # Create a page with grants and free funding received by all members
     all_grants_page = wb.create_sheet(title="Grant Receivers")
-    await write_user_grants_recieved(all_grants_page)
+    await write_user_grants_recieved(all_grants_page, since, until)
 
     # Create a page with a history of all lazy consensus proposals
     proposals_page = wb.create_sheet(title="Proposals")
-    await write_lazy_consensus_history(proposals_page)
+    await write_lazy_consensus_history(proposals_page, since, until)
 
     # Create a page with all free funding transactions
     free_funding_history_page = wb.create_sheet(title="Tips Transactions")
-    await write_free_funding_transactions(free_funding_history_page)
+    await write_free_funding_transactions(free_funding_history_page, since, until)
 
     # Save the Excel workbook to a temporary file
     temp_file = io.BytesIO()
     wb.save(temp_file)
     temp_file.seek(0)
 
-    return temp_file, EXPORT_DATA_FILENAME
+    return temp_file, get_export_filename(since, until)
+
+
+def get_export_filename(since=None, until=None):
+    if since is None and until is None:
+        return EXPORT_DATA_FILENAME
+    since_label, until_label = get_period_labels(since, until)
+    return EXPORT_PERIOD_DATA_FILENAME.format(since=since_label, until=until_label)
+
+
+def init_export_process(db_path, db_history_path):
+    """
+    Initializes a process of the export pool: connects to the databases in read-only mode, and
+    creates the event loop that runs export_xlsx.
+    """
+    global export_loop
+    DBUtil.engine = create_sqlite_engine(db_path, pragmas={}, read_only=True)
+    DBUtil.session = sessionmaker(bind=DBUtil.engine, expire_on_commit=False)()
+    DBUtil.engine_history = create_sqlite_engine(db_history_path, pragmas={}, read_only=True)
+    DBUtil.session_history = sessionmaker(bind=DBUtil.engine_history, expire_on_commit=False)()
+    export_loop = asyncio.new_event_loop()
+
+
+def build_export_document(since=None, until=None):
+    """
+    Builds the document in a process of the export pool, and returns its content.
+    """
+    try:
+        document, _ = export_loop.run_until_complete(export_xlsx(since, until))
+        return document.getvalue()
+    finally:
+        # End the read transactions, so that the next export will see the latest data
+        DBUtil.session.close()
+        DBUtil.session_history.close()
+
+
+def get_export_executor():
+    global export_executor
+    if export_executor is None:
+        # A new interpreter is spawned rather than forked, since the bot process runs the event loop
+        # and the DB thread. The process is kept for the next exports.
+        export_executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_export_process,
+            initargs=(DB_PATH, DB_HISTORY_PATH),
+        )
+    return export_executor
+
+
+def shutdown_export_executor():
+    """
+    Shuts the export pool down (when the bot closes, or when its process has died); the next export
+    starts a new one.
+    """
+    global export_executor
+    if export_executor is not None:
+        export_executor.shutdown(wait=False, cancel_futures=True)
+        export_executor = None
+
+
+async def export_in_process(since=None, until=None):
+    # Make sure the votes pending in write-behind mode are exported
+    await db.flush()
+    executor = get_export_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, build_export_document, since, until
+        )
+    except BrokenProcessPool:
+        # The export process has died (e.g. killed when out of memory), and the pool can't be used
+        # anymore, so it's replaced on the next export (unless it already has been)
+        if export_executor is executor:
+            shutdown_export_executor()
+        raise
+
+
+async def get_export_document(since=None, until=None):
+    """
+    Returns the content of the document built in the export process (off the event loop). While the
+    document of a period is being built, all requests of the period wait for the same build.
+    """
+    export_task = export_tasks.get((since, until))
+    if export_task is None or export_task.done():
+        export_task = asyncio.ensure_future(export_in_process(since, until))
+        export_tasks[(since, until)] = export_task
+        export_task.add_done_callback(lambda task: remove_export_task(since, until, task))
+    # Shielded, so that the build isn't cancelled along with one of the requests
+    return await asyncio.shield(export_task)
+
+
+def remove_export_task(since, until, task):
+    # Forget the finished build, unless another one of the same period has already started
+    if export_tasks.get((since, until)) is task:
+        del export_tasks[(since, until)]
+
+
+async def get_export_period(args):
+    """
+    Returns the period (since, until) given to !export: the whole history by default, a season
+    ("season" for the current one, or "season <number>"), or the dates "<since> [<until>]" (both are
+    included). Raises ValueError with the reply to the user if the period is invalid.
+    """
+    if not args:
+        return None, None
+    if len(args) > 2:
+        raise ValueError(EXPORT_INVALID_PERIOD_REPLY)
+
+    if args[0].lower() == "season":
+        # Seasons are started when the balances of all users are reset
+        seasons = await db.filter(Seasons, order_by=Seasons.started_at.asc())
+        seasons = [season.started_at for season in seasons]
+        if len(args) == 1:
+            number = len(seasons)
+        elif args[1].isdigit():
+            number = int(args[1])
+        else:
+            raise ValueError(EXPORT_INVALID_PERIOD_REPLY)
+        if not 1 <= number <= len(seasons):
+            raise ValueError(EXPORT_SEASON_NOT_FOUND_REPLY)
+        # The season lasts until the next one starts
+        return seasons[number - 1], seasons[number] if number < len(seasons) else None
+
+    try:
+        dates = [datetime.strptime(arg, EXPORT_DATE_FORMAT) for arg in args]
+    except ValueError:
+        raise ValueError(EXPORT_INVALID_PERIOD_REPLY)
+    since = dates[0]
+    # The last date is included, so the period ends when the next day starts
+    until = dates[1] + timedelta(days=1) if len(dates) == 2 else None
+    if until is not None and until <= since:
+        raise ValueError(EXPORT_INVALID_PERIOD_REPLY)
+    return since, until
+
+
+def get_export_cooldown(user_id):
+    """
+    Returns the number of seconds until the user can export data again, or 0 if the user can do it
+    now (in which case the cooldown is started).
+    """
+    now = time.monotonic()
+    last_exported_at = export_cooldowns.get(user_id)
+    if last_exported_at is not None and now - last_exported_at < EXPORT_COOLDOWN_SECONDS:
+        return math.ceil(EXPORT_COOLDOWN_SECONDS - (now - last_exported_at))
+    export_cooldowns[user_id] = now
+    return 0
 
 
 @client.command(name=EXPORT_COMMAND_NAME)
-async def export_command(ctx):
+async def export_command(ctx, *args):
     try:
         # Reply to a non-authorized user
         if not await validate_roles(ctx.message.author):
@@ -488,18 +668,31 @@ async def export_command(ctx):
             # Sending response in DM
             await ctx.message.reply(HELP_MESSAGE_NON_AUTHORIZED_USER)
             return
+        # Parse the period to export (before the cooldown starts, so that typos can be fixed)
+        try:
+            since, until = await get_export_period(args)
+        except ValueError as e:
+            await ctx.message.reply(str(e))
+            return
+        # Limit how often each user can export data
+        cooldown = get_export_cooldown(ctx.message.author.id)
+        if cooldown:
+            await ctx.message.reply(EXPORT_COOLDOWN_REPLY.format(seconds=cooldown))
+            return
         # Adding greetings reaction so to show that the command is being processed (it may take a couple of seconds waiting for the user)
         await ctx.message.add_reaction(REACTION_ON_BOT_MENTION)
 
         # Create the document
-        document, filename = await export_xlsx()
+        document = await get_export_document(since, until)
         # Send the document to user
         await ctx.message.reply(
             EXPORT_CHANNEL_REPLY,
-            file=discord.File(document, filename=filename),
+            file=discord.File(io.BytesIO(document), filename=get_export_filename(since, until)),
         )
 
     except Exception as e:
+        # Let the user try again without waiting for the cooldown
+        export_cooldowns.pop(ctx.message.author.id, None)
         try:
             # Try replying in Discord
             error_message = f"An unexpected error occurred when exporting analytical data. cc {RESPONSIBLE_MENTION}"
@@ -19,7 +19,11 @@ db = DBUtil()
 client = get_discord_client()
 
 
-async def grant(voting_message_id):
+async def grant(voting_message_id, nicknames=None):
+    """
+    Applies the grant of the accepted proposal, and saves it to history. The nicknames saved to
+    history can be retrieved before locking the proposal (see get_history_nicknames).
+    """
     try:
         try:
             proposal = get_proposal(voting_message_id)
@@ -28,6 +32,8 @@ async def grant(voting_message_id):
             return
 
         result = ProposalResult.ACCEPTED
+        # Make sure all votes are saved before the grant is applied
+        await db.flush()
 
         # Retrieve the original proposal message
         # get_message is not used here for a reason - the channel variables are reused later
@@ -53,8 +59,8 @@ async def grant(voting_message_id):
         # Applying the grant if the proposal isn't grantless
         if not proposal.not_financial:
             for recipient in proposal.finance_recipients:
-                # Extract array of recipient ids
-                ids = recipient.recipient_ids.split(DB_ARRAY_COLUMN_SEPARATOR)
+                # Retrieve recipient ids
+                ids = recipient.recipient_ids
                 # Construct the grant message
                 grant_message = GRANT_COMMAND_LAZY_CONSENSUS_MESSAGE.format(
                     prefix=DISCORD_COMMAND_PREFIX,
@@ -155,7 +161,9 @@ async def grant(voting_message_id):
             )
 
         # Add history item for analytics
-        await save_proposal_to_history(db, proposal, result)
+        await save_proposal_to_history(
+            db, proposal, result, voting_message=voting_message, nicknames=nicknames
+        )
         # Remove all voting reactions from the voting message, to keep the channel clean
         await remove_reactions(voting_message, EMOJI_VOTING_YES, EMOJI_VOTING_NO)
         logger.info("Successfully approved proposal. voting_message_id=%d", voting_message_id)
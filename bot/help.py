@@ -60,7 +60,7 @@ async def send_free_funding_balance(ctx):
                 ),
                 balance=FREE_FUNDING_LIMIT_PERSON_PER_SEASON,
             )
-            await db.add(author_balance)
+            author_balance = await db.add_free_funding_balance(author_balance)
 
         # Reply with the balance
         await ctx.message.add_reaction(REACTION_ON_BOT_MENTION)
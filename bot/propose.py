@@ -15,8 +15,8 @@ from bot.utils.proposal_utils import (
     add_proposal,
     is_relevant_proposal,
     get_voters_with_vote,
-    add_finance_recipient,
-    proposal_lock,
+    lock_proposal,
+    get_history_nicknames,
 )
 from bot.config.logging_config import log_handler, console_handler
 from bot.utils.validation import (
@@ -25,13 +25,14 @@ from bot.utils.validation import (
     validate_not_financial_proposal,
 )
 from bot.utils.discord_utils import get_discord_client, get_message, send_dm
+from bot.utils.scheduler import get_approval_scheduler
 from bot.utils.formatting_utils import (
     get_discord_timestamp_plus_delta,
     get_discord_countdown_plus_delta,
     get_amount_to_print,
     get_nickname_by_id_or_mention,
 )
-from bot.config.schemas import Proposals, FinanceRecipients
+from bot.config.schemas import Proposals, FinanceRecipients, FinanceRecipientUsers
 from bot.vote import cancel_proposal
 
 logger = logging.getLogger(__name__)
@@ -45,7 +46,8 @@ client = get_discord_client()
 
 async def approve_proposal(voting_message_id):
     """
-    A coroutine that approves a proposal by checking if the time to approve has come and if the proposal hasn't been cancelled.
+    Approves a proposal once its voting time has ended, unless it was cancelled before. The coroutine
+    is run by the approval scheduler at proposal.closed_at (see schedule_proposal_approval).
     """
     logger.info("Running approval coroutine for voting_message_id=%d", voting_message_id)
     try:
@@ -53,17 +55,11 @@ async def approve_proposal(voting_message_id):
     except ValueError as e:
         logger.error(f"Error while getting grant proposal: {e}")
         return
-    # Unless the timer runs out, sleep (any other operations in this cycle should be minimised, as it runs every 5-10 sec for each active proposal)
-    while proposal.closed_at > datetime.utcnow():
-        # If proposal was cancelled, it will be removed from dictionary (see on_raw_reaction_add),
-        # so we should exit
-        if not is_relevant_proposal(voting_message_id):
-            return
-        # Sleep until the next check
-        await asyncio.sleep(APPROVAL_SLEEP_SECONDS)
     try:
+        # Retrieve the nicknames saved to history before locking, as they may require API calls
+        nicknames = await get_history_nicknames(proposal)
         # Acquire the proposal lock when accepting or cancelling to avoid concurrency errors
-        async with proposal_lock:
+        async with lock_proposal(voting_message_id):
             # Double check to make sure the proposal wasn't accepted or cancelled while the lock was acquired by other thread
             if not is_relevant_proposal(voting_message_id):
                 logger.info(
@@ -83,15 +79,25 @@ async def approve_proposal(voting_message_id):
                     proposal,
                     ProposalResult.CANCELLED_BY_NOT_REACHING_POSITIVE_THRESHOLD,
                     voting_message,
+                    nicknames,
                 )
                 return
             # Apply the grant
-            await grant(voting_message_id)
+            await grant(voting_message_id, nicknames)
 
     except ValueError as e:
         logger.error(f"Error while removing grant proposal: {e}")
 
 
+def schedule_proposal_approval(proposal):
+    """
+    Schedules approval of the given proposal at the time its voting ends.
+    """
+    get_approval_scheduler().schedule(
+        proposal.voting_message_id, proposal.closed_at, approve_proposal
+    )
+
+
 async def submit_proposal(
     ctx,
     proposal_voting_type: ProposalVotingType,
@@ -194,21 +200,19 @@ async def submit_proposal(
         proposal_type=proposal_voting_type.value,
         anonymity_type=proposal_voting_anonymity_type.value,
     )
+    # Add recipients to the proposal, so that they're saved to DB along with it
+    new_proposal.finance_recipients.extend(finance_recipients or [])
     # Add proposal to DB
     await add_proposal(new_proposal, db)
-    # Add recipients to the proposal in DB
-    for recipient in finance_recipients:
-        recipient.proposal_id = new_proposal.id
-        await add_finance_recipient(new_proposal, recipient)
 
     # Add tick and cross reactions to the voting message after adding proposal to DB
     if FULL_CONSENSUS_ENABLED:
         await voting_message.add_reaction(EMOJI_VOTING_YES)
         await voting_message.add_reaction(EMOJI_VOTING_NO)
 
-    # Run the approval coroutine
-    client.loop.create_task(approve_proposal(voting_message.id))
-    logger.info("Added task to event loop to approve message_id=%d", voting_message.id)
+    # Schedule the approval
+    schedule_proposal_approval(new_proposal)
+    logger.info("Scheduled approval of message_id=%d", voting_message.id)
 
 
 async def parse_propose_command(ctx, proposal_voting_type, proposal_voting_anonymity_type, *args):
@@ -278,11 +282,13 @@ async def parse_propose_command(ctx, proposal_voting_type, proposal_voting_anony
                 nicknames = [await get_nickname_by_id_or_mention(id) for id in ids]
                 # Extract the amount to send
                 amount = float(match.group(2))
-                # Create a new FinanceRecipients instance and populate it
+                # Create a new FinanceRecipients instance and populate it, with a row for each user
                 recipient = FinanceRecipients(
-                    recipient_ids=DB_ARRAY_COLUMN_SEPARATOR.join(ids),
-                    recipient_nicknames=COMMA_LIST_SEPARATOR.join(nicknames),
                     amount=amount,
+                    recipients=[
+                        FinanceRecipientUsers(user_id=int(id), user_nickname=nickname)
+                        for id, nickname in zip(ids, nicknames)
+                    ],
                 )
                 # Add the new FinanceRecipients instance to a list
                 finance_recipients.append(recipient)
@@ -1,12 +1,13 @@
 import logging
 import asyncio
-import logging
+import time
 
 from bot.config.const import (
     EMOJI_VOTING_NO,
     EMOJI_VOTING_YES,
     VOTING_CHANNEL_ID,
     SLEEP_BEFORE_RECOVERY_SECONDS,
+    RECOVERY_CONCURRENCY,
     ProposalResult,
     Vote,
     BOT_ID,
@@ -16,18 +17,17 @@ from bot.config.const import (
 from bot.config.logging_config import log_handler, console_handler, DEFAULT_LOG_LEVEL
 from bot.config.schemas import Voters
 from bot.propose import (
-    approve_proposal,
+    schedule_proposal_approval,
 )
 from bot.utils.db_utils import DBUtil
-from bot.utils.dev_utils import measure_time_async
+from bot.utils.dev_utils import measure_time_async, TimingStats
 from bot.utils.discord_utils import get_message, send_dm
 from bot.utils.proposal_utils import (
     is_relevant_proposal,
     find_matching_voter,
-    add_voter,
-    remove_voter,
+    update_voters,
     get_voters_with_vote,
-    proposal_lock,
+    lock_proposal,
 )
 from bot.utils.validation import validate_roles
 from bot.vote import cancel_proposal
@@ -37,15 +37,23 @@ logger.setLevel(DEFAULT_LOG_LEVEL)
 logger.addHandler(log_handler)
 logger.addHandler(console_handler)
 
+# Time spent on recovering each proposal, and on the whole recovery (while voting is paused)
+proposal_recovery_stats = TimingStats("Recovery of a proposal")
+recovery_duration_stats = TimingStats("Recovery")
+
 
 async def sync_voters_db_with_discord(voting_message, proposal, vote, emoji):
     """
     Updates voters in the database based on the reactions on the voting message associated with the given proposal.
-    Voters who have added cancel reaction but are not in the database are added to the database.
-    Voters who are in the database but have not added cancel reaction are removed from the database.
+    Voters who have added the voting reaction but are not in the database are added to the database.
+    Voters who are in the database but have not added the voting reaction (or don't have
+    permissions to vote anymore) are removed from the database.
     Also, decisions are applied if the proposer voted against, or if lazy consensus dissenters
-    threshold was reached. This could have been done directly in approve_proposal to make the code
-    cleaner, but checking every 5-10 sec the entire set of proposals would dramatically increase CPU load.
+    threshold was reached. This is only done once during recovery, because approve_proposal runs
+    just a single time for each proposal, when its voting ends.
+
+    The users who reacted are fetched from Discord once, and the changes of voters are saved in a
+    single DB transaction.
 
     :param voting_message: The message on which the voting occurred.
     :param proposal: The proposal for which to update voters.
@@ -59,54 +67,30 @@ async def sync_voters_db_with_discord(voting_message, proposal, vote, emoji):
         if str(reaction.emoji) == emoji:
             reaction_voting = reaction
             break
-    # Extract all dissenters
-    voters = get_voters_with_vote(proposal, vote)
-    # If the voting reaction is not found, simply remove all voters from DB and exit
-    if not reaction_voting:
-        # Iterate through all voters
-        for voter in proposal.voters:
-            logger.info(f"Removing voter {voter.user_id} from DB for proposal {proposal.id}")
-            # Remove voter from DB
-            await remove_voter(proposal, voter)
-        return
-    # Otherwise, remove only voters whose reaction is not found on the message (i.e. was removed by the voter while the bot was down), and continue
-    for voter in proposal.voters:
-        # Assume the voter didn't react, unless proven so
-        voter_reacted = False
-        # Assume the voter still has permissions to vote, unless proven othewise
-        is_valid_voter = True
-        # For each voter in DB, iterate through the actual voting reactions on the message, to check if the voters reaction is still presented
-        async for user in reaction_voting.users():
-            # If the voter ID matches the user ID found on the message, keep it in DB and switch to the next voter
-            if voter.user_id == user.id:
-                # Mark as "reacted"
-                voter_reacted = True
-                # If the voter doesn't have permissions to vote, remove him from DB
-                if not await validate_roles(user):
-                    is_valid_voter = False
-                break
-        # If voter removed his reaction, or he doesn't have permissions to vote anymore, remove from DB
-        if not voter_reacted or not is_valid_voter:
-            logger.info(f"Removing voter {voter.user_id} from DB for proposal {proposal.id}")
-            await remove_voter(proposal, voter)
-
-    # Add new voters to DB
-    async for reactor in reaction_voting.users():
-        # If anonymous voting, remove reaction unless the reactor is the consensus bot itself (its reactions are kept as a sample)
-        if (
-            reactor
-            and proposal.anonymity_type
-            == ProposalVotingAnonymityType.REVEAL_VOTERS_AT_THE_END.value
-            and reactor.id != BOT_ID
-        ):
-            # Remove reactors emoji from the reaction
-            await reaction_voting.remove(reactor)
-        # Check if the reactor is allowed to participate in voting
-        if not await validate_roles(reactor) or reactor.id == BOT_ID:
-            continue
+
+    # Retrieve the users who reacted and are allowed to vote, by their ids
+    valid_reactors = {}
+    if reaction_voting:
+        async for reactor in reaction_voting.users():
+            # The reactions of the consensus bot itself are kept as a sample
+            if reactor.id == BOT_ID:
+                continue
+            # If anonymous voting, remove reaction
+            if (
+                proposal.anonymity_type
+                == ProposalVotingAnonymityType.REVEAL_VOTERS_AT_THE_END.value
+            ):
+                # Remove reactors emoji from the reaction
+                await reaction_voting.remove(reactor)
+            # Check if the reactor is allowed to participate in voting
+            if await validate_roles(reactor):
+                valid_reactors[reactor.id] = reactor
+
+    author_id = int(proposal.author_id)
+    if author_id in valid_reactors:
         # For objecting votes, cancel the proposal if the voter is the proposer himself
         # Votes against take priority over votes for so they go first (e.g. if a user has voted both for and against a proposal while the bot was down, only the vote against will be counted)
-        if vote == Vote.NO and int(proposal.author_id) == reactor.id:
+        if vote == Vote.NO:
             # cancel_proposal will remove all voters, so we just run it and exit
             logger.debug("The proposer voted against, cancelling")
             # Double check to make sure the proposal wasn't accepted or cancelled while the lock was acquired by other thread
@@ -118,26 +102,41 @@ async def sync_voters_db_with_discord(voting_message, proposal, vote, emoji):
             await cancel_proposal(proposal, ProposalResult.CANCELLED_BY_PROPOSER, voting_message)
             return
         # For supporting votes, don't count the author if he has upvoted, and remove their reaction
-        if vote == Vote.YES and int(proposal.author_id) == reactor.id:
-            await reaction_voting.remove(reactor)
+        if vote == Vote.YES:
+            await reaction_voting.remove(valid_reactors.pop(author_id))
             logger.debug("The author has voted in his own favor, not counting")
-            continue
-        # Attempt to retrieve the voter from DB
-        voter = find_matching_voter(reactor.id, proposal.voting_message_id)
-        # If the voter is not found in DB, add it
-        if not voter:
-            logger.info(
-                f"Adding voter {reactor.id} to DB for proposal {proposal.voting_message_id}"
-            )
-            # Add voter to DB
-            await add_voter(
-                proposal,
-                Voters(
-                    user_id=reactor.id,
-                    voting_message_id=proposal.voting_message_id,
-                    value=vote.value,
-                ),
+
+    # Voters in DB with the given vote, by their ids
+    db_voters = {voter.user_id: voter for voter in get_voters_with_vote(proposal, vote)}
+
+    # Remove voters whose reaction is not found on the message (i.e. was removed by the voter while
+    # the bot was down), or who don't have permissions to vote anymore
+    voters_to_remove = [db_voters[user_id] for user_id in db_voters.keys() - valid_reactors.keys()]
+    # Add new voters
+    voters_to_add = []
+    for user_id in valid_reactors.keys() - db_voters.keys():
+        # If the user has voted differently before, the vote against takes priority (dissenters are
+        # synchronized first, so the vote for is only replaced with the vote against)
+        previous_voter = find_matching_voter(user_id, proposal.voting_message_id)
+        if previous_voter:
+            if vote != Vote.NO:
+                continue
+            voters_to_remove.append(previous_voter)
+        voters_to_add.append(
+            Voters(
+                user_id=user_id,
+                voting_message_id=proposal.voting_message_id,
+                value=vote.value,
             )
+        )
+    if voters_to_add or voters_to_remove:
+        logger.info(
+            "Updating voters of proposal %s: adding %s, removing %s",
+            proposal.voting_message_id,
+            [voter.user_id for voter in voters_to_add],
+            [voter.user_id for voter in voters_to_remove],
+        )
+        await update_voters(proposal, voters_to_add, voters_to_remove)
 
     # When handling objecting votes, cancel the proposal if the threshold is reached
     if vote == Vote.NO:
@@ -159,15 +158,53 @@ async def sync_voters_db_with_discord(voting_message, proposal, vote, emoji):
             )
 
 
+async def recover_proposal(client, proposal):
+    """
+    Synchronizes voters of the proposal with the voting reactions added or removed during the
+    downtime, and schedules its approval unless it was cancelled.
+    """
+    started_at = time.perf_counter()
+    # Lock the proposal to avoid concurrency errors
+    async with lock_proposal(proposal.voting_message_id):
+        # Retrieve the voting message
+        voting_message = await get_message(client, VOTING_CHANNEL_ID, proposal.voting_message_id)
+        logger.info(
+            "Recovery: synchronizing voters of id=%d, voting_message_id=%d",
+            proposal.id,
+            proposal.voting_message_id,
+        )
+        # Update voters that were added or removed during the downtime
+        # Update dissenters
+        await sync_voters_db_with_discord(voting_message, proposal, Vote.NO, EMOJI_VOTING_NO)
+
+        # If the proposal wasn't removed, proceed
+        if is_relevant_proposal(proposal.voting_message_id):
+            # Update supporters, if full consensus is enabled for the proposal
+            if proposal.threshold_positive != THRESHOLD_DISABLED_DB_VALUE:
+                await sync_voters_db_with_discord(
+                    voting_message, proposal, Vote.YES, EMOJI_VOTING_YES
+                )
+
+            schedule_proposal_approval(proposal)
+            logger.info(
+                "Scheduled approval of voting_message_id=%d",
+                proposal.voting_message_id,
+            )
+            logger.debug("Loaded a proposal: %s", proposal)
+    proposal_recovery_stats.add(time.perf_counter() - started_at)
+
+
 @measure_time_async
 async def start_proposals_coroutines(client, pending_grant_proposals):
     """
-    Restores and actualises all active proposals stored in DB. Should run after the client will be initialised.
+    Restores and actualises all active proposals stored in DB. Should run after the client will be
+    initialised. Proposals are recovered concurrently, at most RECOVERY_CONCURRENCY at a time (each
+    proposal requires several requests to Discord API, that are rate limited).
     """
     logger.info("Running approval of the proposals...")
 
     # Check if there are any pending proposals
-    if pending_grant_proposals.count() == 0:
+    if not pending_grant_proposals:
         logger.info("Hooray - no DB recovery is needed!")
         return
 
@@ -181,38 +218,35 @@ async def start_proposals_coroutines(client, pending_grant_proposals):
         )
         await asyncio.sleep(SLEEP_BEFORE_RECOVERY_SECONDS)
 
-        # Additionally, acquire the proposal lock to avoid concurrency errors
-        async with proposal_lock:
-            # Start background tasks to approve pending proposals
-            for proposal in pending_grant_proposals:
-                # Retrieve the voting message
-                voting_message = await get_message(
-                    client, VOTING_CHANNEL_ID, proposal.voting_message_id
-                )
+        started_at = time.perf_counter()
+        proposals_to_recover = list(pending_grant_proposals)
+        semaphore = asyncio.Semaphore(RECOVERY_CONCURRENCY)
+        recovered_count = 0
+
+        async def recover(proposal):
+            nonlocal recovered_count
+            async with semaphore:
+                try:
+                    await recover_proposal(client, proposal)
+                except Exception:
+                    logger.critical(
+                        "Recovery: failed to recover voting_message_id=%d",
+                        proposal.voting_message_id,
+                        exc_info=True,
+                    )
+                recovered_count += 1
                 logger.info(
-                    "Recovery: synchronizing voters of id=%d, voting_message_id=%d",
-                    proposal.id,
-                    proposal.voting_message_id,
-                )
-                # Update voters that were added or removed during the downtime
-                # Update dissenters
-                await sync_voters_db_with_discord(
-                    voting_message, proposal, Vote.NO, EMOJI_VOTING_NO
+                    "Recovery: processed %d/%d proposals",
+                    recovered_count,
+                    len(proposals_to_recover),
                 )
 
-                # If the proposal wasn't removed, proceed
-                if is_relevant_proposal(proposal.voting_message_id):
-                    # Update supporters, if full consensus is enabled for the proposal
-                    if proposal.threshold_positive != THRESHOLD_DISABLED_DB_VALUE:
-                        await sync_voters_db_with_discord(
-                            voting_message, proposal, Vote.YES, EMOJI_VOTING_YES
-                        )
-
-                    client.loop.create_task(approve_proposal(proposal.voting_message_id))
-                    logger.info(
-                        "Added task to event loop to approve voting_message_id=%d",
-                        proposal.voting_message_id,
-                    )
-                    logger.debug("Loaded a proposal: %s", proposal)
+        await asyncio.gather(*[recover(proposal) for proposal in proposals_to_recover])
 
-        logger.info("Recovery has finished!")
+        recovery_duration_stats.add(time.perf_counter() - started_at)
+        logger.info(
+            "Recovery has finished! Recovered %d proposals in %.3f seconds (%s)",
+            len(proposals_to_recover),
+            recovery_duration_stats.total,
+            proposal_recovery_stats,
+        )
@@ -0,0 +1,68 @@
+import unittest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from bot.config.schemas import Base
+from bot.utils.db_utils import DBUtil, enable_sqlite_savepoints
+from bot.utils import proposal_utils
+
+
+def create_test_engine():
+    # A single in-memory connection, shared by the event loop and the DB thread
+    engine = create_engine(
+        'sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    enable_sqlite_savepoints(engine)
+    return engine
+
+
+def clear_proposals():
+    proposal_utils.proposals.clear()
+    proposal_utils.voters_index.clear()
+    proposal_utils.proposals_by_initiating_message.clear()
+
+
+class DBTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Uses in-memory main and history DBs instead of the ones defined in DB_PATH and DB_HISTORY_PATH
+    (the sessions are created the same way as in DBUtil.connect_db), and starts without active
+    proposals. The commits of the main DB are counted in self.commits.
+    """
+
+    # Whether history is kept in the main DB, e.g. when the balances of the main DB are read along
+    # with history
+    shared_history_db = False
+    # Whether the objects are reloaded after commits (DBUtil doesn't expire them)
+    expire_on_commit = False
+
+    def setUp(self):
+        self.engine = create_test_engine()
+        Base.metadata.create_all(self.engine)
+        DBUtil.engine = self.engine
+        DBUtil.session = sessionmaker(bind=self.engine, expire_on_commit=self.expire_on_commit)()
+        if self.shared_history_db:
+            self.engine_history = self.engine
+            DBUtil.session_history = DBUtil.session
+        else:
+            self.engine_history = create_test_engine()
+            Base.metadata.create_all(self.engine_history)
+            DBUtil.session_history = sessionmaker(
+                bind=self.engine_history, expire_on_commit=self.expire_on_commit
+            )()
+        DBUtil.engine_history = self.engine_history
+        self.db = DBUtil()
+        self.commits = 0
+        event.listen(self.engine, "commit", self.count_commit)
+        clear_proposals()
+
+    def tearDown(self):
+        DBUtil.session.close()
+        DBUtil.session_history.close()
+        DBUtil.engine = DBUtil.session = None
+        DBUtil.engine_history = DBUtil.session_history = None
+        clear_proposals()
+
+    def count_commit(self, connection):
+        self.commits += 1
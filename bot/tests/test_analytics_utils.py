@@ -0,0 +1,128 @@
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock, patch
+
+from bot.config.const import ProposalResult
+from bot.config.schemas import (
+    AnalyticsUserStats,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    FreeFundingTransaction,
+    FreeFundingRecipients,
+)
+from bot.utils.analytics_utils import (
+    add_user_stats,
+    get_transaction_user_stats,
+    rebuild_user_stats,
+    verify_user_stats,
+)
+from bot.utils.db_utils import DBUtil
+from bot.utils.proposal_utils import add_proposal, save_proposal_to_history
+from bot.tests.db_test_case import DBTestCase
+from bot.tests.test_proposal_utils import create_proposal
+
+
+@patch("bot.utils.proposal_utils.get_message", AsyncMock(return_value=Mock(jump_url="url")))
+@patch("bot.utils.formatting_utils.get_nickname_by_id_or_mention", AsyncMock(return_value="user"))
+class TestUserStats(DBTestCase):
+    async def save_proposal(self, voting_message_id, result, recipients=()):
+        proposal = create_proposal(voting_message_id, voters=[2, 3])
+        if recipients:
+            proposal.not_financial = False
+            proposal.total_amount = 10 * len(recipients)
+            proposal.finance_recipients.append(
+                FinanceRecipients(
+                    amount=10,
+                    recipients=[
+                        FinanceRecipientUsers(user_id=user_id, user_nickname=nickname)
+                        for user_id, nickname in recipients
+                    ],
+                )
+            )
+        await add_proposal(proposal, self.db)
+        await save_proposal_to_history(self.db, proposal, result)
+
+    async def send_transaction(self, author_id, amount, recipients):
+        transaction = FreeFundingTransaction(
+            author_id=author_id,
+            author_nickname=f"user{author_id}",
+            total_amount=amount * len(recipients),
+            description="Thanks",
+            submitted_at=datetime(2023, 3, 1),
+            message_url="url",
+        )
+        for user_id in recipients:
+            transaction.recipients.append(
+                FreeFundingRecipients(user_id=user_id, user_nickname=f"user{user_id}", amount=amount)
+            )
+        # The same way as in send_transaction
+        async with self.db.transaction(is_history=True) as session:
+            session.add(transaction)
+            await self.db.run_in_db_thread(
+                add_user_stats, session, get_transaction_user_stats(transaction)
+            )
+
+    def get_user_stats(self):
+        return {
+            stats.user_id: stats for stats in DBUtil.session_history.query(AnalyticsUserStats)
+        }
+
+    async def test_stats_are_updated_with_history(self):
+        await self.save_proposal(100, ProposalResult.ACCEPTED, [(4, "user4"), (5, "user5")])
+        await self.save_proposal(200, ProposalResult.CANCELLED_BY_PROPOSER, [(4, "user4")])
+        await self.send_transaction(4, 0.5, [2, 5])
+        await self.send_transaction(4, 0.25, [5])
+
+        user_stats = self.get_user_stats()
+        self.assertEqual(sorted(user_stats), [1, 2, 3, 4, 5])
+        author = user_stats[1]
+        self.assertEqual((author.submitted_proposals, author.accepted_proposals), (2, 1))
+        self.assertEqual(author.accepted_amount, 20)
+        self.assertEqual((user_stats[2].votes, user_stats[2].tips_received), (2, 0.5))
+        # Grants of the cancelled proposal aren't received
+        self.assertEqual((user_stats[4].tips_sent, user_stats[4].grants_received), (2, 10))
+        self.assertEqual((user_stats[5].tips_received, user_stats[5].grants_received), (0.75, 10))
+        self.assertEqual(user_stats[5].user_nickname, "user5")
+        # The incremental stats are the same as the ones computed from the whole history
+        self.assertEqual(verify_user_stats(DBUtil.session_history), [])
+
+    async def test_rebuild_fixes_mismatches(self):
+        await self.save_proposal(100, ProposalResult.ACCEPTED, [(4, "user4")])
+        user_stats = self.get_user_stats()
+        user_stats[2].votes = 5
+        DBUtil.session_history.delete(user_stats[4])
+        DBUtil.session_history.commit()
+
+        mismatches = verify_user_stats(DBUtil.session_history)
+        self.assertEqual([user_id for user_id, _, _ in mismatches], [2, 4])
+        self.assertIsNone(mismatches[1][1])
+
+        rebuild_user_stats(DBUtil.session_history)
+        DBUtil.session_history.commit()
+        self.assertEqual(verify_user_stats(DBUtil.session_history), [])
+        # The rows were replaced, so the objects loaded before are outdated
+        DBUtil.session_history.expire_all()
+        self.assertEqual(self.get_user_stats()[2].votes, 1)
+
+    async def test_unknown_amounts_are_counted_as_zero(self):
+        # A legacy transaction, whose total amount was unknown when the recipients were normalized
+        transaction = FreeFundingTransaction(
+            author_id=4, total_amount=None, submitted_at=datetime(2023, 3, 1)
+        )
+        transaction.recipients.append(FreeFundingRecipients(user_id=3, amount=None))
+        async with self.db.transaction(is_history=True) as session:
+            session.add(transaction)
+            await self.db.run_in_db_thread(
+                add_user_stats, session, get_transaction_user_stats(transaction)
+            )
+        self.assertEqual(self.get_user_stats()[3].tips_received, 0)
+        self.assertEqual(verify_user_stats(DBUtil.session_history), [])
+
+        rebuild_user_stats(DBUtil.session_history)
+        DBUtil.session_history.commit()
+        DBUtil.session_history.expire_all()
+        self.assertEqual(self.get_user_stats()[3].tips_received, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from bot.utils import discord_utils
+from bot.utils.cache import LRUCache
+from bot.utils.discord_utils import (
+    get_user_by_id,
+    get_message,
+    cache_messages,
+    forget_messages,
+    invalidate_message,
+)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        # Use the first key so that the second one becomes the least recently used
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(cache.get(1), "a")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), "c")
+
+    def test_expired_item_is_removed(self):
+        cache = LRUCache(2, ttl_seconds=10)
+        with patch("bot.utils.cache.time.monotonic", return_value=100):
+            cache.set(1, "a")
+        with patch("bot.utils.cache.time.monotonic", return_value=105):
+            self.assertEqual(cache.get(1), "a")
+        with patch("bot.utils.cache.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats["expired"], 1)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = Mock(guilds=[])
+        self.user = Mock(name="user")
+
+        async def fetch_user(user_id):
+            await asyncio.sleep(0.01)
+            return self.user
+
+        self.client.fetch_user = AsyncMock(side_effect=fetch_user)
+        self.previous_client = discord_utils.client
+        discord_utils.client = self.client
+        discord_utils.user_cache.clear()
+        discord_utils.user_lookup_stats.clear()
+
+    def tearDown(self):
+        discord_utils.client = self.previous_client
+        discord_utils.user_cache.clear()
+        discord_utils.user_lookup_stats.clear()
+
+    async def test_member_cache_is_used_first(self):
+        member = Mock()
+        self.client.guilds = [Mock(get_member=Mock(return_value=member))]
+        self.assertIs(await get_user_by_id(1), member)
+        self.client.fetch_user.assert_not_called()
+
+    async def test_fetched_user_is_cached(self):
+        self.assertIs(await get_user_by_id(1), self.user)
+        self.assertIs(await get_user_by_id(1), self.user)
+        self.assertEqual(self.client.fetch_user.await_count, 1)
+        self.assertEqual(discord_utils.user_lookup_stats["cache"], 1)
+
+    async def test_concurrent_lookups_are_coalesced(self):
+        users = await asyncio.gather(*[get_user_by_id(1) for _ in range(5)])
+        self.assertTrue(all(user is self.user for user in users))
+        self.assertEqual(self.client.fetch_user.await_count, 1)
+        self.assertEqual(discord_utils.user_lookup_stats["coalesced"], 4)
+
+    async def test_failed_lookup_is_not_cached(self):
+        self.client.fetch_user.side_effect = ValueError()
+        with self.assertRaises(ValueError):
+            await get_user_by_id(1)
+        self.assertNotIn(1, discord_utils.user_cache)
+        self.assertEqual(discord_utils.user_lookups_in_flight, {})
+
+    async def test_cancelled_lookup_does_not_block_coalesced_ones(self):
+        first = asyncio.create_task(get_user_by_id(1))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(get_user_by_id(1))
+        await asyncio.sleep(0)
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await asyncio.wait_for(second, 1)
+        self.assertTrue(first.cancelled())
+        self.assertEqual(discord_utils.user_lookups_in_flight, {})
+        # The next lookup fetches the user again
+        self.assertIs(await get_user_by_id(1), self.user)
+
+
+class TestMessageCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.channel = Mock()
+        self.channel.fetch_message = AsyncMock(side_effect=lambda message_id: Mock(id=message_id))
+        self.client = Mock(get_channel=Mock(return_value=self.channel))
+        discord_utils.message_cache.clear()
+        discord_utils.cacheable_message_ids.clear()
+
+    def tearDown(self):
+        discord_utils.message_cache.clear()
+        discord_utils.cacheable_message_ids.clear()
+
+    async def test_only_messages_of_proposals_are_cached(self):
+        cache_messages(1)
+        first = await get_message(self.client, 10, 1)
+        self.assertIs(await get_message(self.client, 10, 1), first)
+        await get_message(self.client, 10, 2)
+        await get_message(self.client, 10, 2)
+        self.assertEqual(self.channel.fetch_message.await_count, 3)
+
+    async def test_invalidated_message_is_fetched(self):
+        cache_messages(1)
+        first = await get_message(self.client, 10, 1)
+        invalidate_message(1)
+        self.assertIsNot(await get_message(self.client, 10, 1), first)
+        self.assertEqual(self.channel.fetch_message.await_count, 2)
+
+    async def test_forgotten_message_is_not_cached(self):
+        cache_messages(1)
+        await get_message(self.client, 10, 1)
+        forget_messages(1)
+        self.assertEqual(len(discord_utils.message_cache), 0)
+        await get_message(self.client, 10, 1)
+        self.assertEqual(len(discord_utils.message_cache), 0)
+
+    async def test_cache_can_be_disabled(self):
+        cache_messages(1)
+        with patch.object(discord_utils, "MESSAGE_CACHE_ENABLED", False):
+            await get_message(self.client, 10, 1)
+            await get_message(self.client, 10, 1)
+        self.assertEqual(self.channel.fetch_message.await_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
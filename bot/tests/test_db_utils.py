@@ -0,0 +1,376 @@
+import asyncio
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, Mock, patch
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from bot.config.const import Vote, ProposalResult
+from bot.config.schemas import (
+    Proposals,
+    ProposalHistory,
+    Voters,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    FreeFundingBalance,
+    FreeFundingTransaction,
+    Seasons,
+)
+from bot.utils.db_utils import DBUtil
+from bot.utils.proposal_utils import (
+    add_proposal,
+    add_voter,
+    remove_voter,
+    get_history_nicknames,
+    save_proposal_to_history,
+)
+from bot.tests.db_test_case import DBTestCase
+from bot.tests.test_proposal_utils import create_proposal
+
+
+class TestTransaction(DBTestCase):
+    async def test_vote_is_saved_in_one_commit(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+
+        self.commits = 0
+        voter = Voters(user_id=5, voting_message_id=100, value=Vote.YES.value)
+        await add_voter(proposal, voter)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(DBUtil.session.query(Voters).count(), 1)
+
+        self.commits = 0
+        await remove_voter(proposal, voter)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(DBUtil.session.query(Voters).count(), 0)
+
+    async def test_proposal_is_saved_with_recipients(self):
+        proposal = create_proposal(100)
+        proposal.finance_recipients.append(
+            FinanceRecipients(
+                amount=10,
+                recipients=[
+                    FinanceRecipientUsers(user_id=1, user_nickname="user, 1"),
+                    FinanceRecipientUsers(user_id=2, user_nickname="user2"),
+                ],
+            )
+        )
+        await self.db.add(proposal)
+        self.assertEqual(self.commits, 1)
+        recipient = DBUtil.session.query(FinanceRecipients).one()
+        self.assertEqual(recipient.proposal_id, proposal.id)
+        self.assertEqual(recipient.recipient_ids, [1, 2])
+        self.assertEqual(recipient.recipient_nicknames, ["user, 1", "user2"])
+
+    async def test_rollback_on_error(self):
+        with self.assertRaises(ValueError):
+            async with self.db.transaction() as session:
+                session.add(create_proposal(100))
+                raise ValueError()
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(DBUtil.session.query(Proposals).count(), 0)
+
+    async def test_rollback_reloads_expired_objects(self):
+        proposal = create_proposal(100, voters=[2])
+        await self.db.add(proposal)
+        with self.assertRaises(ValueError):
+            async with self.db.transaction():
+                proposal.description = "Changed"
+                raise ValueError()
+
+        # The proposal is reloaded in the DB thread, so reading it doesn't query DB
+        queries = []
+        event.listen(self.engine, "before_cursor_execute", queries.append)
+        self.assertEqual(proposal.description, "Test proposal")
+        self.assertEqual([voter.user_id for voter in proposal.voters], [2])
+        self.assertEqual(queries, [])
+
+    async def test_queries_run_in_db_thread(self):
+        await self.db.add(create_proposal(100))
+        threads = []
+        event.listen(
+            self.engine,
+            "before_cursor_execute",
+            lambda *args: threads.append(threading.current_thread().name),
+        )
+
+        proposals = await self.db.filter(
+            Proposals, is_history=False, condition=Proposals.voting_message_id == 100
+        )
+        rows = await self.db.query(Proposals.voting_message_id, is_history=False)
+
+        self.assertEqual([proposal.voting_message_id for proposal in proposals], [100])
+        self.assertEqual(rows, [(100,)])
+        self.assertTrue(threads)
+        self.assertTrue(all(thread.startswith("db") for thread in threads))
+
+    @patch("bot.utils.proposal_utils.get_message", AsyncMock(return_value=Mock(jump_url="url")))
+    async def test_history_is_saved_in_one_commit(self):
+        history_commits = []
+        event.listen(self.engine_history, "commit", history_commits.append)
+        proposal = create_proposal(100, voters=[2, 3])
+        # The nickname of the first voter was saved when voting
+        proposal.voters[0].user_nickname = "voter"
+        proposal.finance_recipients.append(
+            FinanceRecipients(
+                amount=10, recipients=[FinanceRecipientUsers(user_id=4, user_nickname="recipient")]
+            )
+        )
+        await add_proposal(proposal, self.db)
+
+        get_nickname = AsyncMock(return_value="user")
+        with patch("bot.utils.formatting_utils.get_nickname_by_id_or_mention", get_nickname):
+            await save_proposal_to_history(self.db, proposal, ProposalResult.ACCEPTED)
+
+        # Only the nicknames of the author and the second voter are retrieved
+        self.assertEqual(sorted(call.args[0] for call in get_nickname.await_args_list), [1, 3])
+        self.assertEqual(len(history_commits), 1)
+        history_item = DBUtil.session_history.query(ProposalHistory).one()
+        history_voters = DBUtil.session_history.query(Voters).all()
+        self.assertEqual(len(history_voters), 2)
+        self.assertTrue(all(voter.proposal_id == history_item.id for voter in history_voters))
+        self.assertEqual(
+            {voter.user_id: voter.user_nickname for voter in history_voters}, {2: "voter", 3: "user"}
+        )
+        history_recipient = DBUtil.session_history.query(FinanceRecipients).one()
+        self.assertEqual(history_recipient.proposal_id, history_item.id)
+        history_recipient_user = DBUtil.session_history.query(FinanceRecipientUsers).one()
+        self.assertEqual(history_recipient_user.finance_recipient_id, history_recipient.id)
+        self.assertEqual(history_recipient_user.user_id, 4)
+        # The proposal is removed from the main DB along with its voters and recipients
+        self.assertEqual(DBUtil.session.query(Voters).count(), 0)
+        self.assertEqual(DBUtil.session.query(FinanceRecipientUsers).count(), 0)
+
+    async def test_history_uses_data_retrieved_before_locking(self):
+        proposal = create_proposal(100, voters=[2])
+        await add_proposal(proposal, self.db)
+        get_nickname = AsyncMock(return_value="user")
+        get_message = AsyncMock()
+        with patch("bot.utils.formatting_utils.get_nickname_by_id_or_mention", get_nickname), patch(
+            "bot.utils.proposal_utils.get_message", get_message
+        ):
+            nicknames = await get_history_nicknames(proposal)
+            # A voter was added after the nicknames were retrieved
+            await add_voter(proposal, Voters(user_id=3, voting_message_id=100, value=Vote.NO.value))
+            get_nickname.reset_mock()
+            await save_proposal_to_history(
+                self.db,
+                proposal,
+                ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD,
+                voting_message=Mock(jump_url="url"),
+                nicknames=nicknames,
+            )
+
+        # Only the nickname of the new voter is retrieved while saving
+        self.assertEqual([call.args[0] for call in get_nickname.await_args_list], [3])
+        get_message.assert_not_awaited()
+        history_item = DBUtil.session_history.query(ProposalHistory).one()
+        self.assertEqual(history_item.voting_message_url, "url")
+
+    async def test_bulk_insert(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        self.commits = 0
+
+        rows = [
+            {"user_id": user_id, "voting_message_id": 100, "value": Vote.NO.value}
+            for user_id in range(3)
+        ]
+        self.assertIsNone(await self.db.bulk_insert(Voters, rows))
+        ids = await self.db.bulk_insert(Voters, rows, return_ids=True)
+        self.assertEqual(self.commits, 2)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(DBUtil.session.query(Voters).count(), 6)
+        self.assertEqual(await self.db.bulk_insert(Voters, [], return_ids=True), [])
+
+
+class TestWriteBehind(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        DBUtil.write_behind = True
+
+    def tearDown(self):
+        DBUtil.write_behind = False
+        DBUtil.pending_operations = 0
+        super().tearDown()
+
+    async def add_voters(self, proposal, count):
+        for user_id in range(count):
+            await add_voter(
+                proposal, Voters(user_id=user_id, voting_message_id=100, value=Vote.NO.value)
+            )
+
+    async def test_votes_are_committed_in_group(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        self.commits = 0
+
+        await self.add_voters(proposal, 10)
+        self.assertEqual(self.commits, 0)
+        self.assertEqual(DBUtil.pending_operations, 10)
+
+        await DBUtil.group_commit_task
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(DBUtil.pending_operations, 0)
+
+    async def test_group_is_committed_when_full(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        self.commits = 0
+
+        with patch("bot.utils.db_utils.DB_GROUP_COMMIT_MAX_OPERATIONS", 5):
+            await self.add_voters(proposal, 5)
+        self.assertEqual(self.commits, 1)
+
+    async def test_flush_is_a_durability_barrier(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        await self.add_voters(proposal, 3)
+        self.commits = 0
+
+        await self.db.flush()
+        self.assertEqual(self.commits, 1)
+        self.assertEqual(DBUtil.pending_operations, 0)
+        # Nothing is left for the scheduled group commit
+        await DBUtil.group_commit_task
+        self.assertEqual(self.commits, 1)
+
+    async def test_failed_block_keeps_pending_operations(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        await self.add_voters(proposal, 2)
+
+        with self.assertRaises(ValueError):
+            async with self.db.transaction(write_behind=True):
+                proposal.voters.append(
+                    Voters(user_id=9, voting_message_id=100, value=Vote.NO.value)
+                )
+                proposal.description = "Changed"
+                raise ValueError()
+
+        # Only the changes of the failed block are rolled back
+        self.assertEqual([voter.user_id for voter in proposal.voters], [0, 1])
+        self.assertEqual(proposal.description, "Test proposal")
+        self.assertEqual(DBUtil.pending_operations, 2)
+        await self.db.flush()
+        self.assertEqual(DBUtil.session.query(Voters).count(), 2)
+
+    async def test_failed_transaction_keeps_pending_operations(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        await self.add_voters(proposal, 2)
+
+        with self.assertRaises(ValueError):
+            async with self.db.transaction() as session:
+                session.add(create_proposal(200))
+                raise ValueError()
+
+        self.assertEqual(DBUtil.pending_operations, 2)
+        await self.db.flush()
+        self.assertEqual(DBUtil.session.query(Proposals).count(), 1)
+        self.assertEqual(DBUtil.session.query(Voters).count(), 2)
+
+
+class TestFreeFundingBalances(DBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queries = 0
+        event.listen(self.engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        DBUtil.free_funding_balances = {}
+        super().tearDown()
+
+    def count_query(self, *args):
+        self.queries += 1
+
+    async def test_balances_are_read_from_memory(self):
+        DBUtil.session.add_all(
+            [
+                FreeFundingBalance(author_id=1, author_nickname="user1", balance=100),
+                FreeFundingBalance(author_id=2, author_nickname="user2", balance=50),
+            ]
+        )
+        DBUtil.session.commit()
+        self.db.load_free_funding_balances()
+
+        self.queries = 0
+        self.assertEqual(self.db.get_user_free_funding_balance(2).balance, 50)
+        self.assertIsNone(self.db.get_user_free_funding_balance(3))
+        self.assertEqual(self.queries, 0)
+
+    async def test_added_balance_is_written_through(self):
+        self.db.load_free_funding_balances()
+        balance = FreeFundingBalance(author_id=1, author_nickname="user1", balance=100)
+
+        self.assertIs(await self.db.add_free_funding_balance(balance), balance)
+        self.assertIs(self.db.get_user_free_funding_balance(1), balance)
+        self.assertEqual(DBUtil.session.query(FreeFundingBalance).count(), 1)
+
+        # A balance added concurrently for the same user is not saved
+        duplicate = FreeFundingBalance(author_id=1, author_nickname="user1", balance=100)
+        self.assertIs(await self.db.add_free_funding_balance(duplicate), balance)
+        self.assertEqual(DBUtil.session.query(FreeFundingBalance).count(), 1)
+
+    async def test_concurrent_debits_dont_overspend(self):
+        balance = await self.db.add_free_funding_balance(
+            FreeFundingBalance(author_id=1, author_nickname="user1", balance=100)
+        )
+
+        results = await asyncio.gather(
+            *[self.db.debit_free_funding_balance(balance, 40) for _ in range(3)]
+        )
+
+        self.assertEqual(sorted(results), [False, True, True])
+        self.assertEqual(balance.balance, 20)
+        await self.db.save()
+        DBUtil.session.expire_all()
+        self.assertEqual(DBUtil.session.query(FreeFundingBalance).one().balance, 20)
+
+    async def test_author_id_is_unique(self):
+        DBUtil.session.add_all(
+            [
+                FreeFundingBalance(author_id=1, balance=100),
+                FreeFundingBalance(author_id=1, balance=100),
+            ]
+        )
+        with self.assertRaises(IntegrityError):
+            DBUtil.session.commit()
+        DBUtil.session.rollback()
+
+
+class TestFirstSeason(DBTestCase):
+    def get_seasons(self):
+        return [season.started_at for season in DBUtil.session_history.query(Seasons)]
+
+    def test_first_season_starts_with_history(self):
+        for day in (3, 2):
+            DBUtil.session_history.add(
+                FreeFundingTransaction(author_id=1, submitted_at=datetime(2023, 1, day))
+            )
+        proposal = create_proposal(100)
+        proposal.submitted_at = datetime(2023, 1, 4)
+        DBUtil.session_history.add(proposal)
+        DBUtil.session_history.commit()
+
+        self.db.start_first_season()
+        self.db.start_first_season()
+        self.assertEqual(self.get_seasons(), [datetime(2023, 1, 2)])
+
+    def test_first_season_of_empty_history_starts_now(self):
+        started_at = datetime.utcnow()
+        self.db.start_first_season()
+        self.assertEqual(len(self.get_seasons()), 1)
+        self.assertGreaterEqual(self.get_seasons()[0], started_at)
+
+    def test_existing_seasons_are_kept(self):
+        DBUtil.session_history.add(Seasons(started_at=datetime(2023, 4, 1)))
+        DBUtil.session_history.commit()
+        self.db.start_first_season()
+        self.assertEqual(self.get_seasons(), [datetime(2023, 4, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
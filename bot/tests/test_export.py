@@ -0,0 +1,468 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+
+import openpyxl
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from bot.config.const import ProposalResult, Vote, FREE_FUNDING_LIMIT_PERSON_PER_SEASON
+from bot.config.schemas import (
+    Base,
+    ProposalHistory,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    FreeFundingTransaction,
+    FreeFundingRecipients,
+    FreeFundingBalance,
+    Voters,
+    Seasons,
+)
+from bot import export
+from bot.export import (
+    write_user_grants_recieved,
+    write_user_activity,
+    write_lazy_consensus_history,
+)
+from bot.utils.analytics_utils import rebuild_user_stats
+from bot.utils.db_utils import DBUtil, create_sqlite_engine
+from bot.tests.db_test_case import DBTestCase
+
+
+async def write_page(writer):
+    """
+    Writes a page in a write-only workbook (as the export does), and returns the page read back from
+    the saved document.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    await writer(workbook.create_sheet(title="Page"))
+    document = io.BytesIO()
+    workbook.save(document)
+    return openpyxl.load_workbook(document)["Page"]
+
+
+def get_rows(page):
+    return [[cell.value for cell in row] for row in page.iter_rows(min_row=2)]
+
+
+class ExportTestCase(DBTestCase):
+    # The balances of the main DB are exported along with history
+    shared_history_db = True
+    # History rows are added directly (e.g. recipients by proposal_id rather than through the
+    # relationship), so the objects are reloaded after commits, as if the export used a new session
+    expire_on_commit = True
+
+    def setUp(self):
+        super().setUp()
+        self.session = DBUtil.session_history
+
+    def rebuild_stats(self):
+        # History is added directly in tests, so the analytics are recomputed from it
+        rebuild_user_stats(self.session)
+        self.session.commit()
+
+    def add_transaction(self, amount, recipients, submitted_at=None):
+        """
+        Adds a free funding transaction of the given amount to each of the recipients - (user_id,
+        user_nickname) pairs.
+        """
+        transaction = FreeFundingTransaction(
+            author_id=1,
+            author_nickname="author",
+            total_amount=amount * len(recipients),
+            description="Thanks",
+            submitted_at=submitted_at or datetime(2023, 3, 1),
+            message_url="url",
+        )
+        for user_id, user_nickname in recipients:
+            transaction.recipients.append(
+                FreeFundingRecipients(user_id=user_id, user_nickname=user_nickname, amount=amount)
+            )
+        self.session.add(transaction)
+        self.session.commit()
+        return transaction
+
+    def add_history_item(self, result, amount, recipients, closed_at=None):
+        """
+        Adds a financial proposal to history, granting the amount to each of the recipients.
+        """
+        history_item = ProposalHistory(
+            author_id=1,
+            author_nickname="author",
+            description="Proposal",
+            closed_at=closed_at or datetime(2023, 3, 1),
+            not_financial=False,
+            total_amount=amount * len(recipients),
+            result=result.value,
+            voting_message_url="url",
+        )
+        self.session.add(history_item)
+        self.session.flush()
+        # History items can't be assigned to the relationship of recipients (see save_proposal_to_history)
+        self.session.add(
+            FinanceRecipients(
+                proposal_id=history_item.id,
+                amount=amount,
+                recipients=[
+                    FinanceRecipientUsers(user_id=user_id, user_nickname=user_nickname)
+                    for user_id, user_nickname in recipients
+                ],
+            )
+        )
+        self.session.commit()
+        return history_item
+
+
+class TestUserGrantsReceived(ExportTestCase):
+    async def test_amounts_are_summed_by_user(self):
+        # Nicknames containing the list separator are kept as they are
+        self.add_transaction(10, [(2, "user, 2"), (3, "user3")])
+        self.add_transaction(5, [(2, "user, 2")])
+        self.add_history_item(ProposalResult.ACCEPTED, 100, [(2, "user, 2"), (4, "user4")])
+        self.add_history_item(ProposalResult.CANCELLED_BY_PROPOSER, 1000, [(3, "user3")])
+        self.rebuild_stats()
+
+        page = await write_page(write_user_grants_recieved)
+
+        self.assertEqual(
+            get_rows(page),
+            [["user, 2", 15, 100], ["user3", 10, 0], ["user4", 0, 100]],
+        )
+
+
+class TestUserActivity(ExportTestCase):
+    def add_users_activity(self, users):
+        for user_id in range(2, users + 2):
+            nickname = f"user{user_id}"
+            history_item = self.add_history_item(
+                ProposalResult.ACCEPTED, 10, [(1, "author")], closed_at=datetime(2023, 3, user_id)
+            )
+            history_item.author_id = user_id
+            history_item.author_nickname = nickname
+            self.add_history_item(ProposalResult.CANCELLED_BY_PROPOSER, 10, [(1, "author")])
+            self.session.add(
+                Voters(
+                    user_id=user_id,
+                    user_nickname=nickname,
+                    proposal_id=history_item.id,
+                    value=Vote.NO.value,
+                )
+            )
+        self.session.commit()
+        self.rebuild_stats()
+
+    async def test_activity_of_users(self):
+        self.add_users_activity(2)
+        self.session.add(FreeFundingBalance(author_id=2, author_nickname="user2", balance=10))
+        self.session.commit()
+
+        page = await write_page(write_user_activity)
+
+        self.assertEqual(
+            get_rows(page),
+            [
+                # The author of the cancelled proposals
+                ["author", str(FREE_FUNDING_LIMIT_PERSON_PER_SEASON), 0, 2, 0],
+                ["user2", "10", 1, 1, 1],
+                ["user3", str(FREE_FUNDING_LIMIT_PERSON_PER_SEASON), 1, 1, 1],
+            ],
+        )
+
+    async def test_number_of_queries_doesnt_depend_on_users(self):
+        queries = []
+        event.listen(self.engine, "before_cursor_execute", lambda *args: queries.append(args))
+        self.add_users_activity(1)
+        queries.clear()
+        await write_page(write_user_activity)
+        queries_for_one_user = len(queries)
+
+        self.add_users_activity(20)
+        queries.clear()
+        page = await write_page(write_user_activity)
+
+        self.assertEqual(len(queries), queries_for_one_user)
+        # The users and the author of the cancelled proposals
+        self.assertEqual(len(get_rows(page)), 21)
+
+
+class TestLazyConsensusHistory(ExportTestCase):
+    def add_recipients(self, history_item, amount, recipients):
+        self.session.add(
+            FinanceRecipients(
+                proposal_id=history_item.id,
+                amount=amount,
+                recipients=[
+                    FinanceRecipientUsers(user_id=user_id, user_nickname=user_nickname)
+                    for user_id, user_nickname in recipients
+                ],
+            )
+        )
+        self.session.commit()
+
+    async def test_recipient_groups_are_merged_rows(self):
+        history_item = self.add_history_item(ProposalResult.ACCEPTED, 10, [(2, "user2")])
+        self.add_recipients(history_item, 20, [(3, "user3"), (4, "user4")])
+        history_item.total_amount = 50
+        self.add_history_item(
+            ProposalResult.ACCEPTED, 5, [(2, "user2")], closed_at=datetime(2023, 3, 2)
+        )
+        self.add_history_item(ProposalResult.CANCELLED_BY_PROPOSER, 1000, [(3, "user3")])
+
+        page = await write_page(write_lazy_consensus_history)
+
+        date = "2023-03-01 00:00:00"
+        self.assertEqual(
+            get_rows(page),
+            [
+                ["url", date, "author", "user2", "10", 50, "Proposal"],
+                [None, None, None, "user3, user4", "20", None, None],
+                ["url", "2023-03-02 00:00:00", "author", "user2", "5", 5, "Proposal"],
+            ],
+        )
+        self.assertEqual(
+            sorted(str(cell_range) for cell_range in page.merged_cells.ranges),
+            ["A2:A3", "B2:B3", "C2:C3", "F2:F3", "G2:G3"],
+        )
+        self.assertEqual(page["A2"].hyperlink.target, "url")
+        # The bottom border is drawn after the last row of each proposal
+        self.assertIsNone(page["D2"].border.bottom)
+        self.assertEqual(page["D3"].border.bottom.style, "thin")
+        self.assertEqual(page["D3"].border.right.style, "dotted")
+
+    async def test_number_of_queries_doesnt_depend_on_batches(self):
+        for day in range(1, 6):
+            self.add_history_item(
+                ProposalResult.ACCEPTED, 10, [(2, "user2")], closed_at=datetime(2023, 3, day)
+            )
+        queries = []
+
+        def count_query(connection, cursor, statement, *args):
+            # Transactions are begun with separate statements
+            if statement.startswith("SELECT"):
+                queries.append(statement)
+
+        event.listen(self.engine, "before_cursor_execute", count_query)
+
+        with patch("bot.export.EXPORT_QUERY_BATCH_SIZE", 2):
+            page = await write_page(write_lazy_consensus_history)
+
+        self.assertEqual(len(get_rows(page)), 5)
+        # The proposals, and the recipients with their users for each of the 3 batches
+        self.assertEqual(len(queries), 1 + 3 * 2)
+
+
+
+class TestExportPeriod(ExportTestCase):
+    def add_transactions(self):
+        for day in (1, 2, 3):
+            self.add_transaction(day, [(2, "user2")], submitted_at=datetime(2023, 3, day, 12))
+        for day in (1, 3):
+            self.add_history_item(
+                ProposalResult.ACCEPTED, 100 * day, [(3, "user3")], closed_at=datetime(2023, 3, day)
+            )
+
+    async def test_dates(self):
+        self.assertEqual(await export.get_export_period(()), (None, None))
+        self.assertEqual(
+            await export.get_export_period(("2023-03-01",)), (datetime(2023, 3, 1), None)
+        )
+        # The last date is included
+        self.assertEqual(
+            await export.get_export_period(("2023-03-01", "2023-03-02")),
+            (datetime(2023, 3, 1), datetime(2023, 3, 3)),
+        )
+        for args in (("2023-03-02", "2023-03-01"), ("yesterday",), ("2023-03-01",) * 3):
+            with self.assertRaisesRegex(ValueError, "To export a period"):
+                await export.get_export_period(args)
+
+    async def test_seasons(self):
+        with self.assertRaisesRegex(ValueError, "season was not found"):
+            await export.get_export_period(("season",))
+        self.session.add_all(
+            [Seasons(started_at=datetime(2023, 1, 1)), Seasons(started_at=datetime(2023, 4, 1))]
+        )
+        self.session.commit()
+
+        # The current season
+        self.assertEqual(
+            await export.get_export_period(("season",)), (datetime(2023, 4, 1), None)
+        )
+        self.assertEqual(
+            await export.get_export_period(("Season", "1")),
+            (datetime(2023, 1, 1), datetime(2023, 4, 1)),
+        )
+        with self.assertRaisesRegex(ValueError, "season was not found"):
+            await export.get_export_period(("season", "3"))
+        with self.assertRaisesRegex(ValueError, "To export a period"):
+            await export.get_export_period(("season", "first"))
+
+    async def test_pages_of_period(self):
+        self.add_transactions()
+        self.rebuild_stats()
+        since, until = datetime(2023, 3, 2), datetime(2023, 3, 4)
+
+        page = await write_page(lambda page: write_user_grants_recieved(page, since, until))
+        self.assertEqual(get_rows(page), [["user2", 5, 0], ["user3", 0, 300]])
+        page = await write_page(
+            lambda page: export.write_free_funding_transactions(page, since, until)
+        )
+        self.assertEqual(
+            [row[1] for row in get_rows(page)], ["2023-03-02 12:00:00", "2023-03-03 12:00:00"]
+        )
+        page = await write_page(lambda page: write_lazy_consensus_history(page, since, until))
+        self.assertEqual([row[5] for row in get_rows(page)], [300])
+        # The current balances don't belong to the period, so only the users active in it are listed
+        self.session.add(FreeFundingBalance(author_id=5, author_nickname="user5", balance=10))
+        self.session.commit()
+        page = await write_page(lambda page: write_user_activity(page, since, until))
+        self.assertEqual(page["B1"].value, "Tips sent")
+        self.assertEqual(get_rows(page), [["author", 2, 1, 1, 0]])
+        page = await write_page(lambda page: export.write_summary(page, since, until))
+        self.assertEqual(
+            get_rows(page),
+            [
+                ["Total tips sent:", 5],
+                ["Total points given with full consensus:", 300],
+                ["Total number of accepted proposals:", 1],
+                ["Total number of submitted proposals:", 1],
+            ],
+        )
+        self.assertEqual(page["B1"].value, "2023-03-02 - 2023-03-03")
+        self.assertEqual(
+            export.get_export_filename(since, until), "analytics_2023-03-02_2023-03-03.xlsx"
+        )
+
+        # The whole history uses the precomputed statistics
+        page = await write_page(write_user_grants_recieved)
+        self.assertEqual(get_rows(page), [["user2", 6, 0], ["user3", 0, 400]])
+
+
+class TestExportProcess(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        export.export_tasks.clear()
+        export.export_cooldowns.clear()
+
+    def tearDown(self):
+        export.export_tasks.clear()
+        export.export_cooldowns.clear()
+
+    def test_document_is_built_with_read_only_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ("main.db", "history.db")]
+            for path in paths:
+                engine = create_sqlite_engine(path)
+                Base.metadata.create_all(engine)
+                engine.dispose()
+
+            export.init_export_process(*paths)
+            try:
+                document = export.build_export_document()
+                workbook = openpyxl.load_workbook(io.BytesIO(document))
+                self.assertIn("L3 Activity", workbook.sheetnames)
+                with self.assertRaisesRegex(OperationalError, "readonly"):
+                    DBUtil.session.add(FreeFundingBalance(author_id=1, balance=1))
+                    DBUtil.session.commit()
+            finally:
+                DBUtil.session.close()
+                DBUtil.session_history.close()
+                DBUtil.engine.dispose()
+                DBUtil.engine_history.dispose()
+                export.export_loop.close()
+                DBUtil.engine = DBUtil.session = None
+                DBUtil.engine_history = DBUtil.session_history = None
+
+    async def test_concurrent_requests_share_one_build(self):
+        build_started = asyncio.Event()
+        finish_build = asyncio.Event()
+
+        async def export_in_process(since=None, until=None):
+            build_started.set()
+            await finish_build.wait()
+            return b"document"
+
+        export_mock = AsyncMock(side_effect=export_in_process)
+        with patch("bot.export.export_in_process", export_mock):
+            requests = [asyncio.create_task(export.get_export_document()) for _ in range(3)]
+            await build_started.wait()
+            # A cancelled request doesn't cancel the build for others
+            requests[0].cancel()
+            finish_build.set()
+            results = await asyncio.gather(*requests, return_exceptions=True)
+            self.assertEqual(results[1:], [b"document", b"document"])
+            self.assertEqual(export_mock.await_count, 1)
+
+            # The next request starts a new build
+            await export.get_export_document()
+            self.assertEqual(export_mock.await_count, 2)
+            self.assertEqual(export.export_tasks, {})
+
+    async def test_periods_are_built_separately(self):
+        export_mock = AsyncMock(side_effect=lambda since, until: since)
+        with patch("bot.export.export_in_process", export_mock):
+            documents = await asyncio.gather(
+                export.get_export_document(),
+                export.get_export_document(datetime(2023, 1, 1)),
+                export.get_export_document(datetime(2023, 1, 1)),
+            )
+        self.assertEqual(documents, [None, datetime(2023, 1, 1), datetime(2023, 1, 1)])
+        self.assertEqual(export_mock.await_count, 2)
+
+    def test_cooldown_is_per_user(self):
+        self.assertEqual(export.get_export_cooldown(1), 0)
+        self.assertGreater(export.get_export_cooldown(1), 0)
+        self.assertEqual(export.get_export_cooldown(2), 0)
+        with patch("bot.export.time.monotonic", return_value=export.export_cooldowns[1] + 3600):
+            self.assertEqual(export.get_export_cooldown(1), 0)
+
+
+class TestExportPool(unittest.IsolatedAsyncioTestCase):
+    """
+    Builds documents in the spawned process of the export pool, from empty databases.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        paths = [os.path.join(directory.name, name) for name in ("main.db", "history.db")]
+        for path in paths:
+            engine = create_sqlite_engine(path)
+            Base.metadata.create_all(engine)
+            engine.dispose()
+        for name, path in zip(("DB_PATH", "DB_HISTORY_PATH"), paths):
+            patcher = patch(f"bot.export.{name}", path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(export.shutdown_export_executor)
+
+    def assert_document(self, document):
+        workbook = openpyxl.load_workbook(io.BytesIO(document))
+        self.assertIn("L3 Activity", workbook.sheetnames)
+
+    async def test_document_is_built_in_export_process(self):
+        executor = export.get_export_executor()
+        self.assert_document(await export.export_in_process())
+        # The process is kept for the next exports
+        self.assert_document(await export.export_in_process())
+        self.assertIs(export.export_executor, executor)
+
+    async def test_broken_pool_is_replaced(self):
+        executor = export.get_export_executor()
+        self.assert_document(await export.export_in_process())
+        for process in list(executor._processes.values()):
+            process.kill()
+
+        with self.assertRaises(BrokenProcessPool):
+            await export.export_in_process()
+        self.assertIsNone(export.export_executor)
+        # The next export starts a new process
+        self.assert_document(await export.export_in_process())
+        self.assertIsNot(export.export_executor, executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
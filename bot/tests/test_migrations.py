@@ -0,0 +1,277 @@
+import importlib.util
+import os
+import unittest
+
+from sqlalchemy import create_engine, text
+
+try:
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+except ImportError:
+    # Alembic is only needed to migrate the databases
+    MigrationContext = Operations = None
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "db")
+
+
+def load_migration(path):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def run_migration(engine, function):
+    with engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            function()
+
+
+def load_history_migration(name):
+    return load_migration(os.path.join(MIGRATIONS_DIR, "alembic-history", "versions", name))
+
+
+# The history tables as they were before the recipients were normalized
+LEGACY_SCHEMA = [
+    """
+    CREATE TABLE proposals (
+        id INTEGER NOT NULL,
+        author_id INTEGER,
+        not_financial BOOLEAN,
+        total_amount FLOAT,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE proposal_history (
+        id INTEGER NOT NULL,
+        result INTEGER,
+        author_nickname VARCHAR,
+        PRIMARY KEY (id),
+        FOREIGN KEY(id) REFERENCES proposals (id)
+    )
+    """,
+    """
+    CREATE TABLE voters (
+        id INTEGER NOT NULL,
+        proposal_id INTEGER,
+        user_id INTEGER,
+        user_nickname VARCHAR,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE finance_recipients (
+        id INTEGER NOT NULL,
+        proposal_id INTEGER,
+        recipient_ids VARCHAR NOT NULL,
+        recipient_nicknames VARCHAR,
+        amount FLOAT CHECK (amount > -1000000000 AND amount < 1000000000),
+        PRIMARY KEY (id),
+        FOREIGN KEY(proposal_id) REFERENCES proposals (id)
+    )
+    """,
+    """
+    CREATE TABLE free_funding_transaction_history (
+        id INTEGER NOT NULL,
+        author_id INTEGER,
+        author_nickname VARCHAR,
+        recipient_ids VARCHAR,
+        recipient_nicknames VARCHAR,
+        total_amount FLOAT CHECK (total_amount > -1000000000 AND total_amount < 1000000000),
+        description VARCHAR,
+        submitted_at DATETIME,
+        message_url VARCHAR,
+        PRIMARY KEY (id)
+    )
+    """,
+]
+
+
+def create_legacy_db():
+    """
+    Returns the engine of an in-memory DB with the legacy schema, including the rows that can't be
+    converted exactly.
+    """
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.execute(
+            text(
+                "INSERT INTO finance_recipients (id, proposal_id, recipient_ids, "
+                "recipient_nicknames, amount) VALUES (:id, 1, :ids, :nicknames, 10)"
+            ),
+            [
+                {"id": 1, "ids": "1;;2", "nicknames": "user1, user2"},
+                {"id": 2, "ids": "3;;<@abc>", "nicknames": "user3, unknown"},
+                # A nickname that contains the separator
+                {"id": 3, "ids": "4;;5", "nicknames": "user, 4, user5"},
+            ],
+        )
+        connection.execute(
+            text(
+                "INSERT INTO free_funding_transaction_history (id, author_id, recipient_ids, "
+                "recipient_nicknames, total_amount) VALUES (:id, 1, :ids, :nicknames, :amount)"
+            ),
+            [
+                {"id": 1, "ids": "1;;2", "nicknames": "user1;;user2", "amount": 10},
+                {"id": 2, "ids": "3", "nicknames": None, "amount": None},
+                # The transactions sent before the ids were saved
+                {"id": 3, "ids": None, "nicknames": "user1#1234, user2#5678", "amount": 20},
+                {"id": 4, "ids": "1;;<@abc>", "nicknames": "user1;;unknown", "amount": 10},
+            ],
+        )
+    return engine
+
+
+@unittest.skipIf(Operations is None, "alembic is not installed")
+class TestNormalizeRecipients(unittest.TestCase):
+    """
+    Runs the migration that normalizes the recipients on the legacy data, including rows that can't
+    be converted exactly.
+    """
+
+    migration_path = os.path.join(
+        MIGRATIONS_DIR, "alembic-history", "versions", "5b9c3e7f2d41_normalize_recipients.py"
+    )
+
+    def setUp(self):
+        self.migration = load_migration(self.migration_path)
+        self.engine = create_legacy_db()
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def run_migration(self, function):
+        run_migration(self.engine, function)
+
+    def select(self, query):
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(text(query))]
+
+    def test_upgrade(self):
+        with self.assertLogs(self.migration.logger, "WARNING") as logs:
+            self.run_migration(self.migration.upgrade)
+
+        self.assertEqual(
+            self.select(
+                "SELECT finance_recipient_id, user_id, user_nickname FROM finance_recipient_users "
+                "ORDER BY id"
+            ),
+            [(1, 1, "user1"), (1, 2, "user2"), (2, 3, "user3"), (3, 4, None), (3, 5, None)],
+        )
+        self.assertEqual(
+            self.select(
+                "SELECT transaction_id, user_id, user_nickname, amount "
+                "FROM free_funding_transaction_recipients ORDER BY id"
+            ),
+            # The recipient with a malformed id doesn't get its share of the tip
+            [(1, 1, "user1", 5), (1, 2, "user2", 5), (2, 3, None, None), (4, 1, "user1", 5)],
+        )
+        # The rows that couldn't be converted exactly are logged
+        self.assertEqual(len(logs.records), 4)
+        self.assertIn("finance_recipients.id=2", logs.output[0])
+        self.assertIn("finance_recipients.id=3", logs.output[1])
+        self.assertIn("free_funding_transaction_history.id=3", logs.output[2])
+        self.assertIn("free_funding_transaction_history.id=4", logs.output[3])
+
+    def test_downgrade(self):
+        with self.assertLogs(self.migration.logger, "WARNING"):
+            self.run_migration(self.migration.upgrade)
+        self.run_migration(self.migration.downgrade)
+
+        self.assertEqual(
+            self.select(
+                "SELECT id, recipient_ids, recipient_nicknames FROM finance_recipients ORDER BY id"
+            ),
+            [(1, "1;;2", "user1, user2"), (2, "3", "user3"), (3, "4;;5", ", ")],
+        )
+        self.assertEqual(
+            self.select(
+                "SELECT id, recipient_ids, recipient_nicknames "
+                "FROM free_funding_transaction_history ORDER BY id"
+            ),
+            [(1, "1;;2", "user1;;user2"), (2, "3", ""), (3, None, None), (4, "1", "user1")],
+        )
+
+
+class TestNormalizeRecipientsMain(TestNormalizeRecipients):
+    migration_path = os.path.join(
+        MIGRATIONS_DIR, "alembic-main", "versions", "e4d09b6f1a82_normalize_recipients.py"
+    )
+
+
+@unittest.skipIf(Operations is None, "alembic is not installed")
+class TestAddAnalyticsUserStats(unittest.TestCase):
+    def test_unknown_amounts_are_counted_as_zero(self):
+        engine = create_legacy_db()
+        self.addCleanup(engine.dispose)
+        normalize_recipients = load_history_migration("5b9c3e7f2d41_normalize_recipients.py")
+        with self.assertLogs(normalize_recipients.logger, "WARNING"):
+            run_migration(engine, normalize_recipients.upgrade)
+        run_migration(
+            engine, load_history_migration("c2d8f4a61e93_add_analytics_user_stats.py").upgrade
+        )
+
+        with engine.connect() as connection:
+            tips_received = dict(
+                connection.execute(
+                    text("SELECT user_id, tips_received FROM analytics_user_stats")
+                ).all()
+            )
+        # User 3 has only received a tip of unknown amount
+        self.assertEqual(tips_received, {1: 10, 2: 5, 3: 0})
+
+
+@unittest.skipIf(Operations is None, "alembic is not installed")
+class TestAddSeasons(unittest.TestCase):
+    migration_path = os.path.join(
+        MIGRATIONS_DIR,
+        "alembic-history",
+        "versions",
+        "9e4a7c2b5d18_add_seasons_and_indexes_for_period_export.py",
+    )
+
+    def setUp(self):
+        self.migration = load_migration(self.migration_path)
+        self.engine = create_engine('sqlite://')
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(
+                "CREATE TABLE proposals (id INTEGER NOT NULL, submitted_at DATETIME, "
+                "closed_at DATETIME, PRIMARY KEY (id))"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE voters (id INTEGER NOT NULL, proposal_id INTEGER, PRIMARY KEY (id))"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE free_funding_transaction_history (id INTEGER NOT NULL, "
+                "submitted_at DATETIME, PRIMARY KEY (id))"
+            )
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def upgrade(self):
+        with self.engine.begin() as connection:
+            with Operations.context(MigrationContext.configure(connection)):
+                self.migration.upgrade()
+            return connection.execute(text("SELECT started_at FROM seasons")).scalars().all()
+
+    def test_first_season_starts_with_history(self):
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO proposals (submitted_at) VALUES ('2023-01-03 10:00:00.000000')"
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO free_funding_transaction_history (submitted_at) "
+                "VALUES ('2023-01-02 10:00:00.000000')"
+            )
+        self.assertEqual(self.upgrade(), ["2023-01-02 10:00:00.000000"])
+
+    def test_first_season_of_empty_history(self):
+        self.assertEqual(len(self.upgrade()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
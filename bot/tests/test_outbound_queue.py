@@ -0,0 +1,139 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+import discord
+
+from bot.utils.outbound_queue import OutboundActionQueue, is_retryable
+
+
+def http_exception(status):
+    return discord.HTTPException(Mock(status=status, reason="Test"), "Test")
+
+
+class TestOutboundActionQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.queue = OutboundActionQueue(
+            max_size=10,
+            route_concurrency={"dm": 1, "message": 2},
+            max_retries=2,
+            retry_backoff_seconds=0.01,
+        )
+
+    async def test_temporary_error_is_retried(self):
+        attempts = []
+
+        async def action():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise http_exception(503)
+
+        self.queue.enqueue("message", action, "test action")
+        await self.queue.join()
+        self.assertEqual(len(attempts), 3)
+
+    async def test_permanent_error_is_not_retried(self):
+        attempts = []
+
+        async def action():
+            attempts.append(1)
+            raise http_exception(403)
+
+        self.queue.enqueue("message", action, "test action")
+        await self.queue.join()
+        self.assertEqual(len(attempts), 1)
+
+    async def test_route_concurrency_is_limited(self):
+        running = []
+        max_running = []
+
+        async def action():
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        for _ in range(3):
+            self.queue.enqueue("dm", action, "test action")
+        await self.queue.join()
+        self.assertEqual(max(max_running), 1)
+
+    async def test_retried_route_does_not_delay_other_routes(self):
+        queue = OutboundActionQueue(
+            route_concurrency={"dm": 1, "reaction": 1}, retry_backoff_seconds=10
+        )
+        self.addAsyncCleanup(queue.close, timeout=0)
+        dm_failed = asyncio.Event()
+        removed = asyncio.Event()
+
+        async def send_dm():
+            dm_failed.set()
+            raise http_exception(429)
+
+        async def remove_reaction():
+            removed.set()
+
+        # A burst of rate limited DMs
+        for _ in range(10):
+            queue.enqueue("dm", send_dm, "test DM")
+        await dm_failed.wait()
+        # The worker of the DMs is waiting to retry, but the reactions have their own worker
+        queue.enqueue("reaction", remove_reaction, "test reaction")
+        await asyncio.wait_for(removed.wait(), 1)
+
+    async def test_unknown_route(self):
+        with self.assertRaises(ValueError):
+            self.queue.enqueue("unknown", None, "test action")
+
+    async def test_full_queue_drops_actions_without_waiting(self):
+        queue = OutboundActionQueue(max_size=1, route_concurrency={"dm": 1})
+        started = asyncio.Event()
+        release = asyncio.Event()
+        sent = []
+
+        async def blocking_action():
+            started.set()
+            await release.wait()
+
+        async def action():
+            sent.append(1)
+
+        queue.enqueue("dm", blocking_action, "blocking action")
+        await started.wait()
+        # The worker is busy, so the first action fills the queue, and the second one is dropped
+        self.assertTrue(queue.enqueue("dm", action, "test action"))
+        self.assertFalse(queue.enqueue("dm", action, "test action"))
+        release.set()
+        await queue.join()
+        self.assertEqual(len(sent), 1)
+
+    async def test_close_sends_queued_actions(self):
+        sent = []
+
+        async def action():
+            await asyncio.sleep(0.01)
+            sent.append(1)
+
+        for _ in range(3):
+            self.queue.enqueue("dm", action, "test action")
+        await self.queue.close()
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(self.queue.worker_tasks, {"dm": [], "message": []})
+
+    async def test_close_gives_up_after_timeout(self):
+        async def action():
+            await asyncio.sleep(10)
+
+        self.queue.enqueue("dm", action, "test action")
+        await self.queue.close(timeout=0.01)
+        self.assertEqual(self.queue.worker_tasks, {"dm": [], "message": []})
+
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(http_exception(429)))
+        self.assertTrue(is_retryable(http_exception(502)))
+        self.assertFalse(is_retryable(http_exception(404)))
+        self.assertFalse(is_retryable(ValueError()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from bot.config.const import Vote
+from bot.config.schemas import Proposals, Voters
+from bot.utils import proposal_utils
+from bot.utils.proposal_utils import (
+    add_proposal,
+    add_voter,
+    remove_voter,
+    remove_proposal,
+    find_matching_voter,
+    check_voters_index,
+    get_proposal_initiated_by,
+    lock_proposal,
+)
+from bot.tests.db_test_case import DBTestCase
+
+
+def create_proposal(voting_message_id, voters=()):
+    proposal = Proposals(
+        message_id=voting_message_id + 1,
+        channel_id=1,
+        author_id=1,
+        voting_message_id=voting_message_id,
+        description="Test proposal",
+        submitted_at=datetime.utcnow(),
+        closed_at=datetime.utcnow() + timedelta(days=1),
+        bot_response_message_id=voting_message_id + 2,
+        not_financial=True,
+        threshold_negative=2,
+    )
+    for user_id in voters:
+        proposal.voters.append(
+            Voters(user_id=user_id, voting_message_id=voting_message_id, value=Vote.NO.value)
+        )
+    return proposal
+
+
+class TestVotersIndex(DBTestCase):
+    def test_restored_proposal_is_indexed(self):
+        add_proposal(create_proposal(100, voters=[1, 2]))
+        add_proposal(create_proposal(200, voters=[1]))
+
+        self.assertEqual(find_matching_voter(1, 100).voting_message_id, 100)
+        self.assertEqual(find_matching_voter(1, 200).voting_message_id, 200)
+        self.assertEqual(find_matching_voter(3, 100), [])
+        self.assertEqual(check_voters_index(), [])
+
+    async def test_add_and_remove_voter(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+
+        voter = Voters(user_id=5, voting_message_id=100, value=Vote.YES.value)
+        await add_voter(proposal, voter)
+        self.assertIs(find_matching_voter(5, 100), voter)
+        self.assertEqual(check_voters_index(), [])
+
+        await remove_voter(proposal, voter)
+        self.assertEqual(find_matching_voter(5, 100), [])
+        self.assertEqual(check_voters_index(), [])
+
+    async def test_remove_proposal_removes_voters(self):
+        proposal = create_proposal(100, voters=[1, 2])
+        await add_proposal(proposal, self.db)
+        await remove_proposal(100, self.db)
+
+        self.assertEqual(proposal_utils.voters_index, {})
+        self.assertEqual(check_voters_index(), [])
+
+    def test_duplicate_voters_are_returned_as_list(self):
+        add_proposal(create_proposal(100, voters=[1, 1]))
+        self.assertEqual(len(find_matching_voter(1, 100)), 2)
+
+    def test_inconsistency_is_detected(self):
+        proposal = create_proposal(100, voters=[1])
+        add_proposal(proposal)
+        # Change the ORM collection bypassing add_voter
+        proposal.voters.append(Voters(user_id=2, voting_message_id=100, value=Vote.NO.value))
+        self.assertEqual(len(check_voters_index()), 1)
+
+    async def test_proposal_initiated_by(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        self.assertIs(get_proposal_initiated_by(proposal.message_id), proposal)
+        self.assertIs(get_proposal_initiated_by(proposal.bot_response_message_id), proposal)
+        self.assertIsNone(get_proposal_initiated_by(proposal.voting_message_id))
+
+        await remove_proposal(100, self.db)
+        self.assertIsNone(get_proposal_initiated_by(101))
+        self.assertEqual(proposal_utils.proposals_by_initiating_message, {})
+
+    def test_proposal_without_bot_response(self):
+        proposal = create_proposal(100)
+        proposal.bot_response_message_id = 0
+        add_proposal(proposal)
+        self.assertIsNone(get_proposal_initiated_by(0))
+
+
+
+class TestProposalLocks(unittest.IsolatedAsyncioTestCase):
+    async def hold_lock(self, voting_message_id, events, name):
+        async with lock_proposal(voting_message_id):
+            events.append(f"{name} acquired")
+            await asyncio.sleep(0.05)
+            events.append(f"{name} released")
+
+    async def test_different_proposals_do_not_block_each_other(self):
+        events = []
+        await asyncio.gather(self.hold_lock(1, events, "a"), self.hold_lock(2, events, "b"))
+        self.assertEqual(events[:2], ["a acquired", "b acquired"])
+
+    async def test_same_proposal_is_serialized(self):
+        events = []
+        await asyncio.gather(self.hold_lock(1, events, "a"), self.hold_lock(1, events, "b"))
+        self.assertEqual(events, ["a acquired", "a released", "b acquired", "b released"])
+
+    async def test_lock_of_inactive_proposal_is_dropped_when_unused(self):
+        events = []
+        # The second coroutine waits for the lock while the first one holds it
+        await asyncio.gather(self.hold_lock(3, events, "a"), self.hold_lock(3, events, "b"))
+        self.assertNotIn(3, proposal_utils.proposal_locks)
+        self.assertNotIn(3, proposal_utils.proposal_lock_users)
+
+    async def test_lock_of_active_proposal_is_kept(self):
+        proposal_utils.proposals[4] = create_proposal(4)
+        self.addCleanup(proposal_utils.proposals.pop, 4)
+        self.addCleanup(proposal_utils.proposal_locks.pop, 4, None)
+        await self.hold_lock(4, [], "a")
+        self.assertIn(4, proposal_utils.proposal_locks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from bot.config.const import Vote, EMOJI_VOTING_NO, EMOJI_VOTING_YES
+from bot.recovery import sync_voters_db_with_discord, start_proposals_coroutines
+from bot.utils import proposal_utils
+from bot.utils.proposal_utils import add_proposal, check_voters_index, get_voters_with_vote
+from bot.tests.db_test_case import DBTestCase
+from bot.tests.test_proposal_utils import create_proposal
+
+
+def create_voting_message(emoji, user_ids):
+    reaction = Mock(emoji=emoji)
+    reaction.users_calls = 0
+
+    async def users():
+        reaction.users_calls += 1
+        for user_id in user_ids:
+            yield Mock(id=user_id)
+
+    reaction.users = users
+    reaction.remove = AsyncMock()
+    return Mock(reactions=[reaction]), reaction
+
+
+@patch("bot.recovery.validate_roles", AsyncMock(return_value=True))
+class TestSyncVoters(DBTestCase):
+    async def test_voters_are_reconciled_with_reactions(self):
+        proposal = create_proposal(100, voters=[2, 3])
+        proposal.threshold_negative = 10
+        await add_proposal(proposal, self.db)
+        # User 2 removed the reaction and user 4 added it while the bot was down
+        voting_message, reaction = create_voting_message(EMOJI_VOTING_NO, [3, 4, 5])
+
+        await sync_voters_db_with_discord(voting_message, proposal, Vote.NO, EMOJI_VOTING_NO)
+
+        voter_ids = {voter.user_id for voter in get_voters_with_vote(proposal, Vote.NO)}
+        self.assertEqual(voter_ids, {3, 4, 5})
+        self.assertEqual(reaction.users_calls, 1)
+        self.assertEqual(check_voters_index(), [])
+
+    async def test_supporting_vote_of_author_is_not_counted(self):
+        proposal = create_proposal(100)
+        await add_proposal(proposal, self.db)
+        voting_message, reaction = create_voting_message(EMOJI_VOTING_YES, [1, 2])
+
+        await sync_voters_db_with_discord(voting_message, proposal, Vote.YES, EMOJI_VOTING_YES)
+
+        self.assertEqual([voter.user_id for voter in proposal.voters], [2])
+        reaction.remove.assert_awaited_once()
+
+    async def test_missing_reaction_removes_voters(self):
+        proposal = create_proposal(100, voters=[2, 3])
+        await add_proposal(proposal, self.db)
+        voting_message = Mock(reactions=[])
+
+        await sync_voters_db_with_discord(voting_message, proposal, Vote.NO, EMOJI_VOTING_NO)
+
+        self.assertEqual(proposal.voters, [])
+        self.assertEqual(proposal_utils.voters_index, {})
+
+
+@patch("bot.recovery.SLEEP_BEFORE_RECOVERY_SECONDS", 0)
+class TestStartProposalsCoroutines(unittest.IsolatedAsyncioTestCase):
+    async def test_pending_proposals_are_recovered(self):
+        # The pending proposals are loaded as a list (see DBUtil.load_pending_grant_proposals)
+        proposals = [Mock(voting_message_id=100), Mock(voting_message_id=200)]
+        client = Mock()
+        with patch("bot.recovery.recover_proposal", AsyncMock()) as recover_proposal:
+            await start_proposals_coroutines(client, proposals)
+        self.assertEqual(
+            [call.args for call in recover_proposal.await_args_list],
+            [(client, proposals[0]), (client, proposals[1])],
+        )
+
+    async def test_nothing_is_recovered_without_pending_proposals(self):
+        with patch("bot.recovery.recover_proposal", AsyncMock()) as recover_proposal:
+            await start_proposals_coroutines(Mock(), [])
+        recover_proposal.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from bot.utils.scheduler import DeadlineScheduler
+
+
+class TestDeadlineScheduler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.scheduler = DeadlineScheduler()
+        self.fired = []
+
+    async def callback(self, key):
+        self.fired.append(key)
+
+    def in_seconds(self, seconds):
+        return datetime.utcnow() + timedelta(seconds=seconds)
+
+    async def test_runs_in_deadline_order(self):
+        self.scheduler.schedule(1, self.in_seconds(0.2), self.callback)
+        self.scheduler.schedule(2, self.in_seconds(0.05), self.callback)
+        self.scheduler.schedule(3, self.in_seconds(0.1), self.callback)
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.fired, [2, 3, 1])
+        self.assertEqual(len(self.scheduler), 0)
+
+    async def test_past_deadline_runs_immediately(self):
+        self.scheduler.schedule(1, self.in_seconds(-60), self.callback)
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.fired, [1])
+
+    async def test_cancel(self):
+        self.scheduler.schedule(1, self.in_seconds(0.05), self.callback)
+        self.scheduler.schedule(2, self.in_seconds(0.05), self.callback)
+        self.assertTrue(self.scheduler.cancel(1))
+        self.assertFalse(self.scheduler.cancel(1))
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.fired, [2])
+
+    async def test_reschedule(self):
+        self.scheduler.schedule(1, self.in_seconds(0.05), self.callback)
+        self.scheduler.schedule(2, self.in_seconds(0.1), self.callback)
+        # Move the first key behind the second one
+        self.scheduler.reschedule(1, self.in_seconds(0.15))
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.fired, [2, 1])
+        with self.assertRaises(ValueError):
+            self.scheduler.reschedule(3, self.in_seconds(1))
+
+    async def test_earlier_deadline_wakes_up_runner(self):
+        self.scheduler.schedule(1, self.in_seconds(60), self.callback)
+        await asyncio.sleep(0.01)
+        self.scheduler.schedule(2, self.in_seconds(0.05), self.callback)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.fired, [2])
+        self.assertTrue(self.scheduler.is_scheduled(1))
+        self.scheduler.cancel(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
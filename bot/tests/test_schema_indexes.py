@@ -0,0 +1,75 @@
+import unittest
+
+from sqlalchemy import create_engine
+
+from bot.config.schemas import Base
+
+
+class TestSchemaIndexes(unittest.TestCase):
+    """
+    Checks that SQLite uses the indexes on the hot query columns, by inspecting the plans of the
+    queries made by export, analytics and balance lookups.
+    """
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def get_query_plan(self, query, parameters):
+        with self.engine.connect() as connection:
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {query}", parameters)
+            return " ".join(row[-1] for row in rows)
+
+    def assert_index_used(self, index_name, query, parameters=()):
+        plan = self.get_query_plan(query, parameters)
+        self.assertRegex(plan, f"USING (COVERING )?INDEX {index_name}\\b")
+
+    def test_voters_by_user(self):
+        self.assert_index_used(
+            "ix_voters_user_id", "SELECT * FROM voters WHERE user_id = ?", (1,)
+        )
+
+    def test_proposals_by_author(self):
+        self.assert_index_used(
+            "ix_proposals_author_id", "SELECT * FROM proposals WHERE author_id = ?", (1,)
+        )
+
+    def test_finance_recipients_by_proposal(self):
+        self.assert_index_used(
+            "ix_finance_recipients_proposal_id",
+            "SELECT * FROM finance_recipients WHERE proposal_id = ?",
+            (1,),
+        )
+
+    def test_free_funding_balance_by_author(self):
+        self.assert_index_used(
+            "ix_free_funding_balance_author_id",
+            "SELECT * FROM free_funding_balance WHERE author_id = ?",
+            (1,),
+        )
+
+    def test_free_funding_transactions_by_time_range(self):
+        self.assert_index_used(
+            "ix_free_funding_transaction_history_submitted_at",
+            "SELECT * FROM free_funding_transaction_history WHERE submitted_at >= ? AND submitted_at < ?",
+            ("2023-01-01 00:00:00", "2023-02-01 00:00:00"),
+        )
+
+    def test_proposals_by_close_time_range(self):
+        self.assert_index_used(
+            "ix_proposals_closed_at",
+            "SELECT * FROM proposals WHERE closed_at >= ? AND closed_at < ? ORDER BY closed_at",
+            ("2023-01-01 00:00:00", "2023-02-01 00:00:00"),
+        )
+
+    def test_voters_by_proposal(self):
+        self.assert_index_used(
+            "ix_voters_proposal_id", "SELECT * FROM voters WHERE proposal_id = ?", (1,)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from bot import vote
+from bot.config.const import BOT_ID, EMOJI_VOTING_YES, EMOJI_VOTING_NO, VOTING_CHANNEL_ID
+from bot.utils import proposal_utils
+from bot.vote import is_valid_voting_reaction, reaction_filter_stats
+from bot.tests.db_test_case import clear_proposals
+
+# A user who isn't the bot
+USER_ID = 5
+
+
+def create_payload(
+    message_id=100, emoji=EMOJI_VOTING_YES, channel_id=VOTING_CHANNEL_ID, user_id=USER_ID
+):
+    payload = Mock(
+        message_id=message_id,
+        channel_id=channel_id,
+        user_id=user_id,
+        guild_id=1,
+        event_type="REACTION_ADD",
+    )
+    payload.emoji.name = emoji
+    return payload
+
+
+@patch("bot.vote.client.get_guild", Mock())
+class TestReactionFilter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Only the keys of active proposals are used by the filter
+        clear_proposals()
+        proposal_utils.proposals[100] = Mock(voting_message_id=100)
+        reaction_filter_stats.clear()
+        self.validate_roles = AsyncMock(return_value=True)
+        patcher = patch("bot.vote.validate_roles", self.validate_roles)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        clear_proposals()
+        reaction_filter_stats.clear()
+
+    async def assert_rejected_at(self, payload, stage):
+        self.assertFalse(await is_valid_voting_reaction(payload))
+        self.assertEqual(reaction_filter_stats, {stage: 1})
+
+    async def test_valid_vote_is_accepted(self):
+        self.assertTrue(await is_valid_voting_reaction(create_payload(emoji=EMOJI_VOTING_NO)))
+        self.assertEqual(reaction_filter_stats, {"accepted": 1})
+        self.validate_roles.assert_awaited_once()
+
+    async def test_non_voting_emoji_is_rejected_first(self):
+        # Even if the message isn't relevant either, the emoji is checked first
+        await self.assert_rejected_at(create_payload(message_id=999, emoji="👍"), "emoji")
+        self.validate_roles.assert_not_awaited()
+
+    async def test_irrelevant_channel_is_rejected(self):
+        await self.assert_rejected_at(create_payload(channel_id=VOTING_CHANNEL_ID + 1), "message")
+        self.validate_roles.assert_not_awaited()
+
+    async def test_unknown_message_is_rejected(self):
+        await self.assert_rejected_at(create_payload(message_id=999), "message")
+        self.validate_roles.assert_not_awaited()
+
+    async def test_bot_reaction_is_rejected(self):
+        await self.assert_rejected_at(create_payload(user_id=BOT_ID), "bot")
+        self.validate_roles.assert_not_awaited()
+
+    async def test_user_without_roles_is_rejected(self):
+        self.validate_roles.return_value = False
+        await self.assert_rejected_at(create_payload(), "roles")
+
+    async def test_stats_are_counted_per_stage(self):
+        await is_valid_voting_reaction(create_payload(emoji="👍"))
+        await is_valid_voting_reaction(create_payload(emoji="👍"))
+        await is_valid_voting_reaction(create_payload(message_id=999))
+        await is_valid_voting_reaction(create_payload())
+        self.assertEqual(reaction_filter_stats, {"emoji": 2, "message": 1, "accepted": 1})
+
+    async def test_stats_are_logged_periodically(self):
+        with patch("bot.vote.REACTION_FILTER_STATS_LOG_INTERVAL", 2), patch.object(
+            vote.logger, "info"
+        ) as log_info:
+            await is_valid_voting_reaction(create_payload(emoji="👍"))
+            log_info.assert_not_called()
+            await is_valid_voting_reaction(create_payload(emoji="👍"))
+            log_info.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
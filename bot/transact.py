@@ -18,6 +18,7 @@ from bot.utils.proposal_utils import (
 from bot.config.logging_config import log_handler, console_handler
 from bot.utils.validation import validate_roles, validate_free_transaction
 from bot.utils.discord_utils import get_discord_client, send_dm
+from bot.utils.analytics_utils import add_user_stats, get_transaction_user_stats
 from bot.utils.formatting_utils import (
     get_discord_timestamp_plus_delta,
     get_discord_countdown_plus_delta,
@@ -25,7 +26,7 @@ from bot.utils.formatting_utils import (
     get_nickname_by_id_or_mention,
     get_id_by_mention,
 )
-from bot.config.schemas import FreeFundingBalance, FreeFundingTransaction
+from bot.config.schemas import FreeFundingBalance, FreeFundingTransaction, FreeFundingRecipients
 from bot.help import send_free_funding_balance
 
 logger = logging.getLogger(__name__)
@@ -74,7 +75,7 @@ async def send_transaction(ctx, original_message, mentions, ids, amount, descrip
             author_nickname=await get_nickname_by_id_or_mention(author_mention),
             balance=FREE_FUNDING_LIMIT_PERSON_PER_SEASON,
         )
-        await db.add(author_balance)
+        author_balance = await db.add_free_funding_balance(author_balance)
 
     # Validity checks (including whether the author has sufficient funds, that's why we do it after retreiving the balance)
     if not await validate_free_transaction(
@@ -83,9 +84,21 @@ async def send_transaction(ctx, original_message, mentions, ids, amount, descrip
         await ctx.message.add_reaction(REACTION_ON_TRANSACTION_FAILED)
         return
 
-    # Substitute transaction from the users balance
-    author_balance.balance -= amount * len(mentions)
-    await db.save()
+    # Substitute transaction from the users balance (atomically, since another transaction of the
+    # author could have been sent while this one was validated)
+    if not await db.debit_free_funding_balance(author_balance, amount * len(mentions)):
+        await original_message.reply(
+            ERROR_MESSAGE_NOT_ENOUGH_BALANCE.format(
+                balance=get_amount_to_print(author_balance.balance)
+            )
+        )
+        await ctx.message.add_reaction(REACTION_ON_TRANSACTION_FAILED)
+        logger.info(
+            "Not enough balance after validation. message_id=%d, remaining balance=%d",
+            original_message.id,
+            author_balance.balance,
+        )
+        return
 
     # Send the transaction (doing so after substracting the balance from DB gives us a bit more control, because if we first apply the grant, and then some error occurs while updating DB, we will not be able to revert the transaction since we don't control Accountant)
     grant_message = GRANT_COMMAND_FREE_FUNDING_MESSAGE.format(
@@ -115,24 +128,27 @@ async def send_transaction(ctx, original_message, mentions, ids, amount, descrip
         # Throwing exception further because if the grant failed to apply, we don't want to do anything else
         raise e
 
-    # Convert all mentions to nicknames
-    recipient_nicknames = []
-    for mention in mentions:
-        recipient_nicknames.append(await get_nickname_by_id_or_mention(mention))
-    # Add transaction to history
-    await db.add(
-        FreeFundingTransaction(
-            author_id=ctx.message.author.id,
-            author_nickname=await get_nickname_by_id_or_mention(author_mention),
-            recipient_ids=DB_ARRAY_COLUMN_SEPARATOR.join(ids),
-            recipient_nicknames=DB_ARRAY_COLUMN_SEPARATOR.join(recipient_nicknames),
-            total_amount=amount * len(mentions),
-            description=description,
-            submitted_at=datetime.now(),
-            message_url=grant_message.jump_url,
-        ),
-        is_history=True,
+    # Add transaction to history, with a row for each recipient (nicknames are used for analytics)
+    transaction = FreeFundingTransaction(
+        author_id=ctx.message.author.id,
+        author_nickname=await get_nickname_by_id_or_mention(author_mention),
+        total_amount=amount * len(mentions),
+        description=description,
+        submitted_at=datetime.utcnow(),
+        message_url=grant_message.jump_url,
     )
+    for id, mention in zip(ids, mentions):
+        transaction.recipients.append(
+            FreeFundingRecipients(
+                user_id=int(id),
+                user_nickname=await get_nickname_by_id_or_mention(mention),
+                amount=amount,
+            )
+        )
+    async with db.transaction(is_history=True) as session:
+        session.add(transaction)
+        # Update the analytics of the author and recipients along with the history
+        await db.run_in_db_thread(add_user_stats, session, get_transaction_user_stats(transaction))
     await ctx.message.add_reaction(REACTION_ON_TRANSACTION_SUCCEED)
 
     logger.info(
@@ -0,0 +1,261 @@
+import math
+
+from sqlalchemy import and_, case, delete, func, literal, select, union_all
+from sqlalchemy.dialects.sqlite import insert
+
+from bot.config.const import ProposalResult
+from bot.config.schemas import (
+    AnalyticsUserStats,
+    Proposals,
+    ProposalHistory,
+    Voters,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    FreeFundingTransaction,
+    FreeFundingRecipients,
+)
+
+# The counters of AnalyticsUserStats, which are summed when history rows are added
+USER_STATS_COUNTERS = [
+    "tips_sent",
+    "submitted_proposals",
+    "accepted_proposals",
+    "accepted_amount",
+    "votes",
+    "tips_received",
+    "grants_received",
+]
+
+
+def get_user_stats_row(user_stats, user_id, user_nickname):
+    """
+    Returns the row of the user in user_stats (a dict of rows by user id), adding it if needed. The
+    greatest nickname is kept, the same way as when the stats are recomputed (see select_user_stats).
+    """
+    row = user_stats.setdefault(
+        user_id,
+        {"user_id": user_id, "user_nickname": None, **dict.fromkeys(USER_STATS_COUNTERS, 0)},
+    )
+    row["user_nickname"] = max(
+        (nickname for nickname in (row["user_nickname"], user_nickname) if nickname is not None),
+        default=None,
+    )
+    return row
+
+
+def get_proposal_user_stats(history_item, voters, recipients, recipient_users):
+    """
+    Returns the changes of user stats made by adding the proposal to history. voters, recipients and
+    recipient_users are the rows copied to history (see save_proposal_to_history).
+    """
+    user_stats = {}
+    is_accepted = history_item.result == ProposalResult.ACCEPTED.value
+
+    author = get_user_stats_row(user_stats, history_item.author_id, history_item.author_nickname)
+    author["submitted_proposals"] += 1
+    if is_accepted:
+        author["accepted_proposals"] += 1
+        if not history_item.not_financial:
+            author["accepted_amount"] += history_item.total_amount or 0
+
+    for voter in voters:
+        get_user_stats_row(user_stats, voter["user_id"], voter["user_nickname"])["votes"] += 1
+
+    # Grants are only received in accepted proposals
+    if is_accepted:
+        for recipient, users in zip(recipients, recipient_users):
+            for user in users:
+                row = get_user_stats_row(user_stats, user["user_id"], user["user_nickname"])
+                row["grants_received"] += recipient["amount"]
+    return user_stats
+
+
+def get_transaction_user_stats(transaction):
+    """
+    Returns the changes of user stats made by adding the free funding transaction to history.
+    """
+    user_stats = {}
+    author = get_user_stats_row(user_stats, transaction.author_id, transaction.author_nickname)
+    author["tips_sent"] += 1
+    for recipient in transaction.recipients:
+        row = get_user_stats_row(user_stats, recipient.user_id, recipient.user_nickname)
+        # The amounts of some legacy transactions are unknown
+        row["tips_received"] += recipient.amount or 0
+    return user_stats
+
+
+def add_user_stats(session, user_stats):
+    """
+    Adds the changes of user stats (see get_proposal_user_stats) to AnalyticsUserStats, inserting the
+    rows of new users. Runs synchronously; within a transaction, use run_in_db_thread, so that the
+    stats are committed along with the history rows.
+    """
+    table = AnalyticsUserStats.__table__
+    rows = [row for row in user_stats.values() if row["user_id"] is not None]
+    if not rows:
+        return
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            # The scalar max() of SQLite is null if any of the values is
+            "user_nickname": func.coalesce(
+                func.max(table.c.user_nickname, statement.excluded.user_nickname),
+                table.c.user_nickname,
+                statement.excluded.user_nickname,
+            ),
+            **{
+                counter: table.c[counter] + statement.excluded[counter]
+                for counter in USER_STATS_COUNTERS
+            },
+        },
+    )
+    session.execute(statement, rows)
+
+
+def get_period_conditions(column, since=None, until=None):
+    """
+    Returns the conditions of the column (a date) being within the period: since is inclusive, until
+    is exclusive, and either of them can be None.
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(column >= since)
+    if until is not None:
+        conditions.append(column < until)
+    return conditions
+
+
+def select_user_stats(since=None, until=None):
+    """
+    Returns a query that computes the stats of all users from the whole history, in the same format
+    as AnalyticsUserStats (used to rebuild and verify it). If since or until is given, only the
+    history of the period is used (the proposals closed and the transactions sent within it).
+    """
+    # The tables are used directly, since ProposalHistory is mapped to both of them
+    proposals, history = Proposals.__table__, ProposalHistory.__table__
+    transactions = FreeFundingTransaction.__table__
+    is_accepted = history.c.result == ProposalResult.ACCEPTED.value
+    is_period = since is not None or until is not None
+    proposals_period = get_period_conditions(proposals.c.closed_at, since, until)
+    transactions_period = get_period_conditions(transactions.c.submitted_at, since, until)
+
+    def changes(user_id, user_nickname, **counters):
+        return [user_id.label("user_id"), user_nickname.label("user_nickname")] + [
+            counters.get(counter, literal(0)).label(counter) for counter in USER_STATS_COUNTERS
+        ]
+
+    tips_received = select(
+        *changes(
+            FreeFundingRecipients.user_id,
+            FreeFundingRecipients.user_nickname,
+            # The amounts of some legacy transactions are unknown
+            tips_received=func.coalesce(FreeFundingRecipients.amount, 0),
+        )
+    )
+    votes = select(*changes(Voters.user_id, Voters.user_nickname, votes=literal(1)))
+    grants_received = (
+        select(
+            *changes(
+                FinanceRecipientUsers.user_id,
+                FinanceRecipientUsers.user_nickname,
+                grants_received=func.coalesce(FinanceRecipients.amount, 0),
+            )
+        )
+        .join(FinanceRecipients)
+        .join(history, history.c.id == FinanceRecipients.proposal_id)
+        .where(is_accepted)
+    )
+    # The rows of a period are filtered by the dates of their transactions and proposals
+    if is_period:
+        tips_received = tips_received.join(transactions).where(*transactions_period)
+        votes = votes.join(proposals, proposals.c.id == Voters.proposal_id).where(*proposals_period)
+        grants_received = grants_received.join(proposals, proposals.c.id == history.c.id).where(
+            *proposals_period
+        )
+
+    all_changes = union_all(
+        select(
+            *changes(
+                transactions.c.author_id,
+                transactions.c.author_nickname,
+                tips_sent=literal(1),
+            )
+        ).where(*transactions_period),
+        tips_received,
+        select(
+            *changes(
+                proposals.c.author_id,
+                history.c.author_nickname,
+                submitted_proposals=literal(1),
+                accepted_proposals=case((is_accepted, 1), else_=0),
+                accepted_amount=case(
+                    (
+                        and_(is_accepted, proposals.c.not_financial.isnot(True)),
+                        func.coalesce(proposals.c.total_amount, 0),
+                    ),
+                    else_=0,
+                ),
+            )
+        )
+        .join(history, history.c.id == proposals.c.id)
+        .where(*proposals_period),
+        votes,
+        grants_received,
+    ).subquery()
+
+    return (
+        select(
+            all_changes.c.user_id,
+            func.max(all_changes.c.user_nickname).label("user_nickname"),
+            *[
+                func.sum(all_changes.c[counter]).label(counter)
+                for counter in USER_STATS_COUNTERS
+            ],
+        )
+        .where(all_changes.c.user_id.isnot(None))
+        .group_by(all_changes.c.user_id)
+    )
+
+
+def rebuild_user_stats(session):
+    """
+    Recomputes AnalyticsUserStats from the whole history, replacing the current rows. Runs
+    synchronously (a session or a connection can be used).
+    """
+    table = AnalyticsUserStats.__table__
+    session.execute(delete(table))
+    session.execute(
+        table.insert().from_select(
+            ["user_id", "user_nickname"] + USER_STATS_COUNTERS, select_user_stats()
+        )
+    )
+
+
+def verify_user_stats(session):
+    """
+    Compares AnalyticsUserStats with the stats recomputed from the whole history. Returns a list of
+    (user_id, stored, expected) for each user whose stats differ, where stored and expected are
+    tuples of (user_nickname, *counters), or None if the user has no row.
+    """
+    table = AnalyticsUserStats.__table__
+    stored = session.execute(
+        select(table.c.user_id, table.c.user_nickname, *[table.c[c] for c in USER_STATS_COUNTERS])
+    )
+    stored = {row[0]: tuple(row[1:]) for row in stored}
+    expected = {row[0]: tuple(row[1:]) for row in session.execute(select_user_stats())}
+
+    def is_equal(stored_row, expected_row):
+        if stored_row is None or expected_row is None or stored_row[0] != expected_row[0]:
+            return False
+        # Amounts are floats, which are summed in a different order when recomputed
+        return all(
+            math.isclose(stored_value, expected_value, abs_tol=1e-6)
+            for stored_value, expected_value in zip(stored_row[1:], expected_row[1:])
+        )
+
+    return [
+        (user_id, stored.get(user_id), expected.get(user_id))
+        for user_id in sorted(stored.keys() | expected.keys())
+        if not is_equal(stored.get(user_id), expected.get(user_id))
+    ]
@@ -0,0 +1,54 @@
+import time
+from collections import Counter, OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used items when it's full. If ttl_seconds is
+    given, items expire that many seconds after they were added. Hits and misses are counted in
+    stats.
+    """
+
+    def __init__(self, max_size, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, time when the value expires or None)
+        self.items = OrderedDict()
+        self.stats = Counter()
+
+    def get(self, key, default=None):
+        """
+        Returns the value of the key, or default if it's missing or expired.
+        """
+        item = self.items.get(key)
+        if item is None:
+            self.stats["miss"] += 1
+            return default
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.items[key]
+            self.stats["expired"] += 1
+            return default
+        self.items.move_to_end(key)
+        self.stats["hit"] += 1
+        return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self.items[key] = (value, expires_at)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self.items.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        self.items.clear()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
@@ -5,10 +5,14 @@ import discord
 import os
 import copy
 import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm import Query
-from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import create_engine, event, func, inspect, update
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.pool import NullPool, QueuePool
 
 from bot.config.schemas import (
     Base,
@@ -17,11 +21,14 @@ from bot.config.schemas import (
     FreeFundingBalance,
     Voters,
     FinanceRecipients,
+    FreeFundingTransaction,
+    Seasons,
 )
 from bot.config.logging_config import log_handler, console_handler
 from bot.config.const import *
 from bot.utils.discord_utils import get_discord_client, get_message
 from bot.utils.formatting_utils import get_nickname_by_id_or_mention
+from bot.utils.analytics_utils import rebuild_user_stats
 
 logger = logging.getLogger(__name__)
 logger.setLevel(DEFAULT_LOG_LEVEL)
@@ -31,6 +38,51 @@ logger.addHandler(console_handler)
 client = get_discord_client()
 
 
+def create_sqlite_engine(path, pragmas=SQLITE_PRAGMAS, read_only=False):
+    """
+    Creates an engine of the SQLite database at the given path, tuned with the given pragmas. With
+    read_only, the database is opened in read-only mode (e.g. for exporting data in another process).
+    """
+    engine = create_engine(
+        f"sqlite:///file:{path}?mode=ro&uri=true" if read_only else f"sqlite:///{path}",
+        # The connections are used both by the event loop and the DB thread
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool if SQLITE_KEEP_CONNECTIONS_OPEN else NullPool,
+    )
+    apply_sqlite_pragmas(engine, pragmas)
+    enable_sqlite_savepoints(engine)
+    return engine
+
+
+def apply_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    """
+    Sets the given pragmas (e.g. SQLITE_PRAGMAS) on every new connection of the engine.
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def enable_sqlite_savepoints(engine):
+    """
+    Makes SQLAlchemy emit BEGIN itself, instead of the sqlite3 driver (which only begins
+    transactions before DML statements, so that a SAVEPOINT could be the outermost transaction and
+    be committed when it's released).
+    """
+
+    @event.listens_for(engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
 class DBUtil:
     engine = None
     session = None
@@ -44,25 +96,52 @@ class DBUtil:
     # The lock used during recovery to stop accepting proposals and voting
     recovery_lock = asyncio.Lock()
 
+    # Queries and commits (which flush the changes and wait for the disk) are run in a dedicated
+    # thread, so that they don't block the event loop (and Discord heartbeats). A single thread
+    # keeps them serialized. Sessions aren't thread-safe, so a session is only used while its lock
+    # is held: in the DB thread (see run_with_session), or within transaction. The ORM objects used
+    # on the event loop are loaded beforehand, so that reading them doesn't query DB.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+    # Write-behind mode (see DB_WRITE_BEHIND_ENABLED): the number of operations that are made in the
+    # main session but not committed yet, and the task that will commit them
+    write_behind = DB_WRITE_BEHIND_ENABLED
+    pending_operations = 0
+    group_commit_task = None
+
+    # Free funding balances by author_id, loaded at startup (see load_free_funding_balances). The
+    # objects are shared with the session, so changes made to them are saved as usual, and balance
+    # checks don't need to query DB.
+    free_funding_balances = {}
+
     def is_recovery(self):
         if DBUtil.recovery_lock.locked():
             return True
         return False
 
     def connect_db(self):
+        # Objects aren't expired on commit, so that reading their attributes in the event loop doesn't
+        # reload them from DB (all changes are made through the session, so they're never outdated)
         if DBUtil.engine is None:
-            DBUtil.engine = create_engine(f"sqlite:///{DB_PATH}")
+            DBUtil.engine = create_sqlite_engine(DB_PATH)
         if DBUtil.session is None:
-            DBUtil.session = sessionmaker(bind=DBUtil.engine)()
+            DBUtil.session = sessionmaker(bind=DBUtil.engine, expire_on_commit=False)()
         # History db
         if DBUtil.engine_history is None:
-            DBUtil.engine_history = create_engine(f"sqlite:///{DB_HISTORY_PATH}")
+            DBUtil.engine_history = create_sqlite_engine(DB_HISTORY_PATH)
         if DBUtil.session_history is None:
-            DBUtil.session_history = sessionmaker(bind=DBUtil.engine_history)()
+            DBUtil.session_history = sessionmaker(
+                bind=DBUtil.engine_history, expire_on_commit=False
+            )()
         # run close_db once the main thread exits
         atexit.register(self.close_db)
 
     def close_db(self):
+        # Commit the changes left in write-behind mode (normally they're committed by flush on shutdown)
+        if DBUtil.pending_operations:
+            logger.info("Committing %d pending operation(s)", DBUtil.pending_operations)
+            DBUtil.session.commit()
+            DBUtil.pending_operations = 0
         DBUtil.engine.dispose()
         DBUtil.engine_history.dispose()
 
@@ -98,92 +177,331 @@ class DBUtil:
             Base.metadata.create_all(DBUtil.engine_history)
         else:
             logger.info("Table already exist: %s", FREE_FUNDING_TRANSACTIONS_TABLE_NAME)
+        if not DBUtil.engine_history.has_table(ANALYTICS_USER_STATS_TABLE_NAME):
+            Base.metadata.create_all(DBUtil.engine_history)
+            # Compute the analytics of the existing history, they're updated incrementally afterwards
+            with DBUtil.engine_history.begin() as connection:
+                rebuild_user_stats(connection)
+            logger.info("Created and filled table: %s", ANALYTICS_USER_STATS_TABLE_NAME)
+        else:
+            logger.info("Table already exist: %s", ANALYTICS_USER_STATS_TABLE_NAME)
+        if not DBUtil.engine_history.has_table(SEASONS_TABLE_NAME):
+            Base.metadata.create_all(DBUtil.engine_history)
+        else:
+            logger.info("Table already exist: %s", SEASONS_TABLE_NAME)
+        self.start_first_season()
+
+    def start_first_season(self):
+        """
+        Adds the first season if there's none, so that the current season can be exported before
+        the balances are reset for the first time. The season starts with the history (or now, if
+        the history is empty); the next ones are started by admin/reset_free_funding.py.
+        """
+        session = DBUtil.session_history
+        if session.query(Seasons.id).first() is not None:
+            return
+        first_submissions = [
+            session.query(func.min(Proposals.submitted_at)).scalar(),
+            session.query(func.min(FreeFundingTransaction.submitted_at)).scalar(),
+        ]
+        started_at = min(
+            (submitted_at for submitted_at in first_submissions if submitted_at is not None),
+            default=datetime.datetime.utcnow(),
+        )
+        session.add(Seasons(started_at=started_at))
+        session.commit()
+        logger.info("Started the first season at %s", started_at)
+
+    def load_free_funding_balances(self):
+        """
+        Loads the free funding balances of all users into memory; should run once on startup.
+        """
+        DBUtil.free_funding_balances = {
+            balance.author_id: balance for balance in DBUtil.session.query(FreeFundingBalance)
+        }
+        logger.info("Loaded %d free funding balance(s)", len(DBUtil.free_funding_balances))
+
+    def get_user_free_funding_balance(self, author_id):
+        """
+        Returns the free funding balance of the user, or None if the user hasn't used free funding.
+        """
+        return DBUtil.free_funding_balances.get(author_id)
 
-    def get_user_free_funding_balance(self, author_id) -> Query:
-        return DBUtil.session.query(FreeFundingBalance).filter_by(author_id=author_id).first()
+    async def add_free_funding_balance(self, balance):
+        """
+        Adds the free funding balance of a user to DB and memory. If the user already has a balance
+        (e.g. added concurrently by another command), it's returned instead of the given one.
+        """
+        existing_balance = DBUtil.free_funding_balances.get(balance.author_id)
+        if existing_balance is not None:
+            return existing_balance
+        # Added to memory before awaiting, so that concurrent commands don't add another one
+        DBUtil.free_funding_balances[balance.author_id] = balance
+        try:
+            await self.add(balance)
+        except BaseException:
+            DBUtil.free_funding_balances.pop(balance.author_id, None)
+            raise
+        return balance
 
-    def load_pending_grant_proposals(self) -> Query:
-        return DBUtil.session.query(Proposals)
+    async def debit_free_funding_balance(self, balance, amount) -> bool:
+        """
+        Atomically subtracts the amount from the free funding balance, if the balance is enough.
+        Returns False otherwise (e.g. when another transaction of the user has been sent since the
+        balance was checked).
+        """
+        table = FreeFundingBalance.__table__
+        statement = (
+            update(table)
+            .where(table.c.author_id == balance.author_id, table.c.balance >= amount)
+            .values(balance=table.c.balance - amount)
+        )
+        async with self.transaction() as session:
+            result = await self.run_in_db_thread(session.execute, statement)
+            if result.rowcount != 1:
+                return False
+            # Keep the balance in memory up to date, without marking it as changed for the session
+            set_committed_value(balance, "balance", balance.balance - amount)
+        return True
+
+    def load_pending_grant_proposals(self) -> list:
+        """
+        Returns all pending proposals along with their voters and recipients, so that they're used
+        in memory without lazy loading; runs synchronously (on startup, before the event loop).
+        """
+        return (
+            DBUtil.session.query(Proposals)
+            .options(selectinload(Proposals.voters), selectinload(Proposals.finance_recipients))
+            .all()
+        )
 
-    def log_pending_grant_proposals(self) -> Query:
+    def log_pending_grant_proposals(self):
         # Load pending proposals from database
         pending_grant_proposals = self.load_pending_grant_proposals()
         logger.info("Logging pending proposals in DB on request")
-        logger.info("Total: %d", pending_grant_proposals.count())
+        logger.info("Total: %d", len(pending_grant_proposals))
         for proposal in pending_grant_proposals:
             logger.info(proposal)
 
-    async def filter(self, table, is_history=True, condition=None, order_by=None):
+    def get_session(self, is_history=False):
         """
-        Filters the given ORM objects and returns a query (results should be retrieved using
-        statements like .all() or .first()). The DB is chosen depending on is_history parameter.
+        Returns the session of the DB chosen depending on is_history parameter, and its lock.
         """
         if is_history:
-            async with DBUtil.session_lock_history:
-                query = DBUtil.session_history.query(table)
-        else:
-            async with DBUtil.session_lock:
-                query = DBUtil.session.query(table)
-        if condition is not None:
-            query = query.filter(condition)
-        if order_by is not None:
-            query = query.order_by(order_by)
-        return query
+            return DBUtil.session_history, DBUtil.session_lock_history
+        return DBUtil.session, DBUtil.session_lock
+
+    async def run_with_session(self, func, is_history=True):
+        """
+        Runs func(session) in the DB thread while holding the session lock, and returns its result.
+        Queries should be run this way (or within transaction), so that they don't use the session
+        concurrently with a commit running in the DB thread. The results shouldn't be lazily loaded
+        on the event loop afterwards; long reads (e.g. with yield_per) can be processed within func.
+        """
+        session, lock = self.get_session(is_history)
+        async with lock:
+            return await self.run_in_db_thread(func, session)
+
+    async def filter(self, table, is_history=True, condition=None, order_by=None):
+        """
+        Returns the list of ORM objects of the given table, filtered by the condition. The DB is
+        chosen depending on is_history parameter.
+        """
+
+        def run_query(session):
+            query = session.query(table)
+            if condition is not None:
+                query = query.filter(condition)
+            if order_by is not None:
+                query = query.order_by(order_by)
+            return query.all()
+
+        return await self.run_with_session(run_query, is_history)
+
+    async def query(self, *entities, is_history=True, condition=None):
+        """
+        Returns the list of rows of the given entities (e.g. columns and aggregate functions),
+        filtered by the condition. The DB is chosen depending on is_history parameter.
+        """
+
+        def run_query(session):
+            query = session.query(*entities)
+            if condition is not None:
+                query = query.filter(condition)
+            return query.all()
+
+        return await self.run_with_session(run_query, is_history)
+
+    async def run_in_db_thread(self, func, *args):
+        """
+        Runs the given function in the DB thread and returns its result.
+        """
+        return await asyncio.get_running_loop().run_in_executor(DBUtil.executor, func, *args)
+
+    @staticmethod
+    def rollback(session, savepoint=None):
+        """
+        Rolls back the session (or only the given savepoint of it), and reloads the objects that
+        were expired by the rollback, so that they aren't lazily loaded on the event loop
+        afterwards. Runs synchronously, in the DB thread.
+        """
+        (session if savepoint is None else savepoint).rollback()
+        for orm_object in list(session.identity_map.values()):
+            if not inspect(orm_object).expired_attributes:
+                continue
+            try:
+                session.refresh(orm_object)
+                for relationship in inspect(orm_object).mapper.relationships:
+                    getattr(orm_object, relationship.key)
+            except InvalidRequestError:
+                # The row doesn't exist anymore
+                session.expunge(orm_object)
+
+    @asynccontextmanager
+    async def transaction(self, is_history=False, write_behind=False):
+        """
+        A unit of work: yields the session, and commits all changes made within the block at once
+        (or rolls them back if an exception is raised). The session lock is held within the block, so
+        other DBUtil methods shouldn't be called there, and nothing slow should be awaited.
+
+        If write_behind is True and the write-behind mode is enabled, the changes are committed later
+        along with others (see group_commit). While the session contains such pending changes, a
+        block runs in a SAVEPOINT, so that only its own changes are rolled back on exception.
+
+        Example:
+            async with db.transaction():
+                proposal.voters.append(voter)
+        """
+        session, lock = self.get_session(is_history)
+        write_behind = write_behind and DBUtil.write_behind and not is_history
+        async with lock:
+            savepoint = None
+            if write_behind or (DBUtil.pending_operations and not is_history):
+                # begin_nested flushes the pending changes of previous blocks before the SAVEPOINT
+                savepoint = await self.run_in_db_thread(session.begin_nested)
+            try:
+                yield session
+                if savepoint is not None:
+                    await self.run_in_db_thread(savepoint.commit)
+            except BaseException:
+                await self.run_in_db_thread(self.rollback, session, savepoint)
+                raise
+            if write_behind:
+                DBUtil.pending_operations += 1
+                if DBUtil.pending_operations >= DB_GROUP_COMMIT_MAX_OPERATIONS:
+                    await self.commit_pending_operations()
+                elif DBUtil.group_commit_task is None or DBUtil.group_commit_task.done():
+                    DBUtil.group_commit_task = asyncio.create_task(self.group_commit())
+            else:
+                try:
+                    await self.run_in_db_thread(session.commit)
+                except BaseException:
+                    await self.run_in_db_thread(self.rollback, session)
+                    raise
+                # The pending operations of write-behind mode were committed along with the changes
+                DBUtil.pending_operations = 0
+
+    async def group_commit(self):
+        """
+        Commits the pending operations of write-behind mode after DB_GROUP_COMMIT_INTERVAL_MS.
+        """
+        await asyncio.sleep(DB_GROUP_COMMIT_INTERVAL_MS / 1000)
+        try:
+            await self.flush()
+        except Exception:
+            logger.critical("Group commit has failed", exc_info=True)
+
+    async def commit_pending_operations(self):
+        """
+        Commits the pending operations of write-behind mode; the session lock should be held.
+        """
+        if not DBUtil.pending_operations:
+            return
+        pending_operations = DBUtil.pending_operations
+        DBUtil.pending_operations = 0
+        try:
+            await self.run_in_db_thread(DBUtil.session.commit)
+        except BaseException:
+            logger.critical(
+                "Unable to commit %d pending operation(s), rolling them back", pending_operations
+            )
+            await self.run_in_db_thread(self.rollback, DBUtil.session)
+            raise
+        logger.debug("Committed %d pending operation(s)", pending_operations)
+
+    async def flush(self):
+        """
+        A durability barrier: commits the pending operations of write-behind mode, if any.
+        """
+        if not DBUtil.pending_operations:
+            return
+        async with DBUtil.session_lock:
+            await self.commit_pending_operations()
 
     async def add(self, orm_object, is_history=False):
         """
         Adds object to db.
         """
-        if is_history:
-            async with DBUtil.session_lock_history:
-                DBUtil.session_history.add(orm_object)
-                DBUtil.session_history.commit()
-        else:
-            async with DBUtil.session_lock:
-                DBUtil.session.add(orm_object)
-                DBUtil.session.commit()
+        async with self.transaction(is_history) as session:
+            session.add(orm_object)
 
     async def add_all(self, orm_object, is_history=False):
         """
         Adds all objects from a given iterable to db.
         """
-        if is_history:
-            async with DBUtil.session_lock_history:
-                DBUtil.session_history.add_all(orm_object)
-                DBUtil.session_history.commit()
-        else:
-            async with DBUtil.session_lock:
-                DBUtil.session.add_all(orm_object)
-                DBUtil.session.commit()
+        async with self.transaction(is_history) as session:
+            session.add_all(orm_object)
+
+    @staticmethod
+    def execute_insert(session, table, rows, return_ids=False):
+        """
+        Inserts the rows (dicts of column values) into the table (an ORM class or a Table) with
+        SQLAlchemy Core, bypassing the ORM. Runs synchronously; within a transaction, use
+        run_in_db_thread. Returns the list of generated ids if return_ids is True.
+        """
+        table = getattr(table, "__table__", table)
+        if not rows:
+            return [] if return_ids else None
+        if not return_ids:
+            # A single statement executed for all rows (executemany)
+            session.execute(table.insert(), rows)
+            return None
+        # SQLite doesn't return generated ids from executemany, so the rows are inserted one by one
+        # (with the same statement, which is compiled once)
+        statement = table.insert()
+        return [session.execute(statement, row).inserted_primary_key[0] for row in rows]
+
+    async def bulk_insert(self, table, rows, is_history=False, return_ids=False):
+        """
+        Inserts many rows into the table at once (see execute_insert), which is much faster than
+        add_all for large lists. Returns the list of generated ids if return_ids is True.
+        """
+        async with self.transaction(is_history) as session:
+            return await self.run_in_db_thread(
+                self.execute_insert, session, table, rows, return_ids
+            )
 
     async def delete(self, orm_object):
         """
         Deletes object from a set.
         """
-        async with DBUtil.session_lock:
-            DBUtil.session.delete(orm_object)
-            DBUtil.session.commit()
+        async with self.transaction() as session:
+            session.delete(orm_object)
 
     async def append(self, list, orm_object):
         """
         Appends object to a list.
         """
-        async with DBUtil.session_lock:
+        async with self.transaction():
             list.append(orm_object)
-            DBUtil.session.commit()
 
     async def remove(self, list, orm_object):
         """
         Remove object from a list.
         """
-        async with DBUtil.session_lock:
+        async with self.transaction():
             list.remove(orm_object)
-            DBUtil.session.commit()
 
     async def save(self, is_history=False):
-        if is_history:
-            async with DBUtil.session_lock_history:
-                DBUtil.session_history.commit()
-        else:
-            async with DBUtil.session_lock:
-                DBUtil.session.commit()
+        async with self.transaction(is_history):
+            pass
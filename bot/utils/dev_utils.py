@@ -49,3 +49,36 @@ def measure_time_async(func):
         return result
 
     return wrapper
+
+
+class TimingStats:
+    """
+    Accumulates durations of an operation (e.g. waiting for a lock) to log or compare them later.
+    If log_interval is given, the summary is logged every log_interval samples.
+    """
+
+    def __init__(self, name, log_interval=None):
+        self.name = name
+        self.log_interval = log_interval
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if self.log_interval and self.count % self.log_interval == 0:
+            logger.info(self)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return "{}: count={}, mean={:.6f}s, max={:.6f}s, total={:.6f}s".format(
+            self.name, self.count, self.mean, self.max, self.total
+        )
@@ -1,10 +1,21 @@
+import asyncio
 import discord
 import logging
+from collections import Counter
 from discord.ext import commands
 from typing import Optional
 
 from bot.config.logging_config import log_handler, console_handler
-from bot.config.const import DISCORD_COMMAND_PREFIX, DEFAULT_LOG_LEVEL
+from bot.config.const import (
+    DISCORD_COMMAND_PREFIX,
+    DEFAULT_LOG_LEVEL,
+    USER_CACHE_MAX_SIZE,
+    USER_CACHE_TTL_SECONDS,
+    USER_CACHE_STATS_LOG_INTERVAL,
+    MESSAGE_CACHE_ENABLED,
+    MESSAGE_CACHE_MAX_SIZE,
+)
+from bot.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(DEFAULT_LOG_LEVEL)
@@ -14,6 +25,20 @@ logger.addHandler(console_handler)
 
 client = None
 
+# Users fetched from Discord API (those that aren't in the member cache of the server)
+user_cache = LRUCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+# user_id -> future of the fetch_user request that is in progress, so that concurrent lookups of the
+# same user make only one request
+user_lookups_in_flight = {}
+# Number of lookups by the source of the user: "member" (the member cache of the server), "cache"
+# (user_cache), "fetch" (Discord API) and "coalesced" (waited for a request already in progress)
+user_lookup_stats = Counter()
+
+# Fetched messages of active proposals, by message id
+message_cache = LRUCache(MESSAGE_CACHE_MAX_SIZE)
+# Ids of the messages that are allowed to be cached (see cache_messages)
+cacheable_message_ids = set()
+
 
 async def get_members_count_with_role(client: discord.Client, role_id: int):
     """
@@ -47,21 +72,108 @@ async def get_user_by_id_or_mention(id_or_mention):
     else:
         user_id = int(id_or_mention)
     # Retrieve the user
-    return await client.fetch_user(user_id)
+    return await get_user_by_id(user_id)
+
+
+def count_user_lookup(source):
+    user_lookup_stats[source] += 1
+    total = sum(user_lookup_stats.values())
+    if total % USER_CACHE_STATS_LOG_INTERVAL == 0:
+        logger.info("User lookups by source (total %d): %s", total, dict(user_lookup_stats))
+
+
+async def get_user_by_id(user_id: int):
+    """
+    Returns the user with the given id. The member cache of the server is tried first, then the
+    cache of the users fetched earlier, and only then the user is fetched from Discord API.
+    """
+    for guild in client.guilds:
+        member = guild.get_member(user_id)
+        if member is not None:
+            count_user_lookup("member")
+            return member
+
+    user = user_cache.get(user_id)
+    if user is not None:
+        count_user_lookup("cache")
+        return user
+
+    # If the same user is already being fetched, wait for that request instead of making a new one
+    if user_id in user_lookups_in_flight:
+        count_user_lookup("coalesced")
+        return await asyncio.shield(user_lookups_in_flight[user_id])
+
+    count_user_lookup("fetch")
+    future = asyncio.get_running_loop().create_future()
+    user_lookups_in_flight[user_id] = future
+    try:
+        user = await client.fetch_user(user_id)
+    except Exception as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved, in case nobody else was waiting for it
+        future.exception()
+        raise
+    except BaseException:
+        # The lookup was cancelled (CancelledError isn't an Exception), so the coalesced lookups
+        # are cancelled too instead of waiting forever
+        future.cancel()
+        raise
+    else:
+        user_cache.set(user_id, user)
+        future.set_result(user)
+        return user
+    finally:
+        del user_lookups_in_flight[user_id]
 
 
 async def get_message(client: discord.Client, channel_id: int, message_id: int):
     """
-    Returns the message with the specified ID from the specified channel.
+    Returns the message with the specified ID from the specified channel. Messages of active
+    proposals are returned from the cache if they were fetched before.
     """
+    use_cache = MESSAGE_CACHE_ENABLED and message_id in cacheable_message_ids
+    if use_cache:
+        message = message_cache.get(message_id)
+        if message is not None:
+            return message
+
     channel = client.get_channel(channel_id)
     try:
-        return await channel.fetch_message(message_id)
+        message = await channel.fetch_message(message_id)
     except Exception:
         logger.warning(
             "Unable to retrieve message with id=%s from channel %s", message_id, channel_id
         )
         return None
+    # Make sure the message wasn't forgotten while it was fetched
+    if use_cache and message_id in cacheable_message_ids:
+        message_cache.set(message_id, message)
+    return message
+
+
+def cache_messages(*message_ids):
+    """
+    Allows caching of the messages with the given ids (they will be cached when fetched first time).
+    """
+    cacheable_message_ids.update(message_ids)
+
+
+def forget_messages(*message_ids):
+    """
+    Stops caching the messages with the given ids, and removes them from the cache.
+    """
+    for message_id in message_ids:
+        cacheable_message_ids.discard(message_id)
+        message_cache.pop(message_id)
+
+
+def invalidate_message(message_id):
+    """
+    Removes the message from the cache (e.g. when it was edited or deleted), so that it's fetched
+    next time.
+    """
+    if message_cache.pop(message_id) is not None:
+        logger.debug("Invalidated cached message with id=%s", message_id)
 
 
 async def send_dm(guild_id, user_id, text):
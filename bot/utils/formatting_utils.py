@@ -1,4 +1,5 @@
 import re
+import asyncio
 import discord
 
 from datetime import datetime, timedelta
@@ -55,13 +56,22 @@ async def get_nickname_by_id_or_mention(id_or_mention):
     """
     # Retrieve the user
     user = await get_user_by_id_or_mention(id_or_mention)
-    # Return the nickname if the user was found
-    if type(user) is discord.User:
+    # Return the nickname if the user was found (members of the server are returned from the cache)
+    if isinstance(user, (discord.User, discord.Member)):
         return f"{user.name}#{user.discriminator}"
     # Otherwise return None
     return None
 
 
+async def get_nicknames_by_ids(ids):
+    """
+    Returns a dict of discord nicknames of the users with the given ids (retrieved concurrently).
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    nicknames = await asyncio.gather(*[get_nickname_by_id_or_mention(id) for id in unique_ids])
+    return dict(zip(unique_ids, nicknames))
+
+
 def get_mention_by_id(id):
     """
     Returns the Discord mention of the user by a given user id.
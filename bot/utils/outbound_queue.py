@@ -0,0 +1,163 @@
+import asyncio
+import logging
+
+import discord
+
+from bot.config.logging_config import log_handler, console_handler
+from bot.config.const import (
+    DEFAULT_LOG_LEVEL,
+    OUTBOUND_QUEUE_MAX_SIZE,
+    OUTBOUND_QUEUE_DRAIN_TIMEOUT_SECONDS,
+    OUTBOUND_ROUTE_CONCURRENCY,
+    OUTBOUND_MAX_RETRIES,
+    OUTBOUND_RETRY_BACKOFF_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(DEFAULT_LOG_LEVEL)
+logger.addHandler(log_handler)
+logger.addHandler(console_handler)
+
+
+def is_retryable(error):
+    """
+    Returns True if the Discord API call that raised the error may succeed if repeated later.
+    """
+    if isinstance(error, discord.HTTPException):
+        # Server errors and rate limits are temporary (e.g. 403 Forbidden or 404 Not Found aren't)
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+class OutboundActionQueue:
+    """
+    Bounded queues of Discord side effects (such as DMs, reaction removal and message edits),
+    processed in the background by pools of workers. This way the side effects don't need to be
+    awaited while holding a proposal lock.
+
+    Each action belongs to a route (e.g. "dm", "reaction", "message"). Every route has its own
+    queue of max_size actions, processed by as many workers as given in route_concurrency, so that a
+    slow or failing route (e.g. a burst of DMs that are retried) doesn't delay the other routes.
+    Failed actions are retried with exponential backoff if the error is temporary. If the queue of a
+    route is full, new actions are dropped.
+    """
+
+    def __init__(
+        self,
+        max_size=OUTBOUND_QUEUE_MAX_SIZE,
+        route_concurrency=OUTBOUND_ROUTE_CONCURRENCY,
+        max_retries=OUTBOUND_MAX_RETRIES,
+        retry_backoff_seconds=OUTBOUND_RETRY_BACKOFF_SECONDS,
+    ):
+        self.route_concurrency = dict(route_concurrency)
+        self.queues = {route: asyncio.Queue(maxsize=max_size) for route in route_concurrency}
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.worker_tasks = {route: [] for route in route_concurrency}
+
+    def enqueue(self, route, action, description):
+        """
+        Adds an action to the queue of the route without waiting, so that it can be called while
+        holding a lock. The action is a coroutine function without arguments; the description is
+        used in logs. If the queue is full (i.e. Discord doesn't keep up for a long time), the
+        action is dropped. Returns True if the action was queued.
+        """
+        if route not in self.queues:
+            raise ValueError(f"Unknown outbound route: {route}")
+        self._ensure_workers(route)
+        queue = self.queues[route]
+        try:
+            queue.put_nowait((action, description))
+        except asyncio.QueueFull:
+            logger.error(
+                "Outbound queue of route %s is full (%d actions), dropping action: %s",
+                route,
+                queue.qsize(),
+                description,
+            )
+            return False
+        return True
+
+    def qsize(self):
+        """
+        Returns the number of queued actions of all routes.
+        """
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    async def join(self):
+        """
+        Waits until all queued actions are processed.
+        """
+        await asyncio.gather(*(queue.join() for queue in self.queues.values()))
+
+    async def close(self, timeout=OUTBOUND_QUEUE_DRAIN_TIMEOUT_SECONDS):
+        """
+        Waits up to timeout seconds for the queued actions to be sent (e.g. before the bot shuts
+        down), and stops the workers.
+        """
+        tasks = [task for route_tasks in self.worker_tasks.values() for task in route_tasks]
+        if tasks:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    "Outbound queue wasn't drained in %s seconds, %d action(s) are lost",
+                    timeout,
+                    self.qsize(),
+                )
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.worker_tasks = {route: [] for route in self.queues}
+
+    def _ensure_workers(self, route):
+        tasks = [task for task in self.worker_tasks[route] if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(tasks) < self.route_concurrency[route]:
+            tasks.append(loop.create_task(self._work(self.queues[route])))
+        self.worker_tasks[route] = tasks
+
+    async def _work(self, queue):
+        while True:
+            action, description = await queue.get()
+            try:
+                await self._run(action, description)
+            finally:
+                queue.task_done()
+
+    async def _run(self, action, description):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await action()
+                return
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    logger.error(
+                        "Outbound action failed after %d attempt(s): %s",
+                        attempt + 1,
+                        description,
+                        exc_info=True,
+                    )
+                    return
+                delay = self.retry_backoff_seconds * 2**attempt
+                logger.warning(
+                    "Outbound action failed, retrying in %s seconds: %s (%s)",
+                    delay,
+                    description,
+                    e,
+                )
+                await asyncio.sleep(delay)
+
+
+outbound_queue = None
+
+
+def get_outbound_queue() -> OutboundActionQueue:
+    """
+    Returns the queue of Discord side effects used by the bot.
+    """
+    global outbound_queue
+
+    if outbound_queue is None:
+        outbound_queue = OutboundActionQueue()
+    return outbound_queue
@@ -5,6 +5,8 @@ import logging
 import sys
 import asyncio
 import datetime
+import time
+from contextlib import asynccontextmanager
 from typing import List
 from sqlalchemy.orm.collections import InstrumentedList
 
@@ -13,18 +15,30 @@ from multipledispatch import dispatch
 
 from bot.utils.db_utils import DBUtil
 
-from bot.utils.formatting_utils import get_nickname_by_id_or_mention
-from bot.utils.discord_utils import get_discord_client, get_message
+from bot.utils.formatting_utils import get_nicknames_by_ids
+from bot.utils.analytics_utils import add_user_stats, get_proposal_user_stats
+from bot.utils.discord_utils import (
+    get_discord_client,
+    get_message,
+    cache_messages,
+    forget_messages,
+)
+from bot.utils.dev_utils import TimingStats
 from bot.config.logging_config import log_handler, console_handler
-from bot.config.schemas import Proposals, Voters, FinanceRecipients, ProposalHistory
+from bot.config.schemas import (
+    Proposals,
+    Voters,
+    FinanceRecipients,
+    FinanceRecipientUsers,
+    ProposalHistory,
+)
 from bot.config.const import (
     DEFAULT_LOG_LEVEL,
     Vote,
     VOTING_CHANNEL_ID,
-    DB_ARRAY_COLUMN_SEPARATOR,
-    COMMA_LIST_SEPARATOR,
     GRANT_APPLY_CHANNEL_ID,
     RESPONSIBLE_MENTION,
+    PROPOSAL_LOCK_STATS_LOG_INTERVAL,
 )
 
 logger = logging.getLogger(__name__)
@@ -36,29 +50,119 @@ client = get_discord_client()
 db = DBUtil()
 
 proposals = {}
-# The lock is used while cancelling or accepting a proposal. This way concurrency errors related to
-# removing and adding DB items can be avoided
-proposal_lock = asyncio.Lock()
+# Index of the voters of active proposals, keyed by (voting_message_id, user_id). The values are lists,
+# because there may be more than one voter with the same key if there's an error in the system. The
+# index must be updated along with the voters of proposals (see add_voter, remove_voter, add_proposal
+# and remove_proposal), use check_voters_index to verify that it's consistent.
+voters_index = {}
+# Reverse index of active proposals by the ids of the messages that are not voting messages, but are
+# associated with the proposals - the original proposer message (message_id) and the bot reply to it
+# (bot_response_message_id). Updated by add_proposal and remove_proposal.
+proposals_by_initiating_message = {}
+# Locks of single proposals, keyed by voting_message_id. Operations on a proposal (voting, cancelling
+# or accepting it) hold its lock (see lock_proposal), so that concurrency errors related to removing and
+# adding DB items can be avoided, while a slow operation on one proposal doesn't block the others
+proposal_locks = {}
+# Number of coroutines holding or waiting for the lock of a proposal, keyed by voting_message_id. The
+# lock of a proposal that isn't active is dropped when nobody uses it (see discard_proposal_lock)
+proposal_lock_users = {}
+# How long it takes to acquire the lock of a proposal, and how long it is held
+lock_wait_stats = TimingStats("Proposal lock wait", PROPOSAL_LOCK_STATS_LOG_INTERVAL)
+lock_hold_stats = TimingStats("Proposal lock hold", PROPOSAL_LOCK_STATS_LOG_INTERVAL)
+
+
+def get_proposal_lock(voting_message_id):
+    if voting_message_id not in proposal_locks:
+        proposal_locks[voting_message_id] = asyncio.Lock()
+    return proposal_locks[voting_message_id]
+
+
+def discard_proposal_lock(voting_message_id):
+    """
+    Drops the lock of a proposal that isn't active, unless a coroutine still holds or waits for it.
+    """
+    if voting_message_id not in proposals and not proposal_lock_users.get(voting_message_id):
+        proposal_locks.pop(voting_message_id, None)
+        proposal_lock_users.pop(voting_message_id, None)
+
+
+@asynccontextmanager
+async def lock_proposal(voting_message_id):
+    """
+    Acquires the lock of a single proposal.
+    """
+    started_at = time.perf_counter()
+    proposal_lock_users[voting_message_id] = proposal_lock_users.get(voting_message_id, 0) + 1
+    try:
+        async with get_proposal_lock(voting_message_id):
+            acquired_at = time.perf_counter()
+            lock_wait_stats.add(acquired_at - started_at)
+            try:
+                yield
+            finally:
+                lock_hold_stats.add(time.perf_counter() - acquired_at)
+    finally:
+        proposal_lock_users[voting_message_id] -= 1
+        # A handler may lock a proposal that has been removed in the meantime (or was never added)
+        discard_proposal_lock(voting_message_id)
+
+
+def index_voter(voter):
+    voters_index.setdefault((voter.voting_message_id, voter.user_id), []).append(voter)
+
+
+def unindex_voter(voter):
+    key = (voter.voting_message_id, voter.user_id)
+    indexed_voters = voters_index.get(key, [])
+    # Compare by identity, as ORM objects don't define equality
+    for i, indexed_voter in enumerate(indexed_voters):
+        if indexed_voter is voter:
+            del indexed_voters[i]
+            break
+    else:
+        logger.warning("Unable to find voter in the index: %s", voter)
+    if not indexed_voters:
+        voters_index.pop(key, None)
+
+
+def check_voters_index():
+    """
+    Verifies that the voters index matches the voters of active proposals. Returns a list of
+    descriptions of inconsistencies found, which is empty if the index is consistent.
+    """
+    errors = []
+    expected_voters = {}
+    for voting_message_id, proposal in proposals.items():
+        for voter in proposal.voters:
+            if voter.voting_message_id != voting_message_id:
+                errors.append(
+                    f"Voter {voter} is associated with proposal voting_message_id={voting_message_id}"
+                )
+            expected_voters.setdefault((voter.voting_message_id, voter.user_id), []).append(voter)
+
+    for key in expected_voters.keys() | voters_index.keys():
+        expected_ids = sorted(id(voter) for voter in expected_voters.get(key, []))
+        indexed_ids = sorted(id(voter) for voter in voters_index.get(key, []))
+        if expected_ids != indexed_ids:
+            errors.append(
+                f"Index mismatch for (voting_message_id, user_id)={key}: "
+                f"{len(expected_ids)} voter(s) in proposals, {len(indexed_ids)} in the index"
+            )
+    return errors
 
 
 def find_matching_voter(user_id, voting_message_id):
     """
     Returns either a single Voter object that matches the provided user_id and voting_message_id, or a list of Voter objects that match, which is usually empty but may contain multiple objects if there's an error in the system.
     """
-    voters_found = []
-    # Iterate through proposals and check for voters with matching ids
-    for id in proposals:
-        p = proposals[id]
-        for v in p.voters:
-            if v.user_id == user_id and v.voting_message_id == voting_message_id:
-                voters_found.append(v)
+    voters_found = voters_index.get((voting_message_id, user_id), [])
     # If a single match is found, return it
     if len(voters_found) == 1:
         return voters_found[0]
-    # Otherwise return the entire array (it should be empty most of the time, the case when there's
-    # more than 1 match is erroneous, but may happen and should be handled accordingly)
+    # Otherwise return a copy of the entire array (it should be empty most of the time, the case when
+    # there's more than 1 match is erroneous, but may happen and should be handled accordingly)
     else:
-        return voters_found
+        return list(voters_found)
 
 
 def get_voters_with_vote(proposal, vote: Vote):
@@ -73,18 +177,32 @@ def get_voters_with_vote(proposal, vote: Vote):
 
 
 async def add_voter(proposal, voter):
-    await db.add(voter)
-    await db.append(proposal.voters, voter)
+    async with db.transaction(write_behind=True):
+        proposal.voters.append(voter)
+    index_voter(voter)
 
 
 async def remove_voter(proposal, voter):
-    await db.remove(proposal.voters, voter)
-    await db.delete(voter)
+    # The voter is deleted by the delete-orphan cascade
+    async with db.transaction(write_behind=True):
+        proposal.voters.remove(voter)
+    unindex_voter(voter)
 
 
-async def add_finance_recipient(proposal, recipient):
-    await db.add(recipient)
-    await db.append(proposal.finance_recipients, recipient)
+async def update_voters(proposal, voters_to_add, voters_to_remove):
+    """
+    Adds and removes voters of the proposal in a single DB transaction. Removed voters are deleted
+    by the delete-orphan cascade.
+    """
+    async with db.transaction():
+        for voter in voters_to_remove:
+            proposal.voters.remove(voter)
+        for voter in voters_to_add:
+            proposal.voters.append(voter)
+    for voter in voters_to_remove:
+        unindex_voter(voter)
+    for voter in voters_to_add:
+        index_voter(voter)
 
 
 def is_relevant_proposal(voting_message_id):
@@ -109,25 +227,47 @@ def get_proposal(voting_message_id):
         raise ValueError(f"Invalid proposal ID: {voting_message_id}")
 
 
+def get_initiating_message_ids(proposal):
+    """
+    Returns ids of the original proposer message and the bot reply to it (the reply may be missing,
+    e.g. when a proposal is submitted in the voting channel).
+    """
+    return [
+        message_id
+        for message_id in (proposal.message_id, proposal.bot_response_message_id)
+        if message_id
+    ]
+
+
 def get_proposal_initiated_by(message_id):
     """
     Returns a proposal that was either initiated by a message with the given id, or the bot has replied with a message of given id to the initial proposer message (bot_response_message_id).Use case: to cover users who have reacted to a wrong message (this is helpful during onboarding).
     """
-    if not proposals:
-        return None
-    for proposal in proposals.values():
-        if proposal.message_id == message_id or proposal.bot_response_message_id == message_id:
-            return proposal
-    return None
+    return proposals_by_initiating_message.get(message_id)
 
 
 async def remove_proposal(voting_message_id, db: DBUtil):
     if voting_message_id in proposals:
         logger.info("Removing data: %s", proposals[voting_message_id])
+        # Keep the voters to remove them from the index (the collection shouldn't be accessed after
+        # the proposal is deleted from DB)
+        removed_voters = list(proposals[voting_message_id].voters)
+        removed_message_ids = get_initiating_message_ids(proposals[voting_message_id])
         # Removing from DB; the delete-orphan cascade will clean up the Voters table with the associated data
         await db.delete(proposals[voting_message_id])
+        # Removing voters from the index
+        for voter in removed_voters:
+            unindex_voter(voter)
+        # Removing from the reverse index
+        for message_id in removed_message_ids:
+            proposals_by_initiating_message.pop(message_id, None)
+        # The messages don't need to be cached anymore
+        forget_messages(voting_message_id, *removed_message_ids)
         # Removing from dict
         del proposals[voting_message_id]
+        # The coroutines that still wait for the lock keep it until they find out that the proposal
+        # isn't relevant anymore
+        discard_proposal_lock(voting_message_id)
     else:
         logger.critical(
             f"Unable to remove the proposal {voting_message_id} - it couldn't be found in the list of active proposals."
@@ -205,6 +345,16 @@ def add_proposal(new_proposal):
 
     # Adding to dict
     proposals[new_proposal.voting_message_id] = new_proposal
+    # Adding voters to the index (when restoring proposals from DB, voters are loaded along with them)
+    for voter in new_proposal.voters:
+        index_voter(voter)
+    # Adding to the reverse index
+    for message_id in get_initiating_message_ids(new_proposal):
+        proposals_by_initiating_message[message_id] = new_proposal
+    # Messages of active proposals are retrieved often (e.g. on every vote), so they're cached
+    cache_messages(
+        new_proposal.voting_message_id, *get_initiating_message_ids(new_proposal)
+    )
     logger.info("Added proposal with voting_message_id=%s", new_proposal.voting_message_id)
 
 
@@ -223,13 +373,37 @@ async def add_proposal(new_proposal, db):
         raise Exception("Incorrect DB identifier was given.")
 
 
-async def save_proposal_to_history(db, proposal, result, remove_from_main_db=True):
+def get_history_nickname_ids(proposal):
+    """
+    Returns the ids of the users whose nicknames are retrieved when the proposal is saved to history:
+    the author and the voters whose nicknames weren't saved when voting (e.g. voters restored during
+    recovery).
+    """
+    return [proposal.author_id] + [
+        voter.user_id for voter in proposal.voters if not voter.user_nickname
+    ]
+
+
+async def get_history_nicknames(proposal):
+    """
+    Returns the nicknames needed to save the proposal to history (see get_history_nickname_ids). They
+    may require API calls, so they're retrieved before locking the proposal and given to
+    save_proposal_to_history.
+    """
+    return await get_nicknames_by_ids(get_history_nickname_ids(proposal))
+
+
+async def save_proposal_to_history(
+    db, proposal, result, remove_from_main_db=True, voting_message=None, nicknames=None
+):
     """
     Adds a proposal to the ProposalHistory table after it has been processed.
 
     Parameters:
     proposal (Proposals): The original proposal that needs to be added to the history.
     result (ProposalResult): The result of the proposal. This should be one of the enumerated values in `ProposalResult`.
+    voting_message (optional): The voting message of the proposal, if it was already retrieved.
+    nicknames (optional): The nicknames retrieved with get_history_nicknames before the proposal was locked; the missing ones (e.g. of the voters added since then) are retrieved here.
     """
 
     def replace_mentions_with_nicknames(description, id_to_nickname_map):
@@ -244,8 +418,18 @@ async def save_proposal_to_history(db, proposal, result, remove_from_main_db=Tru
         return re.sub(r"<@(\d+)>", replace_mention, description)
 
     try:
+        # Make sure all votes are saved before the result is
+        await db.flush()
         # Retrieving voting message to save URL
-        voting_message = await get_message(client, VOTING_CHANNEL_ID, proposal.voting_message_id)
+        if voting_message is None:
+            voting_message = await get_message(
+                client, VOTING_CHANNEL_ID, proposal.voting_message_id
+            )
+        # Retrieve the nicknames that weren't retrieved beforehand, all at once
+        nicknames = dict(nicknames or {})
+        missing_ids = [id for id in get_history_nickname_ids(proposal) if id not in nicknames]
+        if missing_ids:
+            nicknames.update(await get_nicknames_by_ids(missing_ids))
         # Create a history item (such verbose form is used because copying values from proposal.__dict__
         # has resulted into floating bugs related to ORM "lazy loading")
         history_item = ProposalHistory(
@@ -266,44 +450,35 @@ async def save_proposal_to_history(db, proposal, result, remove_from_main_db=Tru
             result=result.value,
             voting_message_url=voting_message.jump_url,
             # Retrieve author nickname by ID, so it can be used quickly when exporting analytics
-            author_nickname=await get_nickname_by_id_or_mention(proposal.author_id),
+            author_nickname=nicknames[proposal.author_id],
         )
-        # Add a history item and flush the changes so to assign id to the history proposal and associate other objects with it later
-        await db.add(history_item, is_history=True)
-
-        # Make a copy of the voters
-        copied_voters = []
-        for voter in proposal.voters:
-            copied_voter = Voters(
-                user_id=voter.user_id,
-                user_nickname=await get_nickname_by_id_or_mention(voter.user_id),
-                value=voter.value,
-                voting_message_id=voter.voting_message_id,
-                proposal_id=history_item.id,
-            )
-            copied_voters.append(copied_voter)
-        # Add the copied voters to the Voters table
-        await db.add_all(copied_voters, is_history=True)
-
-        # Make a copy of the recipients
-        copied_recipients = []
-        for recipient in proposal.finance_recipients:
-            copied_recipient = FinanceRecipients(
-                proposal_id=history_item.id,
-                recipient_ids=recipient.recipient_ids,
-                recipient_nicknames=recipient.recipient_nicknames,
-                amount=recipient.amount,
-            )
-            copied_recipients.append(copied_recipient)
-        # Add the copied recipients to the FinanceRecipients table
-        await db.add_all(copied_recipients, is_history=True)
+        # Make a copy of the voters (as rows to insert them in bulk)
+        copied_voters = [
+            {
+                "user_id": voter.user_id,
+                "user_nickname": voter.user_nickname or nicknames[voter.user_id],
+                "value": voter.value,
+                "voting_message_id": voter.voting_message_id,
+            }
+            for voter in proposal.voters
+        ]
+
+        # Make a copy of the recipients groups, and of the users of each group
+        copied_recipients = [{"amount": recipient.amount} for recipient in proposal.finance_recipients]
+        copied_recipient_users = [
+            [
+                {"user_id": user.user_id, "user_nickname": user.user_nickname}
+                for user in recipient.recipients
+            ]
+            for recipient in proposal.finance_recipients
+        ]
 
         # Create a mapping of ids to nicknames
-        id_to_nickname_map = {}
-        for recipient in copied_recipients:
-            ids = recipient.recipient_ids.split(DB_ARRAY_COLUMN_SEPARATOR)
-            nicknames = recipient.recipient_nicknames.split(COMMA_LIST_SEPARATOR)
-            id_to_nickname_map.update(zip(ids, nicknames))
+        id_to_nickname_map = {
+            str(user["user_id"]): user["user_nickname"]
+            for users in copied_recipient_users
+            for user in users
+        }
         # Replace all mentions in description with the actual nicknames
         # Once I faced a bug during recovery when cancelling proposals, that the description got empty for unknown reason, so we do null checks just in case
         if history_item.description and id_to_nickname_map:
@@ -311,8 +486,34 @@ async def save_proposal_to_history(db, proposal, result, remove_from_main_db=Tru
                 history_item.description, id_to_nickname_map
             )
 
-        # Save the changes
-        await db.save(is_history=True)
+        # Save the history item along with the voters and recipients in a single transaction
+        async with db.transaction(is_history=True) as session:
+            session.add(history_item)
+            # Flush the history item so to assign id to it and associate other objects with it
+            await db.run_in_db_thread(session.flush)
+            for copied_row in copied_voters + copied_recipients:
+                copied_row["proposal_id"] = history_item.id
+            await db.run_in_db_thread(db.execute_insert, session, Voters, copied_voters)
+            recipient_ids = await db.run_in_db_thread(
+                db.execute_insert, session, FinanceRecipients, copied_recipients, True
+            )
+            for recipient_id, users in zip(recipient_ids, copied_recipient_users):
+                for user in users:
+                    user["finance_recipient_id"] = recipient_id
+            await db.run_in_db_thread(
+                db.execute_insert,
+                session,
+                FinanceRecipientUsers,
+                [user for users in copied_recipient_users for user in users],
+            )
+            # Update the analytics of the author, voters and recipients along with the history
+            await db.run_in_db_thread(
+                add_user_stats,
+                session,
+                get_proposal_user_stats(
+                    history_item, copied_voters, copied_recipients, copied_recipient_users
+                ),
+            )
         logger.debug(
             "Added history item %s",
             history_item,
@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import logging
+import itertools
+from datetime import datetime
+
+from bot.config.logging_config import log_handler, console_handler
+from bot.config.const import DEFAULT_LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(DEFAULT_LOG_LEVEL)
+logger.addHandler(log_handler)
+logger.addHandler(console_handler)
+
+
+class DeadlineScheduler:
+    """
+    Runs callbacks at given deadlines using a single coroutine. Deadlines are kept in a min-heap, and
+    the coroutine sleeps exactly until the earliest one, so the number of wakeups doesn't depend on
+    the number of scheduled items.
+
+    Each item is identified by a key (e.g. voting_message_id). Cancelled or rescheduled items are not
+    removed from the heap immediately; instead, every key maps to the heap entry that is currently
+    valid, and stale entries are skipped when they are popped.
+
+    Deadlines are naive datetimes in UTC, the same way they are stored in DB (e.g. closed_at).
+    """
+
+    def __init__(self):
+        # Heap of (deadline, sequence number, key) tuples
+        self.heap = []
+        # Maps a key to its active heap entry and the callback to run
+        self.entries = {}
+        # Used to break ties between equal deadlines and to tell stale heap entries apart
+        self.counter = itertools.count()
+        # Set whenever the earliest deadline may have changed, to wake up the runner
+        self.wakeup = asyncio.Event()
+        self.runner_task = None
+
+    def schedule(self, key, deadline: datetime, callback):
+        """
+        Schedules the coroutine function callback(key) to run at the given deadline. If the key is
+        already scheduled, the previous deadline and callback are replaced.
+        """
+        entry = (deadline, next(self.counter), key)
+        self.entries[key] = (entry, callback)
+        heapq.heappush(self.heap, entry)
+        logger.debug("Scheduled key=%s at %s", key, deadline)
+        self._ensure_running()
+        self.wakeup.set()
+
+    def reschedule(self, key, deadline: datetime):
+        """
+        Moves the deadline of an already scheduled key. Raises ValueError if the key isn't scheduled.
+        """
+        if key not in self.entries:
+            raise ValueError(f"Unable to reschedule key={key} - it isn't scheduled.")
+        self.schedule(key, deadline, self.entries[key][1])
+
+    def cancel(self, key):
+        """
+        Cancels the scheduled key. Returns True if it was scheduled, False otherwise.
+        """
+        if self.entries.pop(key, None) is None:
+            return False
+        logger.debug("Cancelled key=%s", key)
+        self.wakeup.set()
+        return True
+
+    def is_scheduled(self, key):
+        return key in self.entries
+
+    def get_deadline(self, key):
+        return self.entries[key][0][0] if key in self.entries else None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _ensure_running(self):
+        if self.runner_task is None or self.runner_task.done():
+            self.runner_task = asyncio.get_running_loop().create_task(self._run())
+
+    def _pop_stale_entries(self):
+        """
+        Removes heap entries that were cancelled or rescheduled from the top of the heap.
+        """
+        while self.heap:
+            entry = self.heap[0]
+            active = self.entries.get(entry[2])
+            if active is not None and active[0] == entry:
+                return
+            heapq.heappop(self.heap)
+
+    async def _run(self):
+        while True:
+            self.wakeup.clear()
+            self._pop_stale_entries()
+            if not self.heap:
+                # Nothing to do until something gets scheduled
+                await self.wakeup.wait()
+                continue
+
+            deadline, _, key = self.heap[0]
+            delay = (deadline - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    # Sleep until the deadline, unless the heap was changed earlier
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                    continue
+                except asyncio.TimeoutError:
+                    # Something could have been changed in the heap exactly at the time of timeout
+                    continue
+
+            # The deadline has come - run the callback in a separate task, so that a slow callback
+            # won't delay other deadlines
+            heapq.heappop(self.heap)
+            _, callback = self.entries.pop(key)
+            logger.debug("Deadline has come for key=%s", key)
+            asyncio.get_running_loop().create_task(callback(key))
+
+
+approval_scheduler = None
+
+
+def get_approval_scheduler() -> DeadlineScheduler:
+    """
+    Returns the scheduler that runs approval of proposals when their voting time ends.
+    """
+    global approval_scheduler
+
+    if approval_scheduler is None:
+        approval_scheduler = DeadlineScheduler()
+    return approval_scheduler
@@ -1,5 +1,6 @@
 import discord
 import asyncio
+from collections import Counter
 from datetime import datetime, timedelta
 
 from bot.config.logging_config import log_handler, console_handler
@@ -15,12 +16,21 @@ from bot.utils.proposal_utils import (
     find_matching_voter,
     get_proposal_initiated_by,
     get_voters_with_vote,
-    proposal_lock,
+    lock_proposal,
+    get_history_nicknames,
     save_proposal_to_history,
 )
 from bot.utils.db_utils import DBUtil
 from bot.utils.validation import validate_roles
-from bot.utils.discord_utils import get_discord_client, get_message, send_dm, remove_reactions
+from bot.utils.discord_utils import (
+    get_discord_client,
+    get_message,
+    send_dm,
+    remove_reactions,
+    invalidate_message,
+)
+from bot.utils.scheduler import get_approval_scheduler
+from bot.utils.outbound_queue import get_outbound_queue
 from bot.utils.formatting_utils import (
     get_amount_to_print,
     get_discord_countdown_plus_delta,
@@ -37,61 +47,87 @@ db = DBUtil()
 client = get_discord_client()
 
 
-async def is_valid_voting_reaction(payload):
-    logger.debug("Verifying the reaction...")
+# Voting emojis, precomputed to filter out irrelevant reactions with a single lookup
+VOTING_EMOJIS = frozenset((EMOJI_VOTING_YES, EMOJI_VOTING_NO))
+# Number of reactions rejected at each stage of is_valid_voting_reaction (and the number of accepted
+# ones), to see where the traffic goes
+reaction_filter_stats = Counter()
+
+
+def count_reaction(stage):
+    reaction_filter_stats[stage] += 1
+    total = sum(reaction_filter_stats.values())
+    if total % REACTION_FILTER_STATS_LOG_INTERVAL == 0:
+        logger.info("Reaction filter stats after %d reactions: %s", total, reaction_filter_stats)
+
+
+def reject_reaction(stage):
+    count_reaction(stage)
+    return False
 
+
+async def is_valid_voting_reaction(payload):
+    """
+    Checks whether the reaction is a vote on an active proposal. The checks go from the cheapest to
+    the most expensive ones, so that most of irrelevant reactions are rejected with a couple of set
+    lookups, before any guild, member or role data is retrieved:
+    1) the emoji is a voting emoji;
+    2) the message is a voting message of an active proposal (or, when adding a reaction, the message
+    that initiated an active proposal, in which case the user is helped to find the voting message);
+    3) the user is not the bot itself;
+    4) the user has a role that is allowed to vote.
+    """
     # Check if the reaction matches
-    if payload.emoji.name != EMOJI_VOTING_NO and payload.emoji.name != EMOJI_VOTING_YES:
-        return False
-    logger.debug("Emoji is a correct voting emoji - OK")
+    if payload.emoji.name not in VOTING_EMOJIS:
+        return reject_reaction("emoji")
+
+    # Check if the reaction message is a relevant lazy consensus voting
+    is_voting_message = payload.channel_id == VOTING_CHANNEL_ID and is_relevant_proposal(
+        payload.message_id
+    )
+    # Otherwise, when adding reaction, check if the user has attempted to vote on a wrong message - either the original proposer message, or the bots reply to it, associated with an active proposal though (in order to help onboard new users)
+    incorrect_reaction_proposal = None
+    if not is_voting_message and payload.event_type == "REACTION_ADD":
+        incorrect_reaction_proposal = get_proposal_initiated_by(payload.message_id)
+    if not is_voting_message and not incorrect_reaction_proposal:
+        return reject_reaction("message")
+    logger.debug("The message is associated with an active proposal - OK")
 
     # The bot adds voting reactions to each message as a template, so it should be filtered out
     if payload.user_id == BOT_ID:
-        return False
+        return reject_reaction("bot")
     logger.debug("Voter is not the bot itself - OK")
 
-    # Check if the user role matches
+    # Check if the user role matches (the member is only given in payload when adding reactions)
     guild = client.get_guild(payload.guild_id)
-    member = guild.get_member(payload.user_id)
+    member = payload.member if payload.member else guild.get_member(payload.user_id)
     if not await validate_roles(member):
-        return False
+        return reject_reaction("roles")
     logger.debug("The user has permissions to vote - OK")
 
-    reaction_channel = guild.get_channel(payload.channel_id)
-
-    # A hotfix for discord forums (the None channel is returned when a reaction is added to a message in a forum; though it works fine in other functions that use ctx.message.channel.id, such as propose)
-    if not reaction_channel:
-        logger.debug("Seems like a forum message - exiting")
-        return
-
-    # When adding reaction, check if the user has attempted to vote on a wrong message - either the original proposer message, or the bots reply to it, associated with an active proposal though (in order to help onboard new users)
-    if payload.event_type == "REACTION_ADD":
-        incorrect_reaction_proposal = get_proposal_initiated_by(payload.message_id)
-        if incorrect_reaction_proposal:
-            # Remove reaction from the message (only in channels that are allowed for bot to manage messages/reactions), in order not to confuse other members
-            if reaction_channel.id in CHANNELS_TO_REMOVE_HELPER_MESSAGES_AND_REACTIONS:
-                reaction_message = await reaction_channel.fetch_message(payload.message_id)
-                await reaction_message.remove_reaction(payload.emoji, member)
-
-            # Retrieve the relevant voting message to send link to the user
-            voting_message = await get_message(
-                client, VOTING_CHANNEL_ID, incorrect_reaction_proposal.voting_message_id
-            )
-            # Send private message to user
-            dm_channel = await member.create_dm()
-            await dm_channel.send(
-                HELP_MESSAGE_VOTED_INCORRECTLY.format(voting_link=voting_message.jump_url)
-            )
-
-    # Check if this is a voting channel
-    if reaction_channel.id != VOTING_CHANNEL_ID:
-        return False
-    logger.debug("The channel is a correct voting channel - OK")
+    if incorrect_reaction_proposal:
+        reaction_channel = guild.get_channel(payload.channel_id)
+        # Remove reaction from the message (only in channels that are allowed for bot to manage messages/reactions), in order not to confuse other members. The channel is None when a reaction is added to a message in a forum.
+        if (
+            reaction_channel
+            and reaction_channel.id in CHANNELS_TO_REMOVE_HELPER_MESSAGES_AND_REACTIONS
+        ):
+            reaction_message = await reaction_channel.fetch_message(payload.message_id)
+            await reaction_message.remove_reaction(payload.emoji, member)
+
+        # Retrieve the relevant voting message to send link to the user
+        voting_message = await get_message(
+            client, VOTING_CHANNEL_ID, incorrect_reaction_proposal.voting_message_id
+        )
+        # Send private message to user
+        dm_channel = await member.create_dm()
+        await dm_channel.send(
+            HELP_MESSAGE_VOTED_INCORRECTLY.format(voting_link=voting_message.jump_url)
+        )
+        return reject_reaction("wrong_message")
 
-    # Check if the reaction message is a relevant lazy consensus voting
-    if not is_relevant_proposal(payload.message_id):
-        return False
     logger.debug("The message is an active proposal - OK")
+    count_reaction("accepted")
     return True
 
 
@@ -103,8 +139,8 @@ async def on_raw_reaction_remove(payload):
         if not await is_valid_voting_reaction(payload):
             return
 
-        # Acquire the voting lock to avoid concurrency errors (such as new operations of adding or removing votes by the same user)
-        async with proposal_lock:
+        # Acquire the lock of the proposal to avoid concurrency errors (such as new operations of adding or removing votes by the same user)
+        async with lock_proposal(payload.message_id):
             # Double check to make sure the proposal wasn't accepted or cancelled while the lock was acquired by other thread
             if not is_relevant_proposal(payload.message_id):
                 logger.info("Proposal became irrelevant while waiting for a lock to remove voter.")
@@ -157,11 +193,26 @@ async def on_raw_reaction_remove(payload):
         )
 
 
-async def cancel_proposal(proposal, reason, voting_message):
-    # Extracting dynamic data to fill messages
+async def cancel_proposal(proposal, reason, voting_message, nicknames=None):
+    """
+    Cancels the proposal: removes it from the active ones and saves to history, and then queues the
+    Discord side effects (replying to the proposer, editing the voting message and removing voting
+    reactions), so that they don't need to be awaited while the proposal is locked. The nicknames
+    saved to history can be retrieved before locking the proposal (see get_history_nicknames).
+    """
+    # The proposal won't need to be approved anymore
+    get_approval_scheduler().cancel(proposal.voting_message_id)
+
+    # Extracting dynamic data to fill messages (the proposal object shouldn't be used after it's
+    # removed from DB, so the values are copied)
     # Don't remove unused variables because messages texts change too often
     mention_author = get_mention_by_id(proposal.author_id)
     description_of_proposal = proposal.description
+    not_financial = proposal.not_financial
+    threshold_positive = proposal.threshold_positive
+    original_channel_id = proposal.channel_id
+    original_message_id = proposal.message_id
+    voting_message_id = proposal.voting_message_id
 
     # Create lists of voters
     list_of_voters_for = []
@@ -176,83 +227,99 @@ async def cancel_proposal(proposal, reason, voting_message):
     list_of_voters_for = COMMA_LIST_SEPARATOR.join(list_of_voters_for)
     list_of_voters_against = COMMA_LIST_SEPARATOR.join(list_of_voters_against)
 
-    # Retrieve links to the messages
-    original_message = await get_message(client, proposal.channel_id, proposal.message_id)
-    link_to_voting_message = voting_message.jump_url
-    link_to_initial_proposer_message = (
-        original_message.jump_url if original_message else ERROR_MESSAGE_ORIGINAL_MESSAGE_MISSING
-    )
+    async def announce_cancellation():
+        # Retrieve links to the messages
+        original_message = await get_message(client, original_channel_id, original_message_id)
+        link_to_voting_message = voting_message.jump_url
+        link_to_initial_proposer_message = (
+            original_message.jump_url
+            if original_message
+            else ERROR_MESSAGE_ORIGINAL_MESSAGE_MISSING
+        )
 
-    # Filling the proposer response message based on the reason of cancelling
-    if reason == ProposalResult.CANCELLED_BY_PROPOSER:
-        if proposal.not_financial:
-            response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
-                author=mention_author
-            )
-        else:
-            response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
-                author=mention_author
+        # Filling the proposer response message based on the reason of cancelling
+        if reason == ProposalResult.CANCELLED_BY_PROPOSER:
+            if not_financial:
+                response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
+                    author=mention_author
+                )
+            else:
+                response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
+                    author=mention_author
+                )
+        elif reason == ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD:
+            if not_financial:
+                response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
+                    author=mention_author,
+                    threshold=LAZY_CONSENSUS_THRESHOLD_NEGATIVE,
+                    voting_link=link_to_voting_message,
+                )
+            else:
+                response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
+                    author=mention_author,
+                    threshold=LAZY_CONSENSUS_THRESHOLD_NEGATIVE,
+                    voting_link=link_to_voting_message,
+                )
+        elif reason == ProposalResult.CANCELLED_BY_NOT_REACHING_POSITIVE_THRESHOLD:
+            if not_financial:
+                response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format()
+            else:
+                response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format()
+
+        # Filling the voting channel message based on the reason of cancelling
+        if reason == ProposalResult.CANCELLED_BY_PROPOSER:
+            edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
+                author=mention_author, link_to_original_message=link_to_initial_proposer_message
             )
-        log_message = "(by the proposer)"
-    elif reason == ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD:
-        if proposal.not_financial:
-            response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
-                author=mention_author,
+        elif reason == ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD:
+            edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
                 threshold=LAZY_CONSENSUS_THRESHOLD_NEGATIVE,
-                voting_link=link_to_voting_message,
+                voters_list=list_of_voters_against,
+                link_to_original_message=link_to_initial_proposer_message,
             )
-        else:
-            response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format(
-                author=mention_author,
-                threshold=LAZY_CONSENSUS_THRESHOLD_NEGATIVE,
-                voting_link=link_to_voting_message,
+        elif reason == ProposalResult.CANCELLED_BY_NOT_REACHING_POSITIVE_THRESHOLD:
+            edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
+                supporters_number=number_of_voters_for,
+                yes_voting_reaction=EMOJI_VOTING_YES,
+                supporters_list=f" ({list_of_voters_for})" if list_of_voters_for else "",
+                threshold=threshold_positive,
+                link_to_original_message=link_to_initial_proposer_message,
             )
-        log_message = "(by reaching negative threshold_negative)"
-    elif reason == ProposalResult.CANCELLED_BY_NOT_REACHING_POSITIVE_THRESHOLD:
-        if proposal.not_financial:
-            response_to_proposer = GRANTLESS_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format()
-        else:
-            response_to_proposer = GRANT_PROPOSAL_RESULT_PROPOSER_RESPONSE[reason].format()
-        log_message = "(by not reaching positive threshold)"
 
-    # Filling the voting channel message based on the reason of cancelling
+        if original_message:
+            await original_message.add_reaction(REACTION_ON_PROPOSAL_CANCELLED)
+        # Reply in the original channel, unless it's not the voting channel itself (then not replying to avoid flooding)
+        if original_message and voting_message.channel.id != original_message.channel.id:
+            message = await original_message.reply(response_to_proposer)
+            # Remove embeds
+            await message.edit(suppress=True)
+        # Edit the proposal in the voting channel; suppress=True will remove embeds
+        await voting_message.edit(content=edit_in_voting_channel, suppress=True)
+        # Remove all voting reactions from the voting message, to keep the channel clean
+        await remove_reactions(voting_message, EMOJI_VOTING_YES, EMOJI_VOTING_NO)
+
+    # Add history item for analytics (this also removes the proposal from the active ones)
+    await save_proposal_to_history(
+        db, proposal, reason, voting_message=voting_message, nicknames=nicknames
+    )
+    # Announce the results in Discord
+    get_outbound_queue().enqueue(
+        "message",
+        announce_cancellation,
+        f"announcing cancellation of voting_message_id={voting_message_id}",
+    )
+
     if reason == ProposalResult.CANCELLED_BY_PROPOSER:
-        edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
-            author=mention_author, link_to_original_message=link_to_initial_proposer_message
-        )
+        log_message = "(by the proposer)"
     elif reason == ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD:
-        edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
-            threshold=LAZY_CONSENSUS_THRESHOLD_NEGATIVE,
-            voters_list=list_of_voters_against,
-            link_to_original_message=link_to_initial_proposer_message,
-        )
+        log_message = "(by reaching negative threshold_negative)"
     elif reason == ProposalResult.CANCELLED_BY_NOT_REACHING_POSITIVE_THRESHOLD:
-        edit_in_voting_channel = PROPOSAL_CANCELLED_VOTING_CHANNEL[reason].format(
-            supporters_number=number_of_voters_for,
-            yes_voting_reaction=EMOJI_VOTING_YES,
-            supporters_list=f" ({list_of_voters_for})" if list_of_voters_for else "",
-            threshold=proposal.threshold_positive,
-            link_to_original_message=link_to_initial_proposer_message,
-        )
-
-    if original_message:
-        await original_message.add_reaction(REACTION_ON_PROPOSAL_CANCELLED)
-    # Reply in the original channel, unless it's not the voting channel itself (then not replying to avoid flooding)
-    if original_message and voting_message.channel.id != original_message.channel.id:
-        message = await original_message.reply(response_to_proposer)
-        # Remove embeds
-        await message.edit(suppress=True)
-    # Edit the proposal in the voting channel; suppress=True will remove embeds
-    await voting_message.edit(content=edit_in_voting_channel, suppress=True)
-    # Add history item for analytics
-    await save_proposal_to_history(db, proposal, reason)
-    # Remove all voting reactions from the voting message, to keep the channel clean
-    await remove_reactions(voting_message, EMOJI_VOTING_YES, EMOJI_VOTING_NO)
+        log_message = "(by not reaching positive threshold)"
     logger.info(
         "Cancelled %s %s. voting_message_id=%d",
-        "grantless proposal" if proposal.not_financial else "proposal with a grant",
+        "grantless proposal" if not_financial else "proposal with a grant",
         log_message,
-        proposal.voting_message_id,
+        voting_message_id,
     )
 
 
@@ -264,26 +331,46 @@ async def on_raw_reaction_add(payload):
         payload (discord.RawReactionActionEvent): The event containing data about the reaction.
     """
 
-    async def remove_reaction(
-        client, payload, reaction_message=None, message_text=None, emoji=None
-    ):
+    def remove_reaction(client, payload, reaction_message=None, message_text=None, emoji=None):
         """
-        Creates DM channel, replies to user with the given message, and removes the given reaction.
+        Queues replying to user with the given message in DM, and removing the given reaction.
         If the message is not given, it will simply remove the reaction. If the emoji parameter is
         missing, removes the reaction added in a given payload object.
         """
-        # Create DM channel (not using send_dm function here, because the 'member' is used to remove the reaction later)
         guild = client.get_guild(payload.guild_id)
-        member = guild.get_member(payload.user_id)
-        dm_channel = await member.create_dm()
+        member = payload.member or guild.get_member(payload.user_id)
+
+        async def reply_in_dm():
+            # Not using send_dm function here, because the 'member' is already retrieved
+            dm_channel = await member.create_dm()
+            await dm_channel.send(message_text)
+
+        async def remove():
+            # Fetch the reaction message if it wasn't provided
+            message = reaction_message
+            if message is None:
+                message = await get_message(client, payload.channel_id, payload.message_id)
+            await message.remove_reaction(emoji if emoji else payload.emoji, member)
+
+        outbound_queue = get_outbound_queue()
         # Reply the user in DM
         if message_text:
-            await dm_channel.send(message_text)
-        # Fetch the reaction message if it wasn't provided
-        if reaction_message is None:
-            reaction_message = await get_message(client, payload.channel_id, payload.message_id)
-        # Remove the reaction
-        await reaction_message.remove_reaction(emoji if emoji else payload.emoji, member)
+            outbound_queue.enqueue("dm", reply_in_dm, f"replying to user_id={payload.user_id} in DM")
+        outbound_queue.enqueue(
+            "reaction",
+            remove,
+            f"removing reaction of user_id={payload.user_id} from message_id={payload.message_id}",
+        )
+
+    def reply_in_dm(message_text):
+        """
+        Queues sending the given message to the user who added the reaction.
+        """
+        get_outbound_queue().enqueue(
+            "dm",
+            lambda: send_dm(payload.guild_id, payload.user_id, message_text),
+            f"replying to user_id={payload.user_id} in DM",
+        )
 
     try:
         logger.debug("Adding a reaction: %s", payload.event_type)
@@ -302,14 +389,22 @@ async def on_raw_reaction_add(payload):
         # Don't allow to vote if recovery is in progress
         if db.is_recovery():
             # Remove the vote emoji, reply to user and exit
-            await remove_reaction(client, payload, voting_message, VOTING_PAUSED_RECOVERY_RESPONSE)
+            remove_reaction(client, payload, voting_message, VOTING_PAUSED_RECOVERY_RESPONSE)
             logger.info(
                 "Rejecting the vote because recovery is in progress.",
             )
             return
 
-        # Acquire the voting lock to avoid concurrency errors (such as new operations of adding or removing votes by the same user)
-        async with proposal_lock:
+        # Retrieve the nickname before locking the proposal, because it may require an API call
+        user_nickname = await get_nickname_by_id_or_mention(payload.user_id)
+        # A vote against may cancel the proposal, so the nicknames saved to history are retrieved
+        # beforehand too
+        history_nicknames = None
+        if payload.emoji.name == EMOJI_VOTING_NO and is_relevant_proposal(payload.message_id):
+            history_nicknames = await get_history_nicknames(get_proposal(payload.message_id))
+
+        # Acquire the lock of the proposal to avoid concurrency errors (such as new operations of adding or removing votes by the same user)
+        async with lock_proposal(payload.message_id):
             # Double check to make sure the proposal wasn't accepted or cancelled while the lock was acquired by other thread
             if not is_relevant_proposal(payload.message_id):
                 logger.info("Proposal became irrelevant while waiting for a lock to add a vote.")
@@ -325,7 +420,7 @@ async def on_raw_reaction_add(payload):
                 # If the vote is the same as before (could be the case with anonymous voting), reply about it and exit
                 if voter.value == Vote.from_emoji(payload.emoji.name):
                     # Remove the vote emoji,
-                    await remove_reaction(
+                    remove_reaction(
                         client,
                         payload,
                         voting_message,
@@ -346,16 +441,13 @@ async def on_raw_reaction_add(payload):
                     return
                 # Otherwise, remove the previous vote and simply proceed to add the new one
                 else:
-                    # For opened voting, remove the previous reactions of the user
+                    # For opened voting, remove the previous reaction of the user (the emoji is
+                    # known from the vote, so the reactions of the message, which may be outdated
+                    # when the message is cached, aren't checked)
                     if proposal.anonymity_type == ProposalVotingAnonymityType.OPENED.value:
-                        # Iterate through message reactions to find the matching one
-                        for reaction in voting_message.reactions:
-                            # Check if the reaction is a voting emoji the user has used
-                            if str(reaction.emoji) == VOTE_EMOJI_MAPPING[voter.value]:
-                                # Remove the reactors previous voting emoji
-                                await remove_reaction(
-                                    client, payload, voting_message, emoji=reaction.emoji
-                                )
+                        remove_reaction(
+                            client, payload, voting_message, emoji=VOTE_EMOJI_MAPPING[voter.value]
+                        )
                     # Remove the previous vote from DB
                     await remove_voter(proposal, voter)
 
@@ -367,7 +459,7 @@ async def on_raw_reaction_add(payload):
                 and int(proposal.author_id) == payload.user_id
             ):
                 # Remove the vote emoji, reply to user and exit
-                await remove_reaction(
+                remove_reaction(
                     client, payload, voting_message, ERROR_MESSAGE_AUTHOR_SUPPORTING_OWN_PROPOSAL
                 )
                 logger.info(
@@ -386,14 +478,14 @@ async def on_raw_reaction_add(payload):
             ):
                 # Remove reaction without sending any message (later the user will be notified that
                 # the vote has been counted)
-                await remove_reaction(client, payload, voting_message)
+                remove_reaction(client, payload, voting_message)
 
             # Add voter to DB and dict
             await add_voter(
                 proposal,
                 Voters(
                     user_id=payload.user_id,
-                    user_nickname=await get_nickname_by_id_or_mention(payload.user_id),
+                    user_nickname=user_nickname,
                     voting_message_id=proposal.voting_message_id,
                     value=Vote.YES.value
                     if payload.emoji.name == EMOJI_VOTING_YES
@@ -409,9 +501,7 @@ async def on_raw_reaction_add(payload):
             )
             # If the vote is positive, tell user the vote has been counted, and exit
             if payload.emoji.name == EMOJI_VOTING_YES:
-                await send_dm(
-                    payload.guild_id,
-                    payload.user_id,
+                reply_in_dm(
                     HELP_MESSAGE_VOTED_FOR.format(
                         author=get_mention_by_id(proposal.author_id),
                         vote_emoji=EMOJI_VOTING_YES,
@@ -428,7 +518,10 @@ async def on_raw_reaction_add(payload):
             if int(proposal.author_id) == payload.member.id:
                 logger.debug("The proposer voted against, cancelling")
                 await cancel_proposal(
-                    proposal, ProposalResult.CANCELLED_BY_PROPOSER, voting_message
+                    proposal,
+                    ProposalResult.CANCELLED_BY_PROPOSER,
+                    voting_message,
+                    history_nicknames,
                 )
                 return
             logger.debug("The dissenter isn't the author of the proposal - OK")
@@ -440,12 +533,11 @@ async def on_raw_reaction_add(payload):
                     proposal,
                     ProposalResult.CANCELLED_BY_REACHING_NEGATIVE_THRESHOLD,
                     voting_message,
+                    history_nicknames,
                 )
             # If not, DM user notifying that his vote was counted
             else:
-                await send_dm(
-                    payload.guild_id,
-                    payload.user_id,
+                reply_in_dm(
                     HELP_MESSAGE_VOTED_AGAINST.format(
                         author=get_mention_by_id(proposal.author_id),
                         countdown=get_discord_countdown_plus_delta(
@@ -476,3 +568,20 @@ async def on_raw_reaction_add(payload):
             payload.user_id,
             exc_info=True,
         )
+
+
+@client.event
+async def on_raw_message_edit(payload):
+    # The cached message would be outdated
+    invalidate_message(payload.message_id)
+
+
+@client.event
+async def on_raw_message_delete(payload):
+    invalidate_message(payload.message_id)
+
+
+@client.event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        invalidate_message(message_id)
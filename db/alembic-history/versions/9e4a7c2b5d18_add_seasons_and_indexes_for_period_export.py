@@ -0,0 +1,56 @@
+"""Add seasons and indexes for period export
+
+Revision ID: 9e4a7c2b5d18
+Revises: c2d8f4a61e93
+Create Date: 2026-10-17 16:41:03.782190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a7c2b5d18'
+down_revision = 'c2d8f4a61e93'
+branch_labels = None
+depends_on = None
+
+# (index name, table, column) - the names are the ones generated by SQLAlchemy for index=True
+INDEXES = [
+    ('ix_proposals_closed_at', 'proposals', 'closed_at'),
+    ('ix_voters_proposal_id', 'voters', 'proposal_id'),
+]
+
+
+def upgrade():
+    # Create the table of free funding seasons (a row is added by admin/reset_free_funding.py)
+    op.create_table(
+        'seasons',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_seasons_started_at', 'seasons', ['started_at'], unique=False)
+    # The current season starts with the history (or now, if the history is empty), so that it can
+    # be exported before the balances are reset for the first time
+    op.execute(
+        """
+        INSERT INTO seasons (started_at)
+        SELECT COALESCE(MIN(submitted_at), CURRENT_TIMESTAMP)
+        FROM (
+            SELECT submitted_at FROM proposals
+            UNION ALL
+            SELECT submitted_at FROM free_funding_transaction_history
+        )
+    """
+    )
+    # Add indexes on the columns used to export the history of a period
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column], unique=False)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
+    op.drop_index('ix_seasons_started_at', table_name='seasons')
+    op.drop_table('seasons')
@@ -0,0 +1,84 @@
+"""Add analytics user stats
+
+Revision ID: c2d8f4a61e93
+Revises: 5b9c3e7f2d41
+Create Date: 2026-10-17 15:02:44.813206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d8f4a61e93'
+down_revision = '5b9c3e7f2d41'
+branch_labels = None
+depends_on = None
+
+# The stats of each user computed from the whole history (the same way as select_user_stats in
+# bot/utils/analytics_utils.py); 0 is the result of accepted proposals, and the unknown amounts of
+# legacy transactions (see 5b9c3e7f2d41) are counted as 0
+FILL_USER_STATS = """
+INSERT INTO analytics_user_stats (
+    user_id, user_nickname, tips_sent, submitted_proposals, accepted_proposals, accepted_amount,
+    votes, tips_received, grants_received
+)
+SELECT user_id, MAX(user_nickname), SUM(tips_sent), SUM(submitted_proposals),
+    SUM(accepted_proposals), SUM(accepted_amount), SUM(votes), SUM(tips_received),
+    SUM(grants_received)
+FROM (
+    SELECT author_id AS user_id, author_nickname AS user_nickname, 1 AS tips_sent,
+        0 AS submitted_proposals, 0 AS accepted_proposals, 0 AS accepted_amount, 0 AS votes,
+        0 AS tips_received, 0 AS grants_received
+    FROM free_funding_transaction_history
+    UNION ALL
+    SELECT user_id, user_nickname, 0, 0, 0, 0, 0, COALESCE(amount, 0), 0
+    FROM free_funding_transaction_recipients
+    UNION ALL
+    SELECT proposals.author_id, proposal_history.author_nickname, 0, 1,
+        CASE WHEN proposal_history.result = 0 THEN 1 ELSE 0 END,
+        CASE WHEN proposal_history.result = 0 AND proposals.not_financial IS NOT 1
+            THEN COALESCE(proposals.total_amount, 0) ELSE 0 END,
+        0, 0, 0
+    FROM proposals JOIN proposal_history ON proposal_history.id = proposals.id
+    UNION ALL
+    SELECT user_id, user_nickname, 0, 0, 0, 0, 1, 0, 0
+    FROM voters
+    UNION ALL
+    SELECT finance_recipient_users.user_id, finance_recipient_users.user_nickname, 0, 0, 0, 0, 0, 0,
+        COALESCE(finance_recipients.amount, 0)
+    FROM finance_recipient_users
+    JOIN finance_recipients ON finance_recipients.id = finance_recipient_users.finance_recipient_id
+    JOIN proposal_history ON proposal_history.id = finance_recipients.proposal_id
+    WHERE proposal_history.result = 0
+)
+WHERE user_id IS NOT NULL
+GROUP BY user_id
+"""
+
+
+def upgrade():
+    # Create the table of precomputed analytics, and fill it from the existing history
+    op.create_table(
+        'analytics_user_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('user_nickname', sa.String(), nullable=True),
+        sa.Column('tips_sent', sa.Integer(), nullable=False),
+        sa.Column('submitted_proposals', sa.Integer(), nullable=False),
+        sa.Column('accepted_proposals', sa.Integer(), nullable=False),
+        sa.Column('accepted_amount', sa.Float(), nullable=False),
+        sa.Column('votes', sa.Integer(), nullable=False),
+        sa.Column('tips_received', sa.Float(), nullable=False),
+        sa.Column('grants_received', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_analytics_user_stats_user_id', 'analytics_user_stats', ['user_id'], unique=True
+    )
+    op.execute(FILL_USER_STATS)
+
+
+def downgrade():
+    op.drop_index('ix_analytics_user_stats_user_id', table_name='analytics_user_stats')
+    op.drop_table('analytics_user_stats')
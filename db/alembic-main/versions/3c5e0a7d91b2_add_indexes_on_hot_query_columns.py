@@ -0,0 +1,40 @@
+"""Add indexes on hot query columns
+
+Revision ID: 3c5e0a7d91b2
+Revises: 75f96f48f35b
+Create Date: 2026-10-17 10:12:31.514207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e0a7d91b2'
+down_revision = '75f96f48f35b'
+branch_labels = None
+depends_on = None
+
+# (index name, table, column) - the names are the ones generated by SQLAlchemy for index=True
+INDEXES = [
+    ('ix_voters_user_id', 'voters', 'user_id'),
+    ('ix_proposals_author_id', 'proposals', 'author_id'),
+    ('ix_finance_recipients_proposal_id', 'finance_recipients', 'proposal_id'),
+    ('ix_free_funding_balance_author_id', 'free_funding_balance', 'author_id'),
+    (
+        'ix_free_funding_transaction_history_submitted_at',
+        'free_funding_transaction_history',
+        'submitted_at',
+    ),
+]
+
+
+def upgrade():
+    # Add indexes on the columns used by the export and analytics queries
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column], unique=False)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,33 @@
+"""Add indexes for period export
+
+Revision ID: 6f1b9e3a27c4
+Revises: e4d09b6f1a82
+Create Date: 2026-10-17 16:40:12.307415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1b9e3a27c4'
+down_revision = 'e4d09b6f1a82'
+branch_labels = None
+depends_on = None
+
+# (index name, table, column) - the names are the ones generated by SQLAlchemy for index=True
+INDEXES = [
+    ('ix_proposals_closed_at', 'proposals', 'closed_at'),
+    ('ix_voters_proposal_id', 'voters', 'proposal_id'),
+]
+
+
+def upgrade():
+    # Add indexes on the columns used to export the history of a period
+    for name, table, column in INDEXES:
+        op.create_index(name, table, [column], unique=False)
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
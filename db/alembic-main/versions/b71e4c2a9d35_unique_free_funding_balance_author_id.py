@@ -0,0 +1,44 @@
+"""Unique free funding balance author_id
+
+Revision ID: b71e4c2a9d35
+Revises: 3c5e0a7d91b2
+Create Date: 2026-10-17 11:02:48.730116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e4c2a9d35'
+down_revision = '3c5e0a7d91b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Remove duplicate balances of a user, keeping the first one (the only one the bot has been
+    # reading, since balances were looked up with filter_by(...).first())
+    op.execute(
+        """
+        DELETE FROM free_funding_balance
+        WHERE id NOT IN (
+            SELECT MIN(id)
+            FROM free_funding_balance
+            GROUP BY author_id
+        )
+    """
+    )
+
+    # Make the index on 'author_id' unique
+    op.drop_index('ix_free_funding_balance_author_id', table_name='free_funding_balance')
+    op.create_index(
+        'ix_free_funding_balance_author_id', 'free_funding_balance', ['author_id'], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_free_funding_balance_author_id', table_name='free_funding_balance')
+    op.create_index(
+        'ix_free_funding_balance_author_id', 'free_funding_balance', ['author_id'], unique=False
+    )
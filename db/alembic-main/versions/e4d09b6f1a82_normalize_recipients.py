@@ -0,0 +1,210 @@
+"""Normalize recipients
+
+Revision ID: e4d09b6f1a82
+Revises: b71e4c2a9d35
+Create Date: 2026-10-17 12:20:14.093571
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d09b6f1a82'
+down_revision = 'b71e4c2a9d35'
+branch_labels = None
+depends_on = None
+
+# Both databases have the same tables, so this migration is the same as
+# db/alembic-history/versions/5b9c3e7f2d41_normalize_recipients.py
+# (like the earlier migrations, each one is self-contained)
+
+# The separators that were used to store lists of recipients in a single column
+IDS_SEPARATOR = ';;'
+FINANCE_RECIPIENTS_NICKNAMES_SEPARATOR = ', '
+FREE_FUNDING_NICKNAMES_SEPARATOR = ';;'
+
+logger = logging.getLogger(__name__)
+
+
+def split_ids(ids):
+    """
+    Returns the stored recipient ids (including the malformed ones) as a list of strings.
+    """
+    return [id.strip() for id in (ids or '').split(IDS_SEPARATOR) if id.strip()]
+
+
+def split_recipients(row, ids, nicknames, nicknames_separator):
+    """
+    Returns (user_id, user_nickname) pairs of the stored lists of the row (described in the logs).
+    Malformed ids are logged and skipped. Nicknames that contain the separator can't be split
+    reliably, so in this case they're logged and left empty.
+    """
+    ids = split_ids(ids)
+    if not ids:
+        if nicknames:
+            logger.warning("%s has no recipient ids, skipping its recipients: %r", row, nicknames)
+        return []
+    nicknames = nicknames.split(nicknames_separator) if nicknames is not None else []
+    if len(nicknames) != len(ids):
+        if nicknames:
+            logger.warning(
+                "%s has %d nickname(s) for %d recipient id(s), leaving the nicknames empty",
+                row,
+                len(nicknames),
+                len(ids),
+            )
+        nicknames = [None] * len(ids)
+    recipients = []
+    for id, nickname in zip(ids, nicknames):
+        try:
+            recipients.append((int(id), nickname))
+        except ValueError:
+            logger.warning("%s has a malformed recipient id, skipping it: %r", row, id)
+    return recipients
+
+
+def upgrade():
+    # Create tables with a row for each recipient
+    finance_recipient_users = op.create_table(
+        'finance_recipient_users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('finance_recipient_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('user_nickname', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['finance_recipient_id'], ['finance_recipients.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_finance_recipient_users_finance_recipient_id',
+        'finance_recipient_users',
+        ['finance_recipient_id'],
+    )
+    op.create_index('ix_finance_recipient_users_user_id', 'finance_recipient_users', ['user_id'])
+    free_funding_recipients = op.create_table(
+        'free_funding_transaction_recipients',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('user_nickname', sa.String(), nullable=True),
+        sa.Column('amount', sa.Float(), nullable=True),
+        sa.CheckConstraint('amount > -1000000000 AND amount < 1000000000'),
+        sa.ForeignKeyConstraint(['transaction_id'], ['free_funding_transaction_history.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_free_funding_transaction_recipients_transaction_id',
+        'free_funding_transaction_recipients',
+        ['transaction_id'],
+    )
+    op.create_index(
+        'ix_free_funding_transaction_recipients_user_id',
+        'free_funding_transaction_recipients',
+        ['user_id'],
+    )
+
+    # Copy the recipients stored as separated strings into the new tables
+    connection = op.get_bind()
+    rows = []
+    for id, recipient_ids, recipient_nicknames in connection.execute(
+        sa.text('SELECT id, recipient_ids, recipient_nicknames FROM finance_recipients')
+    ):
+        for user_id, user_nickname in split_recipients(
+            f'finance_recipients.id={id}',
+            recipient_ids,
+            recipient_nicknames,
+            FINANCE_RECIPIENTS_NICKNAMES_SEPARATOR,
+        ):
+            rows.append(
+                {'finance_recipient_id': id, 'user_id': user_id, 'user_nickname': user_nickname}
+            )
+    if rows:
+        op.bulk_insert(finance_recipient_users, rows)
+
+    rows = []
+    for id, recipient_ids, recipient_nicknames, total_amount in connection.execute(
+        sa.text(
+            'SELECT id, recipient_ids, recipient_nicknames, total_amount '
+            'FROM free_funding_transaction_history'
+        )
+    ):
+        recipients = split_recipients(
+            f'free_funding_transaction_history.id={id}',
+            recipient_ids,
+            recipient_nicknames,
+            FREE_FUNDING_NICKNAMES_SEPARATOR,
+        )
+        if not recipients:
+            continue
+        # The total amount was split equally between all the stored recipients, including the ones
+        # whose ids are malformed and skipped (unless it's missing)
+        amount = None if total_amount is None else total_amount / len(split_ids(recipient_ids))
+        for user_id, user_nickname in recipients:
+            rows.append(
+                {
+                    'transaction_id': id,
+                    'user_id': user_id,
+                    'user_nickname': user_nickname,
+                    'amount': amount,
+                }
+            )
+    if rows:
+        op.bulk_insert(free_funding_recipients, rows)
+
+    # Drop the separated strings columns (batch mode is needed for SQLite)
+    with op.batch_alter_table('finance_recipients') as batch_op:
+        batch_op.drop_column('recipient_ids')
+        batch_op.drop_column('recipient_nicknames')
+    with op.batch_alter_table('free_funding_transaction_history') as batch_op:
+        batch_op.drop_column('recipient_ids')
+        batch_op.drop_column('recipient_nicknames')
+
+
+def downgrade():
+    # Restore the separated strings columns
+    with op.batch_alter_table('finance_recipients') as batch_op:
+        batch_op.add_column(sa.Column('recipient_ids', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('recipient_nicknames', sa.String(), nullable=True))
+    with op.batch_alter_table('free_funding_transaction_history') as batch_op:
+        batch_op.add_column(sa.Column('recipient_ids', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('recipient_nicknames', sa.String(), nullable=True))
+
+    # Copy the recipients back (group_concat skips NULLs, so empty nicknames are kept as empty
+    # strings to keep the nicknames aligned with the ids)
+    op.execute(
+        f"""
+        UPDATE finance_recipients
+        SET recipient_ids = (
+            SELECT group_concat(user_id, '{IDS_SEPARATOR}')
+            FROM finance_recipient_users
+            WHERE finance_recipient_users.finance_recipient_id = finance_recipients.id
+        ),
+        recipient_nicknames = (
+            SELECT group_concat(
+                COALESCE(user_nickname, ''), '{FINANCE_RECIPIENTS_NICKNAMES_SEPARATOR}'
+            )
+            FROM finance_recipient_users
+            WHERE finance_recipient_users.finance_recipient_id = finance_recipients.id
+        )
+    """
+    )
+    op.execute(
+        f"""
+        UPDATE free_funding_transaction_history
+        SET recipient_ids = (
+            SELECT group_concat(user_id, '{IDS_SEPARATOR}')
+            FROM free_funding_transaction_recipients
+            WHERE free_funding_transaction_recipients.transaction_id = free_funding_transaction_history.id
+        ),
+        recipient_nicknames = (
+            SELECT group_concat(COALESCE(user_nickname, ''), '{FREE_FUNDING_NICKNAMES_SEPARATOR}')
+            FROM free_funding_transaction_recipients
+            WHERE free_funding_transaction_recipients.transaction_id = free_funding_transaction_history.id
+        )
+    """
+    )
+
+    op.drop_table('free_funding_transaction_recipients')
+    op.drop_table('finance_recipient_users')
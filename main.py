@@ -6,9 +6,11 @@ from bot.config.logging_config import log_handler, console_handler, DEFAULT_LOG_
 from bot.recovery import start_proposals_coroutines
 from bot.utils.db_utils import DBUtil
 from bot.utils.discord_utils import get_discord_client
+from bot.utils.outbound_queue import get_outbound_queue
 from bot.utils.proposal_utils import (
     add_proposal,
     get_proposals_count,
+    check_voters_index,
 )
 
 # imports below are needed to make discord client aware of decorated methods
@@ -20,7 +22,7 @@ from bot.propose import (
 from bot.transact import free_funding_transact_command
 from bot.vote import cancel_proposal, on_raw_reaction_add
 from bot.help import help
-from bot.export import export_command
+from bot.export import export_command, shutdown_export_executor
 
 logger = logging.getLogger(__name__)
 logger.setLevel(DEFAULT_LOG_LEVEL)
@@ -43,6 +45,8 @@ def main():
         db.connect_db()
         # Create required tables that don't exist
         db.create_all_tables()
+        # Keep the free funding balances in memory, so that checking them doesn't query DB
+        db.load_free_funding_balances()
         # Create bot client
         client = get_discord_client()
 
@@ -53,11 +57,27 @@ def main():
             # Voters will also be restored (thanks to a bidirectional relationship with voters)
             add_proposal(proposal)
         logger.info("Loaded %d pending grant proposal(s) from database", get_proposals_count())
+        # Make sure the in-memory index of voters matches the loaded data
+        for error in check_voters_index():
+            logger.warning("Voters index is inconsistent: %s", error)
 
         # Enabling setup hook to start proposal approving coroutines after the client will be initialised.
         # client.run call is required before approve_grant_proposal, because it starts Discord event loop.
         client.setup_hook = lambda: setup_hook(client, pending_grant_proposals)
 
+        # When the bot shuts down, send the queued Discord side effects of voting while the client is
+        # still connected, commit the votes that are pending in write-behind mode, and stop the
+        # export process
+        close_client = client.close
+
+        async def close():
+            await get_outbound_queue().close()
+            await db.flush()
+            shutdown_export_executor()
+            await close_client()
+
+        client.close = close
+
         # Read token from the file and start the bot
         with open("token", "r") as f:
             token = f.read().strip()
@@ -107,7 +107,15 @@ if [ $CONSENSUS_BACKUP_ENABLED -eq 1 ]; then
   else
     echo "Google Cloud SDK is already installed."
   fi
-  
+
+  # Install sqlite3 (the backup scripts use it to snapshot the databases in WAL mode)
+  if ! which sqlite3 &> /dev/null; then
+    echo "Installing sqlite3..."
+    sudo apt-get install sqlite3
+  else
+    echo "sqlite3 is already installed."
+  fi
+
   # Initiate gcloud authentication (you'll need another machine that has a web browser)
   if [[ -n $(gcloud auth application-default print-access-token 2>/dev/null) ]]; then
     echo "Google Cloud authorization has already been made."